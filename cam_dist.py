@@ -19,6 +19,14 @@ FPS = 30 # RealSenseとVideoWriterのFPSを合わせる
 config.enable_stream(rs.stream.depth, WIDTH, HEIGHT, rs.format.z16, FPS)
 config.enable_stream(rs.stream.color, WIDTH, HEIGHT, rs.format.bgr8, FPS)
 
+# True: 深度・カラーを .bag ファイルにも録画する (depth_wall_replay.py や
+# robot_vision_thread_headless.WALL_DEPTH_BAG_PATH で再生して壁検出を試せる)
+# .bag は大きくなるので、録画したいときだけ True にする
+RECORD_BAG = False
+BAG_FILENAME = 'output.bag'
+if RECORD_BAG:
+    config.enable_record_to_file(BAG_FILENAME)
+
 # (重要) 深度とカラーの位置合わせ（アライメント）設定
 align_to = rs.stream.color
 align = rs.align(align_to)
@@ -0,0 +1,164 @@
+# ファイル名: coarse_to_fine.py
+# (robot_vision_thread_headless.py と同じフォルダに保存してください)
+#
+# 粗い解像度 (RESIZE_WIDTH, 例: 240px) で見つけた斜め線を、
+# 高い解像度 (FINE_WIDTH, 例: 640px) の「線の周りの細い帯」だけで精密化するモジュール。
+#   1. 同じ縁の線分を1本にまとめ、その周りの帯を小矩形に区切る (line_tracker.segment_band_chunks)
+#   2. 元フレームから小矩形だけを切り出して高解像度に合わせ、Canny でエッジ点を求める
+#   3. 帯の中のエッジ点に cv2.fitLine で直線を当てはめ直す
+#   4. 精密化した線の交点から消失点を求め、粗い解像度の座標 (小数) に戻して返す
+# 全画面を 640px で処理するのに比べ、帯の面積分の処理で 640px 相当の精度が得られる。
+
+import cv2
+import numpy as np
+from line_detectors import estimate_vanishing_point
+from line_tracker import segment_band_chunks
+
+# 当てはめに必要な最小のエッジ点数 (これ未満なら粗い線をそのまま使う)
+MIN_FIT_POINTS = 12
+# 帯を区切る長さ (高解像度のピクセル)
+FINE_CHUNK_LENGTH = 32
+# 同じ縁とみなして1本にまとめる線分の条件 (粗い解像度のピクセル / 度)
+MERGE_DISTANCE_PX = 2.0
+MERGE_ANGLE_DEG = 3.0
+
+
+def merge_collinear_segments(segments):
+    """
+    ほぼ同一直線上にある線分 (HoughLinesP は1本の縁を何本にも分けて返す) を
+    長い順に1本へまとめ、両端を包む線分のリストにして返す。
+    """
+    if len(segments) == 0:
+        return segments
+    lengths = np.hypot(segments[:, 2] - segments[:, 0], segments[:, 3] - segments[:, 1])
+    merged = []
+    for segment in segments[np.argsort(-lengths)]:
+        xa, ya, xb, yb = segment
+        angle = np.degrees(np.arctan2(yb - ya, xb - xa)) % 180
+        for group in merged:
+            gxa, gya, gxb, gyb = group['line']
+            normal = np.array([-(gyb - gya), gxb - gxa]) / max(np.hypot(gxb - gxa, gyb - gya), 1e-6)
+            distance = max(abs((xa - gxa) * normal[0] + (ya - gya) * normal[1]),
+                           abs((xb - gxa) * normal[0] + (yb - gya) * normal[1]))
+            angle_diff = abs(angle - group['angle'])
+            if distance <= MERGE_DISTANCE_PX and min(angle_diff, 180 - angle_diff) <= MERGE_ANGLE_DEG:
+                group['points'].extend([(xa, ya), (xb, yb)])
+                break
+        else:
+            merged.append({'line': segment, 'angle': angle, 'points': [(xa, ya), (xb, yb)]})
+
+    result = []
+    for group in merged:
+        gxa, gya, gxb, gyb = group['line']
+        direction = np.array([gxb - gxa, gyb - gya]) / max(np.hypot(gxb - gxa, gyb - gya), 1e-6)
+        points = np.array(group['points'])
+        t = (points[:, 0] - gxa) * direction[0] + (points[:, 1] - gya) * direction[1]
+        start = np.array([gxa, gya]) + direction * t.min()
+        end = np.array([gxa, gya]) + direction * t.max()
+        result.append((start[0], start[1], end[0], end[1]))
+    return np.array(result, dtype=np.float32)
+
+
+class CoarseToFineRefiner:
+    """粗い解像度の線分を高解像度の帯の中で当てはめ直す。"""
+
+    def __init__(self, fine_width=640, strip_half_width=4,
+                 canny_threshold1=100, canny_threshold2=150):
+        self.fine_width = fine_width
+        self.strip_half_width = strip_half_width # 帯の半幅 (高解像度のピクセル)
+        self.canny_threshold1 = canny_threshold1
+        self.canny_threshold2 = canny_threshold2
+        self.last_pixel_ratio = 0.0 # 直近フレームで処理した画素の割合 (高解像度の全画面=1.0)
+
+    def fine_edges(self, frame, rect, orig_scale):
+        """高解像度の座標系の矩形 rect に対応する部分だけを元フレームから切り出してエッジを求める。"""
+        x0, y0, x1, y1 = rect
+        ox0, oy0 = int(x0 * orig_scale), int(y0 * orig_scale)
+        ox1, oy1 = max(ox0 + 1, int(np.ceil(x1 * orig_scale))), max(oy0 + 1, int(np.ceil(y1 * orig_scale)))
+        crop = frame[oy0:oy1, ox0:ox1]
+        if crop.shape[1] != x1 - x0 or crop.shape[0] != y1 - y0:
+            crop = cv2.resize(crop, (x1 - x0, y1 - y0), interpolation=cv2.INTER_AREA)
+        if crop.ndim == 3:
+            crop = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+        crop = cv2.GaussianBlur(crop, (5, 5), 0)
+        return cv2.Canny(crop, self.canny_threshold1, self.canny_threshold2)
+
+    def refine_segment(self, frame, segment, fine_scale, orig_scale, fine_width, fine_height):
+        """粗い線分1本を精密化し、高解像度の座標系での (傾き, 切片) を返す。失敗したら None。"""
+        xa, ya, xb, yb = (float(v) * fine_scale for v in segment)
+        chunks = segment_band_chunks(xa, ya, xb, yb, self.strip_half_width, fine_width, fine_height,
+                                     chunk_length=FINE_CHUNK_LENGTH)
+        # 線 (xa, ya)-(xb, yb) の単位法線 (帯の中にあるかの判定に使う)
+        normal = np.array([-(yb - ya), xb - xa])
+        normal /= max(np.hypot(*normal), 1e-6)
+
+        points = []
+        for rect in chunks:
+            edges = self.fine_edges(frame, rect, orig_scale)
+            ys, xs = np.nonzero(edges)
+            if len(xs) == 0:
+                continue
+            pts = np.column_stack((xs + rect[0], ys + rect[1])).astype(np.float32)
+            distance = np.abs((pts[:, 0] - xa) * normal[0] + (pts[:, 1] - ya) * normal[1])
+            points.append(pts[distance <= self.strip_half_width])
+            self.last_pixel_ratio += (rect[2] - rect[0]) * (rect[3] - rect[1]) / float(fine_width * fine_height)
+
+        if not points:
+            return None
+        points = np.concatenate(points)
+        if len(points) < MIN_FIT_POINTS:
+            return None
+        vx, vy, x0, y0 = cv2.fitLine(points, cv2.DIST_HUBER, 0, 0.01, 0.01).ravel()
+        if abs(vx) < 1e-6:
+            return None
+        m = vy / vx
+        return m, y0 - m * x0
+
+    def refine(self, frame, diagonal_segments, coarse_width):
+        """
+        粗い斜め線 (coarse_width の座標系) を精密化して消失点を求める。
+        戻り値: (vp_x, vp_y) を粗い解像度の座標 (小数) で。求まらなければ None。
+        """
+        self.last_pixel_ratio = 0.0
+        orig_height, orig_width = frame.shape[:2]
+        fine_width = min(self.fine_width, orig_width)
+        fine_height = int(round(orig_height * fine_width / orig_width))
+        fine_scale = fine_width / float(coarse_width)
+        orig_scale = orig_width / float(fine_width)
+
+        slopes, intercepts = [], []
+        for segment in merge_collinear_segments(diagonal_segments):
+            refined = self.refine_segment(frame, segment, fine_scale, orig_scale, fine_width, fine_height)
+            if refined is None:
+                # 精密化できない線は粗い線を高解像度の座標に直して使う
+                xa, ya, xb, yb = (float(v) * fine_scale for v in segment)
+                m = (yb - ya) / (xb - xa)
+                refined = (m, ya - m * xa)
+            slopes.append(refined[0])
+            intercepts.append(refined[1])
+
+        vanishing_point = estimate_fine_vanishing_point(np.array(slopes), np.array(intercepts),
+                                                        fine_width, fine_height)
+        if vanishing_point is None:
+            return None
+        return vanishing_point[0] / fine_scale, vanishing_point[1] / fine_scale
+
+
+def estimate_fine_vanishing_point(slopes, intercepts, width, height):
+    """
+    交点の中央値を初期値とし、そこから遠い線 (外れ値) を除いた残りの線までの
+    距離の二乗和が最小になる点を消失点として返す (小数精度)。
+    """
+    coarse = estimate_vanishing_point(slopes, intercepts, width, height)
+    if coarse is None:
+        return None
+    # 全直線までの距離の二乗和が最小になる点 (線の式 m*x - y + c = 0) を最小二乗で求める
+    norms = np.sqrt(slopes ** 2 + 1)
+    a = np.column_stack((slopes / norms, -1 / norms))
+    b = -intercepts / norms
+    residual = np.abs(a @ np.array(coarse, dtype=np.float64) - b)
+    inliers = residual <= max(3.0, np.median(residual) * 3)
+    if np.count_nonzero(inliers) < 2:
+        return float(coarse[0]), float(coarse[1])
+    solution, _, _, _ = np.linalg.lstsq(a[inliers], b[inliers], rcond=None)
+    return float(solution[0]), float(solution[1])
@@ -0,0 +1,97 @@
+# ファイル名: cpu_policy.py
+# (main_control_thread_serial.py と同じフォルダに保存してください)
+#
+# OpenCV の内部スレッド数と、役割 (検出器・カメラ読み込み・制御) ごとの CPU の割り当ての設定。
+# 検出スレッドが3つあり、それぞれが呼ぶ resize / CLAHE / GaussianBlur / Canny は OpenCV の内部で
+# コア数ぶんのスレッドを使うことがあるため、4コアのラズパイでは十数本のスレッドがコアを取り合う。
+#   - OpenCV のスレッド数 (cv2.setNumThreads はプロセス全体の設定)
+#       'DEFAULT': OpenCV の既定 (コア数)
+#       'SINGLE' : 1 (並列化は検出スレッドどうしに任せる)
+#       'SPLIT'  : コア数 / 検出器の数 (各検出器が自分の分だけ使う)
+#       整数     : その数
+#   - affinity: {役割: CPU 番号の集合} (os.sched_setaffinity で、その役割のスレッドだけを割り当てる)
+#       役割は 'steering' / 'wall' / 'gravity' / 'capture' / 'control'
+#
+#   policy = CpuPolicy('SINGLE', affinity={'control': {0}, 'capture': {0}, 'steering': {1}, 'wall': {2}, 'gravity': {3}})
+#   threading.Thread(target=policy.run, args=('steering', steering_thread_func, source, state))
+
+import os
+import cv2
+
+OPENCV_THREAD_POLICIES = ('DEFAULT', 'SINGLE', 'SPLIT')
+ROLES = ('steering', 'wall', 'gravity', 'capture', 'control')
+
+
+def available_cpus():
+    """このプロセスが使える CPU 番号の集合 (sched_getaffinity が無い環境では None)。"""
+    if not hasattr(os, 'sched_getaffinity'):
+        return None
+    return os.sched_getaffinity(0)
+
+
+class CpuPolicy:
+    """
+    opencv_threads: OpenCV のスレッド数の方針 (OPENCV_THREAD_POLICIES のどれか、または整数)
+    affinity: {役割: CPU 番号の集合}。None または載っていない役割は割り当てない
+    num_detectors: 'SPLIT' で割る検出器の数
+    プロセスをまたいで渡せる (detector_process で別プロセスの検出器にも使える)。
+    """
+
+    def __init__(self, opencv_threads='DEFAULT', affinity=None, num_detectors=3):
+        if not isinstance(opencv_threads, int) and opencv_threads not in OPENCV_THREAD_POLICIES:
+            raise ValueError(f"不明な OpenCV のスレッド数の方針です: {opencv_threads}")
+        if affinity is not None:
+            unknown = set(affinity) - set(ROLES)
+            if unknown:
+                raise ValueError(f"不明な役割です: {sorted(unknown)}")
+        self.opencv_threads = opencv_threads
+        self.affinity = affinity
+        self.num_detectors = num_detectors
+
+    def opencv_thread_count(self):
+        """cv2.setNumThreads に渡す数 (-1 は OpenCV の既定)。"""
+        if self.opencv_threads == 'DEFAULT':
+            return -1
+        if self.opencv_threads == 'SINGLE':
+            return 1
+        if self.opencv_threads == 'SPLIT':
+            return max(1, cv2.getNumberOfCPUs() // self.num_detectors)
+        return self.opencv_threads
+
+    def apply_process(self):
+        """OpenCV のスレッド数を設定する (プロセスごとに1回)。"""
+        cv2.setNumThreads(self.opencv_thread_count())
+
+    def apply_thread(self, role):
+        """
+        呼び出したスレッドを role の CPU に割り当てる (Linux では pid 0 = 呼び出したスレッド)。
+        割り当てた CPU の集合を返す (割り当てなかったときは None)。
+        """
+        if not self.affinity or role not in self.affinity:
+            return None
+        cpus = available_cpus()
+        if cpus is None:
+            print(f"[CPU設定]: この環境では CPU の割り当てができません ({role})。")
+            return None
+        wanted = set(self.affinity[role]) & cpus
+        if not wanted:
+            print(f"[CPU設定]: {role} の CPU {sorted(self.affinity[role])} は使えません。割り当てません。")
+            return None
+        os.sched_setaffinity(0, wanted)
+        return wanted
+
+    def run(self, role, func, *args):
+        """スレッド・プロセスの入口: 設定を適用してから func(*args) を実行する。"""
+        self.apply_process()
+        self.apply_thread(role)
+        return func(*args)
+
+    def thread_initializer(self, role):
+        """SharedCapture などの reader_init に渡す関数を作る。"""
+        return lambda: self.apply_thread(role)
+
+    def describe(self):
+        affinity_text = "なし"
+        if self.affinity:
+            affinity_text = ", ".join(f"{role}:{sorted(cpus)}" for role, cpus in self.affinity.items())
+        return f"OpenCV スレッド数 {self.opencv_threads} ({self.opencv_thread_count()}), CPU 割り当て {affinity_text}"
@@ -0,0 +1,122 @@
+# ファイル名: cpu_policy_benchmark.py
+# OpenCV の内部スレッド数と CPU の割り当て (cpu_policy.py) の方針ごとの比較用スクリプト
+#
+# 録画した動画を繰り返し再生してカメラの代わりにし、操舵・壁・重心の3つの検出スレッドを
+# 間引かずに (できるだけ速く) 動かして、方針ごとに
+#   - 1秒あたりの結果数 (検出器ごとと合計)
+#   - 遅れ: フレームを処理し始めてから、メインループが結果を受け取るまでの時間 (操舵・重心の平均と p95)
+# を表示する。main_control_thread_serial.CPU_OPENCV_THREADS / CPU_AFFINITY を決めるのに使う。
+#
+# 使い方: python cpu_policy_benchmark.py <操舵・重心用の動画> [<壁検出用の動画>]
+
+import os
+import sys
+import threading
+import time
+
+from robot_vision_thread_headless import steering_thread_func, wall_thread_func, gravity_thread_func
+from shared_capture import SharedCapture
+from vision_state import VisionState
+from cpu_policy import CpuPolicy, available_cpus
+
+# 計測の前に動かしておく時間と計測する時間 (秒)
+WARMUP_SEC = 3.0
+MEASURE_SEC = 10.0
+# 間引きを無くすための処理レート (FPS)
+BENCHMARK_FPS = 1000
+
+# 4コアのラズパイでの割り当ての例 (使えない CPU は割り当てずに続ける)
+PI_AFFINITY = {'control': {0}, 'capture': {0}, 'steering': {1}, 'wall': {2}, 'gravity': {3}}
+
+# 比較する方針: (表示名, OpenCV のスレッド数, CPU の割り当て)
+POLICIES = [
+    ('既定', 'DEFAULT', None),
+    ('1スレッド', 'SINGLE', None),
+    ('分割', 'SPLIT', None),
+    ('1スレッド+割当', 'SINGLE', PI_AFFINITY),
+    ('分割+割当', 'SPLIT', PI_AFFINITY),
+]
+
+DETECTORS = [('操舵', 'steering'), ('壁', 'wall'), ('重心', 'gravity')]
+
+
+def percentile_ms(samples, q):
+    if not samples:
+        return float('nan')
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * q))] * 1000
+
+
+def run(policy, video_path, wall_video_path):
+    """1つの方針で3つの検出スレッドを動かし、(1秒あたりの結果数, 遅れのサンプル) を返す。"""
+    policy.apply_process()
+    state = VisionState()
+    state.steering_target_fps = BENCHMARK_FPS
+    state.wall_target_fps = BENCHMARK_FPS
+    camera = SharedCapture(video_path, loop=True, reader_init=policy.thread_initializer('capture'))
+    wall_camera = SharedCapture(wall_video_path, loop=True, reader_init=policy.thread_initializer('capture'))
+    workers = [threading.Thread(target=policy.run, args=('steering', steering_thread_func, camera.consumer(), state)),
+               threading.Thread(target=policy.run, args=('wall', wall_thread_func, wall_camera.consumer(), state)),
+               threading.Thread(target=policy.run, args=('gravity', gravity_thread_func, camera.consumer(), state))]
+    for worker in workers:
+        worker.start()
+    main_cpus = available_cpus()
+    policy.apply_thread('control')
+
+    time.sleep(WARMUP_SEC)
+    start_versions = {name: getattr(state, name).version for _, name in DETECTORS}
+    latencies = {'steering': [], 'gravity': []}
+    last_frame_ids = {'steering': 0, 'gravity': 0}
+    start_time = time.time()
+    update_seq = 0
+    # メインループと同じように、結果が書き込まれるたびに起きて遅れを測る
+    while time.time() - start_time < MEASURE_SEC:
+        update_seq = state.wait_for_update(update_seq, 0.1)
+        now = time.time()
+        steering, _, gravity = state.snapshot()
+        for name, result in (('steering', steering.result), ('gravity', gravity.result)):
+            if result is not None and result['frame_id'] != last_frame_ids[name]:
+                last_frame_ids[name] = result['frame_id']
+                latencies[name].append(now - float(result['timestamp']))
+    end_versions = {name: getattr(state, name).version for _, name in DETECTORS}
+    elapsed = time.time() - start_time
+
+    state.request_stop()
+    for worker in workers:
+        worker.join()
+    camera.close()
+    wall_camera.close()
+    if main_cpus is not None:
+        os.sched_setaffinity(0, main_cpus) # 次の方針のスレッドに割り当てを引き継がない
+    rates = {name: (end_versions[name] - start_versions[name]) / elapsed for _, name in DETECTORS}
+    return rates, latencies
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("使い方: python cpu_policy_benchmark.py <操舵・重心用の動画> [<壁検出用の動画>]")
+        return
+    video_path = sys.argv[1]
+    wall_video_path = sys.argv[2] if len(sys.argv) > 2 else video_path
+
+    results = []
+    for label, opencv_threads, affinity in POLICIES:
+        policy = CpuPolicy(opencv_threads, affinity=affinity)
+        print(f"\n=== {label}: {policy.describe()} ({WARMUP_SEC:.0f} + {MEASURE_SEC:.0f} 秒) ===")
+        results.append((label, *run(policy, video_path, wall_video_path)))
+
+    print(f"\n=== 方針ごとの比較 (CPU コア数: {os.cpu_count()}) ===")
+    print(f"{'方針':<14}" + "".join(f"{label + '/秒':>10}" for label, _ in DETECTORS) + f"{'合計/秒':>10}"
+          + f"{'操舵遅れ平均':>14}{'p95':>9}{'重心遅れ平均':>14}{'p95':>9} (ms)")
+    for label, rates, latencies in results:
+        line = f"{label:<14}" + "".join(f"{rates[name]:>10.1f}" for _, name in DETECTORS)
+        line += f"{sum(rates.values()):>10.1f}"
+        for name in ('steering', 'gravity'):
+            samples = latencies[name]
+            mean_ms = sum(samples) / len(samples) * 1000 if samples else float('nan')
+            line += f"{mean_ms:>14.1f}{percentile_ms(samples, 0.95):>9.1f}"
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+# ファイル名: depth_wall_fusion.py
+# (robot_vision_thread_headless.py と同じフォルダに保存してください)
+#
+# RealSense の深度で壁までの距離を見て、線分検出 (Hough) を省略するためのモジュール。
+#   - 右/左の ROI の中の有効な深度 (0 以外) の下位パーセンタイルを、その側の壁までの距離とする
+#   - 距離が near_m 未満なら「壁あり」、far_m より遠ければ「壁なし」と深度だけで決める
+#   - その間にある、または有効な画素が少ない (反射・近すぎなど) ときだけ「あいまい」とし、
+#     従来どおり 360度カメラの画像で線分検出を行う
+# ライブのカメラの代わりに、録画した .bag ファイルを再生して使うこともできる (cam_dist.py で録画)。
+# pyrealsense2 が無い環境では DepthWallSource を作れない (壁検出は画像だけで行う)。
+
+import numpy as np
+
+try:
+    import pyrealsense2 as rs
+except ImportError:
+    rs = None
+
+# 深度による判定結果
+DEPTH_NEAR = 'NEAR' # 壁あり (線分検出は不要)
+DEPTH_FAR = 'FAR' # 壁なし (線分検出は不要)
+DEPTH_AMBIGUOUS = 'AMBIGUOUS' # 深度では決められない (線分検出で確認する)
+
+
+class DepthWallSource:
+    """
+    RealSense (または .bag ファイル) から深度画像 (メートル単位の float32) を読む。
+    read() はブロックせず、新しいフレームが無ければ直前の深度画像を返す。
+    """
+
+    def __init__(self, bag_path=None, width=640, height=480, fps=30, real_time=True):
+        if rs is None:
+            raise RuntimeError("pyrealsense2 がインストールされていません")
+        self.pipeline = rs.pipeline()
+        config = rs.config()
+        if bag_path is not None:
+            config.enable_device_from_file(bag_path, repeat_playback=False)
+        config.enable_stream(rs.stream.depth, width, height, rs.format.z16, fps)
+        profile = self.pipeline.start(config)
+        device = profile.get_device()
+        if bag_path is not None:
+            # False なら録画時の時間を待たずにできるだけ速く再生する (評価用)
+            device.as_playback().set_real_time(real_time)
+        self.depth_scale = device.first_depth_sensor().get_depth_scale()
+        self.last_depth = None
+
+    def read(self, wait=False):
+        """最新の深度画像 (メートル, 無効な画素は 0) を返す。まだ1枚も無ければ None。"""
+        frames = self.pipeline.wait_for_frames() if wait else self.pipeline.poll_for_frames()
+        if frames:
+            depth_frame = frames.get_depth_frame()
+            if depth_frame:
+                self.last_depth = np.asanyarray(depth_frame.get_data()).astype(np.float32) * self.depth_scale
+        return self.last_depth
+
+    def close(self):
+        self.pipeline.stop()
+
+
+def roi_distance(depth_m, roi, percentile=10.0):
+    """
+    ROI (幅・高さに対する割合の (x0, y0, x1, y1)) の中の有効な深度の下位パーセンタイルと、
+    有効な画素の割合を返す。有効な画素が無ければ距離は None。
+    """
+    height, width = depth_m.shape[:2]
+    x0, y0, x1, y1 = roi
+    region = depth_m[int(height * y0):int(height * y1), int(width * x0):int(width * x1)]
+    valid = region[region > 0]
+    valid_ratio = valid.size / float(max(region.size, 1))
+    if valid.size == 0:
+        return None, valid_ratio
+    return float(np.percentile(valid, percentile)), valid_ratio
+
+
+class DepthWallCheck:
+    """
+    深度画像から右/左それぞれの壁の有無を判定する。
+    rois: 側 (0=右, 1=左) ごとの ROI (深度画像の幅・高さに対する割合)
+    near_m / far_m: これより近ければ壁あり / 遠ければ壁なし (メートル)
+    min_valid_ratio: ROI の中の有効な画素がこれより少なければ「あいまい」
+    """
+
+    def __init__(self, rois=((0.55, 0.3, 0.95, 0.7), (0.05, 0.3, 0.45, 0.7)),
+                 near_m=0.30, far_m=0.60, min_valid_ratio=0.3, percentile=10.0):
+        self.rois = rois
+        self.near_m = near_m
+        self.far_m = far_m
+        self.min_valid_ratio = min_valid_ratio
+        self.percentile = percentile
+        self.last_distances = [None] * len(rois) # 直近の各側の距離 (表示・記録用)
+
+    def classify(self, depth_m):
+        """側ごとに DEPTH_NEAR / DEPTH_FAR / DEPTH_AMBIGUOUS のリストを返す。"""
+        decisions = []
+        for i, roi in enumerate(self.rois):
+            if depth_m is None:
+                self.last_distances[i] = None
+                decisions.append(DEPTH_AMBIGUOUS)
+                continue
+            distance, valid_ratio = roi_distance(depth_m, roi, self.percentile)
+            self.last_distances[i] = distance
+            if distance is None or valid_ratio < self.min_valid_ratio:
+                decisions.append(DEPTH_AMBIGUOUS)
+            elif distance < self.near_m:
+                decisions.append(DEPTH_NEAR)
+            elif distance > self.far_m:
+                decisions.append(DEPTH_FAR)
+            else:
+                decisions.append(DEPTH_AMBIGUOUS)
+        return decisions
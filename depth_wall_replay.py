@@ -0,0 +1,69 @@
+# ファイル名: depth_wall_replay.py
+# 録画した RealSense の .bag ファイルを再生し、depth_wall_fusion.DepthWallCheck の判定を集計するスクリプト
+#
+# 各フレームについて右/左の ROI までの距離と判定 (NEAR / FAR / AMBIGUOUS) を求め、
+#   - 深度だけで決まった割合 (線分検出を省略できる割合)
+#   - 壁あり (NEAR) と判定したフレーム数
+# を表示する。robot_vision_thread_headless.WALL_DEPTH_NEAR_M / WALL_DEPTH_FAR_M を決めるのに使う。
+# (.bag ファイルは cam_dist.py の RECORD_BAG = True で録画できる)
+#
+# 使い方: python depth_wall_replay.py <bagファイル> [-v]
+
+import sys
+from depth_wall_fusion import (DepthWallSource, DepthWallCheck,
+                               DEPTH_NEAR, DEPTH_FAR, DEPTH_AMBIGUOUS)
+
+# --- パラメータ (robot_vision_thread_headless と同じ値) ---
+WALL_DEPTH_NEAR_M = 0.30
+WALL_DEPTH_FAR_M = 0.60
+WALL_DEPTH_ROIS = ((0.55, 0.3, 0.95, 0.7),
+                   (0.05, 0.3, 0.45, 0.7))
+SIDE_NAMES = ('右', '左')
+
+
+def main():
+    args = [a for a in sys.argv[1:] if a != '-v']
+    verbose = '-v' in sys.argv[1:]
+    if not args:
+        print("使い方: python depth_wall_replay.py <bagファイル> [-v]")
+        return
+
+    try:
+        source = DepthWallSource(bag_path=args[0], real_time=False)
+    except Exception as e:
+        print(f"エラー: '{args[0]}' を再生できません: {e}")
+        return
+    check = DepthWallCheck(rois=WALL_DEPTH_ROIS, near_m=WALL_DEPTH_NEAR_M, far_m=WALL_DEPTH_FAR_M)
+
+    counts = [{DEPTH_NEAR: 0, DEPTH_FAR: 0, DEPTH_AMBIGUOUS: 0} for _ in WALL_DEPTH_ROIS]
+    num_frames = 0
+    try:
+        while True:
+            try:
+                depth_m = source.read(wait=True)
+            except RuntimeError:
+                break # 再生終了 (wait_for_frames がタイムアウトする)
+            decisions = check.classify(depth_m)
+            for side, decision in enumerate(decisions):
+                counts[side][decision] += 1
+            if verbose:
+                distances = ", ".join(f"{SIDE_NAMES[i]}: {'N/A' if d is None else f'{d:.2f} m'} ({decisions[i]})"
+                                      for i, d in enumerate(check.last_distances))
+                print(f"{num_frames:5d}  {distances}")
+            num_frames += 1
+    finally:
+        source.close()
+
+    if num_frames == 0:
+        print("エラー: 深度フレームがありません。")
+        return
+    print(f"フレーム数: {num_frames}")
+    for side, side_counts in enumerate(counts):
+        decided = side_counts[DEPTH_NEAR] + side_counts[DEPTH_FAR]
+        print(f"{SIDE_NAMES[side]}: 壁あり {side_counts[DEPTH_NEAR]}, 壁なし {side_counts[DEPTH_FAR]}, "
+              f"あいまい {side_counts[DEPTH_AMBIGUOUS]} "
+              f"(線分検出を省略できる割合 {decided / num_frames * 100:.1f}%)")
+
+
+if __name__ == '__main__':
+    main()
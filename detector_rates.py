@@ -0,0 +1,165 @@
+# ファイル名: detector_rates.py
+# (main_control_thread_serial.py と同じフォルダに保存してください)
+#
+# 検出器ごとの処理レート (FPS) をまとめて決めるスケジューラ。
+# 各スレッドの TARGET_FPS は既定値として残し、ここで決めたレートを共有状態の
+# steering_target_fps / wall_target_fps / gravity_target_fps に書く (None ならスレッドの既定値)。
+#   - 直進中 (操舵コマンドが S) は壁検出のレートを上げる (壁に気づくのが早くなる)
+#     (直進・旋回は STRAIGHT_HOLD_SEC 続いてから切り替える。消失点がぶれて S と L/R が入れ替わるたびに変えない)
+#   - 停止中 (STATE_STOPPED) は操舵のレートを下げる (止まっている間は向きが変わらない)
+#   - CPU 負荷か温度が高いときは全体のレートを下げる (下げる・戻すしきい値を分けて、行ったり来たりしない)
+# メインループから毎回 update() を呼ぶ。負荷・温度は LOAD_SAMPLE_SEC ごとにしか測らない。
+
+import os
+import time
+
+LOAD_SAMPLE_SEC = 1.0
+STRAIGHT_HOLD_SEC = 1.0 # 直進・旋回がこれだけ続いたら壁検出のレートを切り替える (秒)
+THERMAL_ZONE_PATH = '/sys/class/thermal/thermal_zone0/temp' # ラズパイの SoC の温度 (ミリ度)
+
+
+def read_cpu_times():
+    """/proc/stat の全 CPU の (使用時間, 合計時間) を返す。読めなければ None。"""
+    try:
+        with open('/proc/stat') as f:
+            fields = [int(v) for v in f.readline().split()[1:]]
+    except (OSError, ValueError):
+        return None
+    idle = fields[3] + (fields[4] if len(fields) > 4 else 0) # idle + iowait
+    total = sum(fields)
+    return total - idle, total
+
+
+def read_temperature():
+    """SoC の温度 (℃) を返す。読めなければ None。"""
+    try:
+        with open(THERMAL_ZONE_PATH) as f:
+            return int(f.read().strip()) / 1000.0
+    except (OSError, ValueError):
+        return None
+
+
+class DetectorRateScheduler:
+    """
+    steering_fps / wall_fps: 通常の処理レート
+    gravity_fps: 通常の重心のレート (None ならスレッドの既定値)
+    gravity_default_fps: 重心スレッドの既定値 (robot_vision_thread_headless.gravity_default_fps()。
+                         None は毎フレーム処理)
+    steering_stopped_fps: 停止中の操舵のレート
+    wall_straight_fps: 直進中の壁検出のレート
+    straight_hold_sec: 直進・旋回がこの秒数続いてから、壁検出のレートを切り替える
+    gravity_backoff_fps: 負荷が高いときの重心のレート (gravity_fps も gravity_default_fps も None の場合。
+                         カメラのフレームレートより低くすること)
+    backoff_factor: 負荷が高いときに全体のレートに掛ける値 (負荷が高いときにレートを上げることはない)
+    cpu_high / cpu_low: CPU 使用率 (0〜1) がこれを超えたら下げる / これを下回ったら戻す
+    temp_high / temp_low: 温度 (℃) の同じしきい値
+    """
+
+    def __init__(self, state, steering_fps=2.0, wall_fps=5.0, gravity_fps=None, gravity_default_fps=None,
+                 steering_stopped_fps=0.5, wall_straight_fps=8.0, gravity_backoff_fps=10.0,
+                 straight_hold_sec=STRAIGHT_HOLD_SEC, backoff_factor=0.5, cpu_high=0.85, cpu_low=0.65, temp_high=75.0, temp_low=70.0):
+        self.state = state
+        self.steering_fps = steering_fps
+        self.wall_fps = wall_fps
+        self.gravity_fps = gravity_fps
+        self.gravity_default_fps = gravity_default_fps
+        self.steering_stopped_fps = steering_stopped_fps
+        self.wall_straight_fps = wall_straight_fps
+        self.gravity_backoff_fps = gravity_backoff_fps
+        self.straight_hold_sec = straight_hold_sec
+        self.backoff_factor = backoff_factor
+        self.cpu_high, self.cpu_low = cpu_high, cpu_low
+        self.temp_high, self.temp_low = temp_high, temp_low
+
+        self.cpu_load = None # 直近の CPU 使用率 (0〜1)
+        self.temperature = None
+        self.backoff = False
+        self.backoff_count = 0 # 負荷でレートを下げた回数 (終了時に表示)
+        self.rates = {}
+        self.straight = None # レートに使っている直進・旋回 (None なら最初の update() で決める)
+        self._straight_candidate = None # 切り替わりを待っている直進・旋回
+        self._straight_since = 0.0 # _straight_candidate になった時刻
+        self._last_sample_time = 0.0
+        self._last_cpu_times = read_cpu_times()
+
+    def _sample_load(self, now):
+        if now - self._last_sample_time < LOAD_SAMPLE_SEC:
+            return
+        self._last_sample_time = now
+        cpu_times = read_cpu_times()
+        if cpu_times is not None and self._last_cpu_times is not None:
+            busy = cpu_times[0] - self._last_cpu_times[0]
+            total = cpu_times[1] - self._last_cpu_times[1]
+            if total > 0:
+                self.cpu_load = busy / total
+        elif hasattr(os, 'getloadavg'):
+            self.cpu_load = os.getloadavg()[0] / (os.cpu_count() or 1)
+        self._last_cpu_times = cpu_times
+        self.temperature = read_temperature()
+
+        too_hot = self.temperature is not None and self.temperature >= self.temp_high
+        too_busy = self.cpu_load is not None and self.cpu_load >= self.cpu_high
+        if not self.backoff and (too_hot or too_busy):
+            self.backoff = True
+            self.backoff_count += 1
+        elif self.backoff:
+            cool = self.temperature is None or self.temperature <= self.temp_low
+            idle = self.cpu_load is None or self.cpu_load <= self.cpu_low
+            if cool and idle:
+                self.backoff = False
+
+    def _hold_straight(self, straight, now):
+        """直進・旋回が straight_hold_sec 続いたときだけ self.straight を切り替える。"""
+        if self.straight is None:
+            self.straight = straight
+        if straight == self.straight:
+            self._straight_candidate = None
+        elif straight != self._straight_candidate:
+            self._straight_candidate = straight
+            self._straight_since = now
+        elif now - self._straight_since >= self.straight_hold_sec:
+            self.straight = straight
+            self._straight_candidate = None
+        return self.straight
+
+    def update(self, stopped, straight, now=None):
+        """
+        ロボットの状態からレートを決めて共有状態に書く。変わったときは表示する。
+        stopped: 停止中 (STATE_STOPPED) か
+        straight: 直進中 (操舵コマンドが S) か
+        戻り値: {'steering': FPS, 'wall': FPS, 'gravity': FPS または None}
+        """
+        now = time.monotonic() if now is None else now
+        self._sample_load(now)
+        straight = self._hold_straight(straight, now)
+
+        steering = self.steering_stopped_fps if stopped else self.steering_fps
+        wall = self.wall_straight_fps if (straight and not stopped) else self.wall_fps
+        gravity = self.gravity_fps
+        if self.backoff:
+            steering *= self.backoff_factor
+            wall *= self.backoff_factor
+            if gravity is None:
+                gravity = self.gravity_default_fps # スレッドの既定値から下げる
+            if gravity is not None:
+                gravity *= self.backoff_factor
+            else:
+                gravity = self.gravity_backoff_fps # 毎フレーム処理している場合
+
+        rates = {'steering': steering, 'wall': wall, 'gravity': gravity}
+        if rates != self.rates:
+            self.rates = rates
+            self.state.steering_target_fps = steering
+            self.state.wall_target_fps = wall
+            self.state.gravity_target_fps = gravity
+            print(f"[スケジューラ]: 処理レート 操舵 {steering:.1f} / 壁 {wall:.1f} / 重心 "
+                  f"{'既定' if gravity is None else f'{gravity:.1f}'} FPS ({self.describe(stopped, straight)})")
+        return rates
+
+    def describe(self, stopped, straight):
+        reasons = ["停止中" if stopped else ("直進中" if straight else "旋回中")]
+        if self.backoff:
+            load_text = f"CPU {self.cpu_load * 100:.0f} %" if self.cpu_load is not None else "CPU 不明"
+            temp_text = f"{self.temperature:.1f} ℃" if self.temperature is not None else "温度不明"
+            reasons.append(f"高負荷 {load_text}, {temp_text}")
+        return ", ".join(reasons)
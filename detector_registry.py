@@ -0,0 +1,211 @@
+# ファイル名: detector_registry.py
+# (main_control_thread_serial.py と同じフォルダに保存してください)
+#
+# 検出器 (steering_thread_func など) の登録簿。操舵モードに必要な検出器だけを、必要になったときに起動する。
+#   - register() で名前・スレッド関数・カメラを登録しておき、activate() で必要な検出器の集合を渡す
+#   - 要らなくなった検出器は止めて (park)、カメラも手放す (同じカメラを使う検出器が無くなれば閉じる)
+#     止めた検出器はカメラも CPU も使わない
+#   - 複数の検出器が登録しているカメラは SharedCapture (PROCESS なら SharedMemoryCapture) で共有する
+#   - 検出器にはそれ専用の停止用 Event を持つ共有状態 (DetectorStateView) を渡すので、1つだけ止められる
+#   - 検出器がカメラを開けずに request_stop() した場合は、全体を止めずにその検出器の失敗として記録する
+#     (poll() で受け取り、モードの切り替えを元に戻すかどうかは呼び出し側が決める)
+#   - 止めるときは PARK_TIMEOUT_SEC だけ待つ。cap.read() などで止まらない検出器のために制御ループを止めない
+#     (PROCESS なら強制終了する。THREAD は強制終了できないので、止まるまで記録しておき、同じ検出器は起動しない)
+# 操舵モードを実行中に切り替えても、プログラムを書き換えて再起動する必要がない。
+
+import threading
+from functools import partial
+from multiprocessing import get_context
+
+from shared_capture import SharedCapture
+from process_runtime import SharedMemoryCapture, detector_process, PROCESS_START_METHOD
+
+# 検出器を止めるときに終わるのを待つ時間 (秒)
+PARK_TIMEOUT_SEC = 1.0
+
+
+class DetectorStateView:
+    """
+    1つの検出器に渡す共有状態。停止の確認・要求だけをその検出器用にし、他は共有状態そのものを使う。
+    stop_event: この検出器を止める Event (全体の停止要求でも止まる)
+    failed_event: 検出器が自分から request_stop() した (カメラを開けないなど) ことを記録する Event
+    """
+
+    def __init__(self, state, stop_event, failed_event):
+        self._state = state
+        self.stop_event = stop_event
+        self.failed_event = failed_event
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self._state, name)
+
+    def __reduce__(self):
+        # PROCESS のとき: 共有状態と Event ごと別プロセスに渡す
+        return (DetectorStateView, (self._state, self.stop_event, self.failed_event))
+
+    def should_stop(self):
+        return self.stop_event.is_set() or self._state.should_stop()
+
+    def request_stop(self):
+        self.failed_event.set()
+        self.stop_event.set()
+        self._state.notify_update() # メインループをすぐに起こして失敗に気づかせる
+
+
+class DetectorRegistry:
+    """
+    state: VisionState (PROCESS なら SharedVisionState)
+    use_process: True なら検出器を別プロセスで動かす (process_runtime.py)
+    cpu_policy: cpu_policy.CpuPolicy (None なら設定しない)
+    """
+
+    def __init__(self, state, use_process=False, cpu_policy=None, park_timeout=PARK_TIMEOUT_SEC):
+        self.state = state
+        self.use_process = use_process
+        self.cpu_policy = cpu_policy
+        self.park_timeout = park_timeout
+        self.detectors = {} # 名前 → (スレッド関数, カメラ)
+        self.workers = {} # 動いている検出器の名前 → (Thread/Process, DetectorStateView, カメラ)
+        self.cameras = {} # 共有しているカメラ → [SharedCapture, 使っている検出器の数]
+        self.stuck = {} # 止めようとしても止まらなかったスレッドの名前 → (Thread, カメラ)
+        self.start_versions = {} # 検出器の名前 → 起動したときのスロットの版数
+        self.start_failures = [] # 起動できなかった検出器の名前 (poll() で返す)
+
+    def register(self, name, thread_func, camera):
+        """検出器を登録する (まだ起動しない)。"""
+        self.detectors[name] = (thread_func, camera)
+
+    def running(self):
+        """動いている検出器の名前の集合。"""
+        return set(self.workers)
+
+    def _is_shared_camera(self, camera):
+        return sum(1 for _, c in self.detectors.values() if c == camera) > 1
+
+    def _acquire_source(self, camera):
+        if not self._is_shared_camera(camera):
+            return camera # 1つの検出器だけが使うカメラは、その検出器が自分で開く
+        entry = self.cameras.get(camera)
+        if entry is None:
+            capture_class = SharedMemoryCapture if self.use_process else SharedCapture
+            reader_init = self.cpu_policy.thread_initializer('capture') if self.cpu_policy else None
+            entry = [capture_class(camera, reader_init=reader_init), 0]
+            self.cameras[camera] = entry
+        entry[1] += 1
+        return entry[0].consumer()
+
+    def _release_source(self, camera):
+        entry = self.cameras.get(camera)
+        if entry is None:
+            return
+        entry[1] -= 1
+        if entry[1] <= 0:
+            entry[0].close()
+            del self.cameras[camera]
+
+    def start(self, name):
+        """検出器を起動する (動いていれば何もしない)。起動できなかったときは False を返す。"""
+        if name in self.workers:
+            return True
+        if name in self.stuck:
+            # 前のスレッドがまだ残っている: 同じスロットに2つのスレッドが書き込まないよう起動しない
+            print(f"[検出器]: {name} の前のスレッドが止まっていないため起動できません。")
+            self.start_failures.append(name)
+            return False
+        thread_func, camera = self.detectors[name]
+        if self.use_process:
+            context = get_context(PROCESS_START_METHOD)
+            view = DetectorStateView(self.state, context.Event(), context.Event())
+        else:
+            view = DetectorStateView(self.state, threading.Event(), threading.Event())
+        source = self._acquire_source(camera)
+        if self.use_process:
+            func = partial(self.cpu_policy.run, name, thread_func) if self.cpu_policy else thread_func
+            worker = detector_process(func, source, view, name=thread_func.__name__)
+        # 止まらないスレッドが残ってもプログラムを終了できるように daemon にする
+        elif self.cpu_policy is not None:
+            worker = threading.Thread(target=self.cpu_policy.run, args=(name, thread_func, source, view),
+                                      daemon=True)
+        else:
+            worker = threading.Thread(target=thread_func, args=(source, view), daemon=True)
+        self.start_versions[name] = getattr(self.state, name).version
+        worker.start()
+        self.workers[name] = (worker, view, camera)
+        print(f"[検出器]: {name} を起動しました。")
+        return True
+
+    def published(self, name):
+        """起動してから、検出器が1回でも結果を書き込んだか。"""
+        return getattr(self.state, name).version != self.start_versions.get(name)
+
+    def unpublished(self, names):
+        """names のうち、動いているがまだ結果を書き込んでいない検出器の名前のリスト。"""
+        return [name for name in names if name in self.workers and not self.published(name)]
+
+    def park(self, name):
+        """
+        検出器を止め、終わるのを待ってカメラを手放す (最大 park_timeout 秒)。
+        止まらなかったときは False を返す (PROCESS なら強制終了する)。
+        """
+        if name not in self.workers:
+            return True
+        worker, view, camera = self.workers.pop(name)
+        view.stop_event.set()
+        worker.join(self.park_timeout)
+        if worker.is_alive():
+            if not self.use_process:
+                print(f"[検出器] エラー: {name} が {self.park_timeout:.1f} 秒以内に止まりません。"
+                      "止まるまでカメラを手放さず、再起動もしません。")
+                self.stuck[name] = (worker, camera)
+                return False
+            print(f"[検出器] エラー: {name} が {self.park_timeout:.1f} 秒以内に止まりません。強制終了します。")
+            worker.terminate()
+            worker.join()
+            getattr(self.state, name).abandon_write() # 書き込みの途中で終了していても読めるようにする
+        self._release_source(camera)
+        print(f"[検出器]: {name} を停止しました。")
+        return True
+
+    def activate(self, names):
+        """
+        names の検出器だけが動いている状態にする。
+        先に足りないものを起動してから要らないものを止める (共有しているカメラを閉じずに次の検出器へ渡す)。
+        起動できなかった検出器は次の poll() で返す。
+        """
+        names = set(names)
+        for name in sorted(names - self.running()):
+            self.start(name)
+        for name in sorted(self.running() - names):
+            self.park(name)
+
+    def poll(self):
+        """
+        自分から止まった (失敗した) 検出器と起動できなかった検出器を片付け、その名前のリストを返す。
+        止まらなかったスレッドが後から止まっていれば、そのカメラを手放す。
+        """
+        for name, (worker, camera) in list(self.stuck.items()):
+            if not worker.is_alive():
+                del self.stuck[name]
+                self._release_source(camera)
+                print(f"[検出器]: {name} の前のスレッドが止まりました。")
+        failed = [name for name, (_, view, _) in self.workers.items() if view.failed_event.is_set()]
+        for name in failed:
+            print(f"[検出器]: {name} が起動に失敗しました。")
+            self.park(name)
+        failed += self.start_failures
+        self.start_failures = []
+        return failed
+
+    def shutdown(self):
+        """全検出器を止め、共有しているカメラを閉じる (止まらないスレッドは残したまま終わる)。"""
+        for name in list(self.workers):
+            self.park(name)
+        for name, (worker, _) in self.stuck.items():
+            worker.join(self.park_timeout)
+            if worker.is_alive():
+                print(f"[検出器] エラー: {name} が止まらないまま終了します。")
+        for capture, _ in self.cameras.values():
+            capture.close()
+        self.cameras = {}
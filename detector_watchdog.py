@@ -0,0 +1,168 @@
+# ファイル名: detector_watchdog.py
+# (main_control_thread_serial.py と同じフォルダに保存してください)
+#
+# 検出器の結果が古くなったときに安全側に倒すウォッチドッグ (制御側で使う)。
+# 検出スレッドが cap.read() で止まったり、try/except の中で例外を出し続けたりすると、
+# 共有状態には最後の値が残ったままになり、メインループはそれで走り続けてしまう。
+#   - メインループが毎回 update() にスナップショットを渡し、版数が進んだ時刻を検出器ごとに記録する
+#     (締切超過で前回の値を継続しただけの書き込み = carried_forward は新しいデータに数えない)
+#   - 新しいデータが来ない時間が、期待する周期 (処理レート) の何倍かを超えたら
+#       徐行 (DEGRADED): 操舵コマンドと "H" を交互に送って、ゆっくり進む
+#       停止 (HALT)    : "H" だけを送る
+#   - 処理レートは detector_rates.py などで変わるので、しきい値は共有状態の *_target_fps から毎回決める
+#     (レートを上げた直後は、前のレートで待っていたデータを新しい周期で判定しないよう、
+#      新しいレートで最初のデータが来るまでは前後の周期の長い方で判定する)
+#   - 状態が悪くなったとき・戻ったときに表示し、終了時に report() でまとめを表示する
+#
+#   watchdog = DetectorWatchdog(state, {'steering': 2, 'wall': 5, 'gravity': 5})
+#   watchdog.watch(('steering', 'wall'))
+#   ループ内: watchdog.update({'steering': steering, 'wall': wall}); command = watchdog.apply(command)
+
+import time
+from collections import deque
+
+LEVEL_OK = 0
+LEVEL_DEGRADED = 1
+LEVEL_HALT = 2
+LEVEL_NAMES = {LEVEL_OK: "通常", LEVEL_DEGRADED: "徐行", LEVEL_HALT: "停止"}
+
+DETECTOR_NAMES = {'steering': '操舵', 'wall': '壁', 'gravity': '重心'}
+
+
+class DetectorWatchdog:
+    """
+    state: VisionState (*_target_fps を読む)
+    default_fps: {検出器の名前: 処理レート}。*_target_fps が None のとき (スレッドの既定値) に使う
+    degrade_intervals / halt_intervals: 期待する周期の何倍、新しいデータが来なければ徐行 / 停止にするか
+    degrade_min_sec / halt_min_sec: 徐行 / 停止にするまでの最低の秒数 (処理レートが高いときにすぐ落とさない)
+    startup_grace_sec: 監視を始めてから (カメラを開く間) 待つ秒数
+    recover_publishes: 徐行・停止から戻すのに必要な、続けて来た新しいデータの数
+    creep_drive_sec / creep_hold_sec: 徐行中に操舵コマンドを送る時間 / "H" を送る時間
+    """
+
+    def __init__(self, state, default_fps, degrade_intervals=3.0, halt_intervals=6.0,
+                 degrade_min_sec=1.0, halt_min_sec=3.0, startup_grace_sec=3.0, recover_publishes=2,
+                 creep_drive_sec=0.2, creep_hold_sec=0.3):
+        self.state = state
+        self.default_fps = default_fps
+        self.degrade_intervals = degrade_intervals
+        self.halt_intervals = halt_intervals
+        self.degrade_min_sec = degrade_min_sec
+        self.halt_min_sec = halt_min_sec
+        self.startup_grace_sec = startup_grace_sec
+        self.recover_publishes = recover_publishes
+        self.creep_drive_sec = creep_drive_sec
+        self.creep_hold_sec = creep_hold_sec
+
+        self.watched = () # 監視している検出器の名前
+        self.last_versions = {} # 検出器 → 最後に見た版数 (None なら次の update() で基準にする)
+        self.last_fresh = {} # 検出器 → 最後に新しいデータが来た時刻 (起動直後は猶予の分だけ先)
+        self.publish_times = {} # 検出器 → 直近の新しいデータの時刻 (処理レートの表示用)
+        self.fresh_streaks = {} # 検出器 → 続けて来た新しいデータの数
+        self.settled_intervals = {} # 検出器 → 最後に新しいデータが来たときの期待する周期
+        self.levels = {} # 検出器 → LEVEL_*
+        self.level = LEVEL_OK # 全体 (監視している検出器のうち最も悪いもの)
+        self.incidents = [] # (時刻, 検出器, LEVEL_*, 新しいデータが来ていない秒数)
+        self.worst_age = {} # 検出器 → 新しいデータが来なかった最長の秒数
+        self._creep_start = 0.0
+
+    def watch(self, names, now=None):
+        """監視する検出器を決める (操舵モードを切り替えたときなど)。新しく加えた検出器には起動の猶予を与える。"""
+        now = time.monotonic() if now is None else now
+        names = tuple(names)
+        for name in names:
+            if name not in self.watched:
+                self.last_versions[name] = None
+                self.last_fresh[name] = now + self.startup_grace_sec
+                self.publish_times[name] = deque(maxlen=10)
+                self.fresh_streaks[name] = 0
+                self.settled_intervals[name] = None
+                self.levels[name] = LEVEL_OK
+        self.watched = names
+        self.level = max((self.levels[name] for name in names), default=LEVEL_OK)
+
+    def expected_interval(self, name):
+        """検出器の今の処理レートから期待する周期 (秒)。"""
+        fps = getattr(self.state, f'{name}_target_fps', None) or self.default_fps.get(name)
+        return 1.0 / fps if fps else 0.0
+
+    def observed_fps(self, name):
+        """直近の新しいデータの間隔から求めた処理レート (まだ分からなければ None)。"""
+        times = self.publish_times.get(name)
+        if not times or len(times) < 2 or times[-1] <= times[0]:
+            return None
+        return (len(times) - 1) / (times[-1] - times[0])
+
+    def update(self, snapshots, now=None):
+        """
+        スナップショット ({検出器の名前: StateSlot.snapshot()}) から、検出器ごとに新しいデータが来ているかを調べる。
+        戻り値: 全体の状態 (LEVEL_*)
+        """
+        now = time.monotonic() if now is None else now
+        for name in self.watched:
+            snapshot = snapshots.get(name)
+            if snapshot is None:
+                continue
+            current_interval = self.expected_interval(name)
+            if self.last_versions[name] is None:
+                self.last_versions[name] = snapshot.version # 監視を始める前のデータは数えない
+            elif snapshot.version != self.last_versions[name]:
+                self.last_versions[name] = snapshot.version
+                if not getattr(snapshot, 'carried_forward', False):
+                    self.last_fresh[name] = max(self.last_fresh[name], now)
+                    self.publish_times[name].append(now)
+                    self.fresh_streaks[name] += 1
+                    self.settled_intervals[name] = current_interval
+
+            age = now - self.last_fresh[name]
+            self.worst_age[name] = max(self.worst_age.get(name, 0.0), age)
+            interval = current_interval
+            if self.settled_intervals[name] is not None:
+                interval = max(interval, self.settled_intervals[name])
+            level = LEVEL_OK
+            if age > max(self.halt_min_sec, self.halt_intervals * interval):
+                level = LEVEL_HALT
+            elif age > max(self.degrade_min_sec, self.degrade_intervals * interval):
+                level = LEVEL_DEGRADED
+            self._set_level(name, level, age, interval, now)
+
+        self.level = max((self.levels[name] for name in self.watched), default=LEVEL_OK)
+        return self.level
+
+    def _set_level(self, name, level, age, interval, now):
+        current = self.levels[name]
+        if level > current:
+            self.fresh_streaks[name] = 0
+            self.levels[name] = level
+            self.incidents.append((time.time(), name, level, age))
+            fps = self.observed_fps(name)
+            fps_text = f"直近 {fps:.1f} 回/秒" if fps is not None else "直近の処理レート不明"
+            print(f"[ウォッチドッグ]: {DETECTOR_NAMES.get(name, name)}のデータが {age:.1f} 秒更新されていません "
+                  f"(期待 {interval:.2f} 秒ごと, {fps_text})。{LEVEL_NAMES[level]}します。")
+            if level == LEVEL_DEGRADED:
+                self._creep_start = now
+        elif level < current and self.fresh_streaks[name] >= self.recover_publishes:
+            self.levels[name] = level
+            print(f"[ウォッチドッグ]: {DETECTOR_NAMES.get(name, name)}のデータが戻りました "
+                  f"({LEVEL_NAMES[current]} → {LEVEL_NAMES[level]})。")
+
+    def apply(self, command, now=None):
+        """全体の状態に合わせて、送るコマンドを安全側に置き換える。"""
+        if self.level == LEVEL_OK:
+            return command
+        if self.level == LEVEL_HALT:
+            return "H"
+        # 徐行: creep_drive_sec だけ操舵コマンドを送り、creep_hold_sec だけ止まるのを繰り返す
+        now = time.monotonic() if now is None else now
+        phase = (now - self._creep_start) % (self.creep_drive_sec + self.creep_hold_sec)
+        return command if phase < self.creep_drive_sec else "H"
+
+    def report(self):
+        """終了時に表示するまとめ。"""
+        counts = {LEVEL_DEGRADED: 0, LEVEL_HALT: 0}
+        for _, _, level, _ in self.incidents:
+            counts[level] += 1
+        worst_text = ", ".join(f"{DETECTOR_NAMES.get(name, name)} {age:.1f} 秒"
+                               for name, age in self.worst_age.items())
+        return (f"徐行 {counts[LEVEL_DEGRADED]} 回, 停止 {counts[LEVEL_HALT]} 回 "
+                f"(データが来なかった最長: {worst_text or 'なし'})")
@@ -0,0 +1,271 @@
+# ファイル名: drive_control.py
+# (main_control_thread_serial.py と同じフォルダに保存してください)
+#
+# 制御の1周期ごとの判断 (共有状態のスナップショット → Pico に送るコマンド) と操舵モードの切り替え。
+# main_control_thread_serial.py (スレッド) と main_control_async.py (asyncio) の両方から使う。
+# 各メインに残すのは、待ち方 (イベント駆動・タイマー) とシリアルの読み書きだけ。
+#   - 操舵モードごとのズレ量 (LINE_DETECT: 消失点, GRAVITY: 重心, FUSION: 両方をカルマンフィルタで統合)
+#   - 壁で止まるステートマシン (STATE_DRIVING / STATE_STOPPED)
+#   - 検出器の処理レート (detector_rates.py) と結果が古いときの徐行・停止 (detector_watchdog.py)
+#   - 操舵モードの切り替え (detector_registry.py):
+#       切り替えた検出器が最初の結果を書き込むまでは "H" を送る
+#       それまでに検出器が動かなければ元のモードに戻し、その後に動かなくなったら停止を要求する
+#
+#   switch = controller.next_switch()
+#   if switch is not None:
+#       ("H" を送る)
+#       controller.switch_mode(*switch)
+#   decision = controller.decide()
+#   (decision.command を送る)
+
+import time
+from collections import namedtuple
+
+from steering_fusion import SteeringFusion, vanishing_point_confidence, gravity_confidence
+from detector_watchdog import LEVEL_OK, LEVEL_NAMES
+
+### --- ステートマシンの状態定義 ---
+STATE_DRIVING = 0
+STATE_STOPPED = 1
+
+# 1周期の判断の結果
+#   command: 送るコマンド, steering_command: ステートマシン・ウォッチドッグを通す前の操舵コマンド
+#   steering_diff: 操舵に使ったズレ量, wall_detected: 壁が見えているか
+#   steering / wall / gravity: 判断に使ったスナップショット
+Decision = namedtuple('Decision', ('command', 'steering_command', 'steering_diff', 'wall_detected',
+                                   'steering', 'wall', 'gravity'))
+
+
+def steering_command_for(diff, threshold):
+    """ズレ量から操舵コマンドを作る (しきい値以内なら直進)。"""
+    if abs(diff) <= threshold:
+        return "S"
+    if diff > 0:
+        return f"R {diff:.2f}"
+    return f"L {abs(diff):.2f}"
+
+
+def parse_mode_commands(buffer):
+    """
+    シリアルで受け取ったデータから "MODE <操舵モード>" の行を取り出す。
+    戻り値: (要求された操舵モードのリスト, 行の途中までの受信データ)
+    """
+    modes = []
+    while b'\n' in buffer:
+        line, buffer = buffer.split(b'\n', 1)
+        words = line.decode('utf-8', errors='ignore').split()
+        if len(words) == 2 and words[0] == 'MODE':
+            modes.append(words[1])
+    return modes, buffer
+
+
+class DriveController:
+    """
+    state: VisionState (PROCESS なら SharedVisionState)
+    registry: detector_registry.DetectorRegistry (検出器を登録済みのもの)
+    mode: 起動時の操舵モード
+    mode_detectors: {操舵モード: そのモードで動かす検出器の名前}
+    steering_threshold: これ以内のズレ量は直進
+    stop_duration_sec / stop_cooldown_sec: 壁で止まる時間 / 次に壁で止まるまでの時間
+    steering_fps / fusion_steering_fps: 操舵 (消失点) の処理レート (FUSION モードでは fusion_steering_fps)
+    rate_scheduler: detector_rates.DetectorRateScheduler (None なら処理レートを変えない)
+    watchdog: detector_watchdog.DetectorWatchdog (None なら結果が古くても走り続ける)
+    """
+
+    def __init__(self, state, registry, mode, mode_detectors, steering_threshold,
+                 stop_duration_sec, stop_cooldown_sec, steering_fps, fusion_steering_fps,
+                 rate_scheduler=None, watchdog=None):
+        if mode not in mode_detectors:
+            raise ValueError(f"不明な操舵モードです: {mode}")
+        self.state = state
+        self.registry = registry
+        self.mode = mode
+        self.mode_detectors = mode_detectors
+        self.steering_threshold = steering_threshold
+        self.stop_duration_sec = stop_duration_sec
+        self.stop_cooldown_sec = stop_cooldown_sec
+        self.steering_fps = steering_fps
+        self.fusion_steering_fps = fusion_steering_fps
+        self.rate_scheduler = rate_scheduler
+        self.watchdog = watchdog
+
+        self.previous_mode = None # 切り替える前のモード (新しい検出器が結果を書き込むまでに失敗したら戻す)
+        self.mode_settling = True # 新しく起動した検出器の最初の結果を待っている
+        self.mode_requests = [] # 操舵モードの切り替え要求 (None は次のモード)
+
+        self.fusion = SteeringFusion()
+        self.last_steering_frame_id = 0 # FUSION に取り込んだ最後のレコードの frame_id
+        self.last_gravity_frame_id = 0
+        self.current_state = STATE_DRIVING
+        self.stop_timer_end_time = 0.0
+        self.stop_cooldown_end_time = 0.0
+        self.stop_count = 0 # 壁で停止した回数 (終了時に表示)
+
+    # ------------------------------------------------------------------
+    # 操舵モード
+    # ------------------------------------------------------------------
+    def start(self):
+        """起動時の操舵モードの検出器を起動する。"""
+        self._apply_mode(self.mode)
+
+    def _apply_mode(self, mode):
+        """操舵モードに必要な検出器だけを動かし、操舵の処理レートとウォッチドッグの監視対象をモードに合わせる。"""
+        self.registry.activate(self.mode_detectors[mode])
+        # FUSION モードでは消失点を間引く (間は毎フレームの重心で埋める)
+        if self.rate_scheduler is not None:
+            self.rate_scheduler.steering_fps = self.fusion_steering_fps if mode == 'FUSION' else self.steering_fps
+        else:
+            self.state.steering_target_fps = self.fusion_steering_fps if mode == 'FUSION' else None
+        if self.watchdog is not None:
+            self.watchdog.watch(self.mode_detectors[mode])
+
+    def next_mode(self, mode):
+        """mode_detectors の順で次の操舵モード。"""
+        modes = list(self.mode_detectors)
+        return modes[(modes.index(mode) + 1) % len(modes)]
+
+    def request_mode(self, mode=None):
+        """操舵モードの切り替えを要求する (None は次のモード)。シグナルハンドラから呼んでもよい。"""
+        self.mode_requests.append(mode)
+
+    def next_switch(self):
+        """
+        この周期で切り替える操舵モードを決める。切り替えないときは None。
+        起動に失敗した (カメラを開けないなど) 検出器があれば、元のモードに戻す。戻せなければ停止を要求する。
+        戻り値: (操舵モード, 元のモードに戻すか) または None
+        """
+        failed = self.registry.poll()
+        if any(name in self.mode_detectors[self.mode] for name in failed):
+            if self.previous_mode is not None:
+                print(f"[メイン]: {self.mode} モードに必要な検出器 {failed} が動きません。"
+                      f"{self.previous_mode} モードに戻します。")
+                return self.previous_mode, True
+            print(f"[メイン]: 検出器 {failed} が動きません。")
+            self.state.request_stop()
+            return None
+        while self.mode_requests:
+            requested_mode = self.mode_requests.pop(0)
+            if requested_mode is None:
+                requested_mode = self.next_mode(self.mode)
+            if requested_mode not in self.mode_detectors:
+                print(f"[メイン]: 不明な操舵モードです: {requested_mode}")
+                continue
+            if requested_mode != self.mode:
+                return requested_mode, False
+        return None
+
+    def switch_mode(self, mode, revert=False):
+        """
+        操舵モードを切り替える (next_switch() の戻り値を渡す)。
+        検出器を止める間 (最大 detector_registry.PARK_TIMEOUT_SEC 秒) 待つので、呼ぶ前に "H" を送っておく。
+        """
+        if not revert:
+            print(f"[メイン]: 操舵モードを {self.mode} から {mode} に切り替えます。")
+        self.previous_mode = None if revert else self.mode
+        self.mode = mode
+        self._apply_mode(mode)
+        self.mode_settling = True
+
+    # ------------------------------------------------------------------
+    # 1周期の判断
+    # ------------------------------------------------------------------
+    def _steering_diff(self, steering, gravity, current_time):
+        """操舵モードに合わせて、操舵に使うズレ量を決める。"""
+        if self.mode == 'GRAVITY':
+            return gravity.value
+        if self.mode == 'FUSION':
+            # 新しいレコードだけを、処理した時刻と信頼度つきで取り込む
+            if steering.result is not None and steering.result['frame_id'] != self.last_steering_frame_id:
+                self.last_steering_frame_id = steering.result['frame_id']
+                self.fusion.update_vanishing_point(float(steering.result['x_difference']),
+                                                   float(steering.result['timestamp']),
+                                                   vanishing_point_confidence(steering.result))
+            if gravity.result is not None and gravity.result['frame_id'] != self.last_gravity_frame_id:
+                self.last_gravity_frame_id = gravity.result['frame_id']
+                self.fusion.update_gravity(float(gravity.result['x_difference']),
+                                           float(gravity.result['timestamp']),
+                                           gravity_confidence(gravity.result))
+            fused_diff, _ = self.fusion.estimate(current_time)
+            return fused_diff
+        return steering.value
+
+    def decide(self, current_time=None):
+        """共有状態を読み、この周期に送るコマンドを決める (Decision を返す)。"""
+        current_time = time.time() if current_time is None else current_time
+
+        # 新しく起動した検出器が最初の結果を書き込むまでは、止めたときに残った値 (または初期値) で走らない
+        waiting_detectors = self.registry.unpublished(self.mode_detectors[self.mode])
+        if self.mode_settling and not waiting_detectors:
+            self.mode_settling = False
+            if self.previous_mode is not None:
+                print(f"[メイン]: {self.mode} モードの検出器がそろいました。")
+            self.previous_mode = None # ここから後の失敗では元のモードに戻さず止める
+            self.fusion.reset() # 前のモードのときの推定・残っていたレコードを持ち越さない
+
+        # スロットごとに一貫したスナップショット (同じ書き込みの値どうし) を取る
+        steering, wall, gravity = self.state.snapshot()
+        if wall.event is not None:
+            is_wall_detected = wall.event['active']
+        else:
+            is_wall_detected = (wall.detected == 1)
+
+        # --- 操舵コマンドを生成 ---
+        steering_diff = self._steering_diff(steering, gravity, current_time)
+        steering_command = steering_command_for(steering_diff, self.steering_threshold)
+
+        # --- ステートマシンによるコマンド決定 ---
+        final_command = steering_command
+        if self.current_state == STATE_DRIVING:
+            if is_wall_detected and current_time > self.stop_cooldown_end_time:
+                print(f"[メイン]: !!! 壁を検出！ {self.stop_duration_sec}秒間停止します。 !!!")
+                if wall.event is not None:
+                    print(f"[メイン]: 信頼度 {wall.event['confidence']:.2f}, "
+                          f"最初に見えてから {current_time - wall.event['first_seen']:.2f}秒")
+                self.stop_count += 1
+                self.current_state = STATE_STOPPED
+                self.stop_timer_end_time = current_time + self.stop_duration_sec
+                self.stop_cooldown_end_time = current_time + self.stop_cooldown_sec
+                final_command = "H"
+        elif self.current_state == STATE_STOPPED:
+            if current_time > self.stop_timer_end_time:
+                print("[メイン]: --- 停止時間終了。運転を再開します。---")
+                self.current_state = STATE_DRIVING
+            else:
+                final_command = "H"
+
+        if waiting_detectors:
+            final_command = "H"
+
+        # --- 検出器の処理レートを決める ---
+        if self.rate_scheduler is not None:
+            self.rate_scheduler.update(stopped=(self.current_state == STATE_STOPPED),
+                                       straight=(steering_command == "S"))
+
+        # --- 検出器の結果が古ければ安全側に倒す (徐行・停止) ---
+        if self.watchdog is not None:
+            self.watchdog.update({'steering': steering, 'wall': wall, 'gravity': gravity})
+            final_command = self.watchdog.apply(final_command)
+
+        return Decision(final_command, steering_command, steering_diff, is_wall_detected,
+                        steering, wall, gravity)
+
+    def status_text(self, decision):
+        """状態の表示 (標準出力) の1行。"""
+        state_text = "DRIVING" if self.current_state == STATE_DRIVING else "STOPPED"
+        if self.watchdog is not None and self.watchdog.level != LEVEL_OK:
+            state_text += f" ({LEVEL_NAMES[self.watchdog.level]})"
+        carried_text = " (前回値継続)" if decision.steering.carried_forward else ""
+        return (f"状態: {state_text}, Mode: {self.mode}, "
+                f"壁: {decision.wall_detected}, "
+                f"ズレ: {decision.steering_diff:6.2f}{carried_text}, "
+                f"コマンド: {decision.command}")
+
+    def shutdown(self):
+        """全検出器を止め、終了時のまとめを表示する (呼ぶ前に state.request_stop() しておく)。"""
+        self.registry.shutdown()
+        print("[メイン]: 全スレッドが終了しました。")
+        print(f"[メイン]: 壁での停止回数: {self.stop_count} 回")
+        if self.rate_scheduler is not None:
+            print(f"[メイン]: 負荷でレートを下げた回数: {self.rate_scheduler.backoff_count} 回")
+        if self.watchdog is not None:
+            print(f"[メイン]: ウォッチドッグ: {self.watchdog.report()}")
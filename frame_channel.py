@@ -0,0 +1,62 @@
+# ファイル名: frame_channel.py
+# (robot_vision_thread_display.py と同じフォルダに保存してください)
+#
+# 表示用フレームを検出スレッドから GUI (メインループ) へコピーせずに渡すためのトリプルバッファ。
+#   - バッファは3枚: 書き込み用 (back)、受け渡し用 (middle)、表示用 (front)
+#   - 検出スレッドは back_buffer() で受け取った配列に直接描画し (cv2.resize(..., dst=...) など)、
+#     publish() で back と middle の番号を入れ替える
+#   - メインループは latest() で middle と front を入れ替え、front の読み取り専用ビューを受け取る
+#   - 入れ替えるのは番号だけなので、ロックを持つのはごく短い時間で、フレームのコピーは1回もない
+#   - 書き込み中のバッファと表示中のバッファは必ず別なので、表示中のフレームが書き換わることはない
+# 1つのチャンネルにつき、書き込むスレッドも読むスレッドも1つずつであること。
+
+import threading
+import numpy as np
+
+
+class FrameChannel:
+    """1つの表示 (ウィンドウ) 分のトリプルバッファ。"""
+
+    def __init__(self):
+        self.buffers = [None, None, None]
+        self.back = 0
+        self.middle = 1
+        self.front = 2
+        self.fresh = False # middle に未読のフレームがあるか
+        self.frame_id = 0 # publish() された回数
+        self._front_view = None
+        self._swap_lock = threading.Lock() # 番号の入れ替えだけを守る
+
+    def back_buffer(self, shape, dtype=np.uint8):
+        """
+        書き込み用バッファを返す (検出スレッド側)。
+        形が変わったときだけ作り直す。publish() するまでは何を書いてもよい。
+        """
+        buffer = self.buffers[self.back]
+        if buffer is None or buffer.shape != tuple(shape) or buffer.dtype != dtype:
+            buffer = np.empty(shape, dtype=dtype)
+            self.buffers[self.back] = buffer
+        return buffer
+
+    def publish(self):
+        """back_buffer() に書いたフレームを公開する (検出スレッド側)。"""
+        with self._swap_lock:
+            self.back, self.middle = self.middle, self.back
+            self.fresh = True
+            self.frame_id += 1
+
+    def latest(self):
+        """
+        最新のフレームの読み取り専用ビューを返す (メインループ側)。まだ1枚もなければ None。
+        返したビューは、次に latest() を呼ぶまで書き換わらない。
+        """
+        with self._swap_lock:
+            if self.fresh:
+                self.front, self.middle = self.middle, self.front
+                self.fresh = False
+                self._front_view = None
+        if self._front_view is None and self.buffers[self.front] is not None:
+            view = self.buffers[self.front].view()
+            view.flags.writeable = False
+            self._front_view = view
+        return self._front_view
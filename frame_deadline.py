@@ -0,0 +1,75 @@
+# ファイル名: frame_deadline.py
+# (robot_vision_thread_headless.py と同じフォルダに保存してください)
+#
+# 検出スレッドの1フレームあたりの処理時間に締切 (予算) を設けるためのモジュール。
+# 各ステージの終わりに check() を呼ぶと、
+#   - すでに予算を使い切っている
+#   - 次のステージの所要時間 (過去の移動平均) を足すと予算を超える
+# のどちらかで DeadlineExceeded を送出する。スレッド側はそれを受けてフレームを捨て、
+# 前回の推定値を「継続 (carried forward)」として共有辞書に書き込む。
+
+import time
+
+# ステージ所要時間の移動平均の重み (新しい値の割合)
+STAGE_COST_SMOOTHING = 0.2
+
+
+class DeadlineExceeded(Exception):
+    """フレームの処理が締切を超えた (または超えると予測された) ことを表す例外。"""
+
+    def __init__(self, stage, elapsed, budget, predicted=False):
+        self.stage = stage
+        self.elapsed = elapsed
+        self.budget = budget
+        self.predicted = predicted
+        kind = "予測" if predicted else "超過"
+        super().__init__(f"ステージ '{stage}' で締切{kind} "
+                         f"({elapsed * 1000:.1f}ms / 予算 {budget * 1000:.1f}ms)")
+
+
+class FrameDeadline:
+    """1フレーム分の処理時間の予算を管理する。スレッドごとに1つ作って使い回す。"""
+
+    def __init__(self, budget_sec):
+        self.budget_sec = budget_sec
+        self.stage_costs = {} # ステージ名 -> 所要時間の移動平均 (秒)
+        self.overrun_counts = {} # ステージ名 -> 締切を超えた回数
+        self.frame_start = 0.0
+        self.stage_start = 0.0
+
+    def begin(self):
+        """フレームの処理開始時に呼ぶ。"""
+        self.frame_start = time.perf_counter()
+        self.stage_start = self.frame_start
+
+    def elapsed(self):
+        return time.perf_counter() - self.frame_start
+
+    def check(self, stage, next_stage=None):
+        """
+        ステージ stage が終わったところで呼ぶ。所要時間を記録し、
+        予算を超えていれば (または next_stage が予算を超えると予測されれば) DeadlineExceeded を送出する。
+        """
+        now = time.perf_counter()
+        cost = now - self.stage_start
+        previous = self.stage_costs.get(stage)
+        if previous is None:
+            self.stage_costs[stage] = cost
+        else:
+            self.stage_costs[stage] = previous + STAGE_COST_SMOOTHING * (cost - previous)
+        self.stage_start = now
+
+        elapsed = now - self.frame_start
+        if elapsed > self.budget_sec:
+            self._overrun(stage)
+            raise DeadlineExceeded(stage, elapsed, self.budget_sec)
+        if next_stage is not None:
+            expected = self.stage_costs.get(next_stage, 0.0)
+            if elapsed + expected > self.budget_sec:
+                self._overrun(next_stage)
+                # 見積もりが大きいまま二度と実行されなくならないよう、スキップのたびに少し減衰させる
+                self.stage_costs[next_stage] = expected * (1.0 - STAGE_COST_SMOOTHING)
+                raise DeadlineExceeded(next_stage, elapsed + expected, self.budget_sec, predicted=True)
+
+    def _overrun(self, stage):
+        self.overrun_counts[stage] = self.overrun_counts.get(stage, 0) + 1
@@ -0,0 +1,188 @@
+# ファイル名: gravity_detection.py
+# (robot_vision_thread_headless.py と同じフォルダに保存してください)
+#
+# 画像の暗い部分 (パイプの奥) の重心を求めるモジュール。
+#   - 暗さ = 255 - 輝度 を重みとし、列ごと・行ごとの合計を cv2.reduce で1回ずつ求める
+#     (uint8 のまま 32bit 整数に合計するので、int64 の一時配列を作らない)
+#   - しきい値モードでは「暗い芯」だけを残し、反射や影の影響を減らす
+#       'NONE'      : しきい値なし (全画素の暗さで重み付け。従来の計算と同じ)
+#       'OTSU'      : 大津の方法で暗い側と明るい側を分ける
+#       'PERCENTILE': 暗い方から dark_percentile % の画素だけを使う
+#   - 重心 (x, y) に加えて、暗い領域の面積と広がり (標準偏差) も返す
+#   - 行・列ごとの重み (プロファイル) を付けられる。重みは画像サイズごとに float32 のベクトルとして
+#     1回だけ作り、毎フレームは行列とベクトルの積2回で重心を求める
+#       行: 'UNIFORM' / 'PERSPECTIVE' (奥=地平線より上を 1、手前の床に向かって near_weight まで下げる)
+#       列: 'UNIFORM' / 'CENTER' (中央を重くするガウス型)
+#       どちらも数値の列を渡せば、画像の高さ・幅に合わせて補間して使う
+#   - 重心は低周波の量なので、32〜64px 幅のサムネイルで十分な精度が出る (gravity_validate.py で確認)
+#       gravity_thumbnail       : フレームを INTER_AREA で直接サムネイルに縮小してからグレースケールにする
+#       decode_mjpeg_thumbnail  : カメラが MJPEG を送ってくる場合、JPEG を 1/8 (DC 成分相当) で
+#                                 グレースケールのまま展開する (全画素の展開・色変換をしない)
+
+import cv2
+import numpy as np
+
+GRAVITY_THRESHOLD_MODES = ('NONE', 'OTSU', 'PERCENTILE')
+
+
+def profile_weights(profile, length, horizon=0.5, near_weight=0.2, center_sigma=0.35):
+    """
+    重みのプロファイルを長さ length の float32 ベクトルにする。
+    horizon / near_weight: 'PERSPECTIVE' の地平線の位置 (高さに対する割合) と一番手前の行の重み
+    center_sigma: 'CENTER' のガウスの幅 (幅に対する割合)
+    """
+    position = np.linspace(0.0, 1.0, length, dtype=np.float32)
+    if isinstance(profile, str):
+        if profile == 'UNIFORM':
+            return np.ones(length, dtype=np.float32)
+        if profile == 'PERSPECTIVE':
+            below = np.clip((position - horizon) / max(1.0 - horizon, 1e-6), 0.0, 1.0)
+            return (1.0 - (1.0 - near_weight) * below).astype(np.float32)
+        if profile == 'CENTER':
+            return np.exp(-0.5 * ((position - 0.5) / center_sigma) ** 2).astype(np.float32)
+        raise ValueError(f"未知の重みプロファイル '{profile}'")
+    values = np.asarray(profile, dtype=np.float32)
+    return np.interp(position, np.linspace(0.0, 1.0, len(values)), values).astype(np.float32)
+
+
+def gravity_thumbnail(frame, width):
+    """フレーム (BGR またはグレースケール) を幅 width のグレースケールのサムネイルにする。"""
+    orig_height, orig_width = frame.shape[:2]
+    height = max(1, int(round(width * orig_height / orig_width)))
+    thumbnail = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+    if thumbnail.ndim == 3:
+        thumbnail = cv2.cvtColor(thumbnail, cv2.COLOR_BGR2GRAY)
+    return thumbnail
+
+
+def to_resized_coordinate(value, scale):
+    """サムネイルの画素座標を scale 倍した画像の画素座標に直す (画素の中心どうしを対応させる)。"""
+    return (value + 0.5) * scale - 0.5
+
+
+def decode_mjpeg_thumbnail(jpeg_data, width=None):
+    """
+    JPEG のバイト列を 1/8 の大きさのグレースケールで展開する (IMREAD_REDUCED_GRAYSCALE_8)。
+    width を指定すると、さらに INTER_AREA で幅 width に縮小する。展開できなければ None。
+    """
+    thumbnail = cv2.imdecode(np.frombuffer(jpeg_data, dtype=np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    if thumbnail is None:
+        return None
+    if width is not None and thumbnail.shape[1] > width:
+        thumbnail = gravity_thumbnail(thumbnail, width)
+    return thumbnail
+
+
+def open_mjpeg_raw_capture(camera_index):
+    """
+    MJPEG のフレームを展開せずに (JPEG のバイト列のまま) 受け取るようにカメラを開く (V4L2)。
+    read() の結果が 1 行の uint8 配列 (= JPEG のバイト列) になる。
+    """
+    cap = cv2.VideoCapture(camera_index, cv2.CAP_V4L2)
+    cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
+    cap.set(cv2.CAP_PROP_CONVERT_RGB, 0)
+    return cap
+
+
+def is_raw_jpeg(frame):
+    """cap.read() の結果が展開前の JPEG のバイト列かどうか。"""
+    return frame.ndim == 1 or (frame.ndim == 2 and frame.shape[0] == 1)
+
+
+class GravityDetector:
+    """
+    グレースケール画像から暗い部分の重心を求める。
+    threshold_mode: 'NONE' / 'OTSU' / 'PERCENTILE'
+    dark_percentile: 'PERCENTILE' のとき、暗い方から何 % の画素を使うか
+    row_profile / column_profile: 行・列の重み (profile_weights を参照)
+    """
+
+    def __init__(self, threshold_mode='NONE', dark_percentile=20.0,
+                 row_profile='UNIFORM', column_profile='UNIFORM',
+                 horizon=0.5, near_weight=0.2, center_sigma=0.35):
+        if threshold_mode not in GRAVITY_THRESHOLD_MODES:
+            print(f"[重心] 未知のしきい値モード '{threshold_mode}'。'NONE' を使います。")
+            threshold_mode = 'NONE'
+        self.threshold_mode = threshold_mode
+        self.dark_percentile = dark_percentile
+        self.last_threshold = 255.0 # 直近に使った輝度のしきい値
+        self._coords = {} # 画像サイズ -> (x 座標, y 座標) の float32 ベクトル
+        self.row_profile = row_profile
+        self.column_profile = column_profile
+        self.profile_params = {'horizon': horizon, 'near_weight': near_weight, 'center_sigma': center_sigma}
+        self.weighted = not (isinstance(row_profile, str) and row_profile == 'UNIFORM'
+                             and isinstance(column_profile, str) and column_profile == 'UNIFORM')
+        self._weight_tables = {} # 画像サイズ -> (行の重み, 列の重み)
+
+    def coordinates(self, width, height):
+        """x, y 座標のベクトルを画像サイズごとに1回だけ作って使い回す。"""
+        key = (width, height)
+        if key not in self._coords:
+            self._coords[key] = (np.arange(width, dtype=np.float32), np.arange(height, dtype=np.float32))
+        return self._coords[key]
+
+    def weight_tables(self, width, height):
+        """行・列の重みのベクトルを画像サイズごとに1回だけ作って使い回す。"""
+        key = (width, height)
+        if key not in self._weight_tables:
+            row_weights = profile_weights(self.row_profile, height, **self.profile_params)
+            column_weights = profile_weights(self.column_profile, width, **self.profile_params)
+            self._weight_tables[key] = (row_weights, column_weights)
+        return self._weight_tables[key]
+
+    def darkness(self, gray):
+        """
+        重みにする暗さ画像 (uint8) を返す。しきい値より明るい画素は 0 にする。
+        self.last_threshold に使ったしきい値を入れる。
+        """
+        inverted = cv2.bitwise_not(gray)
+        if self.threshold_mode == 'NONE':
+            self.last_threshold = 255.0
+            return inverted
+        if self.threshold_mode == 'OTSU':
+            threshold, _ = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+        else:
+            histogram = cv2.calcHist([gray], [0], None, [256], [0, 256]).ravel()
+            cumulative = np.cumsum(histogram)
+            threshold = float(np.searchsorted(cumulative, cumulative[-1] * self.dark_percentile / 100.0))
+        self.last_threshold = float(threshold)
+        # 輝度 <= threshold (暗さ >= 255 - threshold) の画素だけ残す
+        _, dark = cv2.threshold(inverted, 254 - threshold, 0, cv2.THRESH_TOZERO)
+        return dark
+
+    def compute(self, gray):
+        """
+        暗い部分の重心を求める。
+        戻り値: dict(found, x, y, area, spread_x, spread_y, threshold)
+        暗い画素が無ければ found=False で、重心は画像中心を返す。
+        """
+        height, width = gray.shape[:2]
+        weights = self.darkness(gray)
+        if not self.weighted:
+            column_sums = cv2.reduce(weights, 0, cv2.REDUCE_SUM, dtype=cv2.CV_32S).ravel().astype(np.float32)
+            row_sums = cv2.reduce(weights, 1, cv2.REDUCE_SUM, dtype=cv2.CV_32S).ravel().astype(np.float32)
+        else:
+            # 画素 (y, x) の重み = 暗さ * 行の重み[y] * 列の重み[x]
+            row_weights, column_weights = self.weight_tables(width, height)
+            darkness = weights.astype(np.float32)
+            column_sums = (row_weights @ darkness) * column_weights
+            row_sums = (darkness @ column_weights) * row_weights
+        return self._moments(column_sums, row_sums, weights, width, height)
+
+    def _moments(self, column_sums, row_sums, weights, width, height):
+        """列・行ごとの重みの合計から重心・広がり・面積を求める。"""
+        x_coords, y_coords = self.coordinates(width, height)
+        total = float(column_sums.sum())
+        result = {'found': False, 'x': width / 2, 'y': height / 2, 'area': 0.0,
+                  'spread_x': 0.0, 'spread_y': 0.0, 'threshold': self.last_threshold}
+        if total <= 0:
+            return result
+        center_x = float(column_sums @ x_coords) / total
+        center_y = float(row_sums @ y_coords) / float(row_sums.sum())
+        result['found'] = True
+        result['x'] = center_x
+        result['y'] = center_y
+        result['spread_x'] = float(np.sqrt(max(0.0, float(column_sums @ (x_coords * x_coords)) / total - center_x ** 2)))
+        result['spread_y'] = float(np.sqrt(max(0.0, float(row_sums @ (y_coords * y_coords)) / float(row_sums.sum()) - center_y ** 2)))
+        result['area'] = cv2.countNonZero(weights) / float(width * height)
+        return result
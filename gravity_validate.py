@@ -0,0 +1,103 @@
+# ファイル名: gravity_validate.py
+# 重心検出をサムネイルで行った場合の精度と処理時間を、従来の計算 (RESIZE_WIDTH で全画素) と比べるスクリプト
+#
+# 録画した動画の各フレームについて
+#   - 基準: RESIZE_WIDTH に縮小 → グレースケール → 重心 (従来の gravity_thread_func と同じ)
+#   - 候補: THUMBNAIL_WIDTHS の各幅のサムネイル (INTER_AREA)
+#   - 候補: JPEG に圧縮したフレームを 1/8 のグレースケールで展開 (カメラが MJPEG を送る場合を模擬)
+# の重心の x のズレ量を求め、基準との差 (RESIZE_WIDTH 基準のピクセル) と1フレームの処理時間を表示する。
+# robot_vision_thread_headless.GRAVITY_THUMBNAIL_WIDTH を決めるのに使う。
+#
+# 使い方: python gravity_validate.py <動画ファイル> [<動画ファイル> ...]
+
+import sys
+import time
+import cv2
+import numpy as np
+from gravity_detection import (GravityDetector, gravity_thumbnail, decode_mjpeg_thumbnail,
+                               to_resized_coordinate)
+
+RESIZE_WIDTH = 240
+THUMBNAIL_WIDTHS = [32, 48, 64, 96]
+JPEG_QUALITY = 80 # MJPEG を模擬するときの JPEG の品質
+FRAME_STEP = 1
+
+
+def reference_x_difference(frame, detector):
+    """従来どおり RESIZE_WIDTH に縮小してから重心を求める。"""
+    orig_height, orig_width = frame.shape[:2]
+    resize_height = int(RESIZE_WIDTH * orig_height / orig_width)
+    resized_frame = cv2.resize(frame, (RESIZE_WIDTH, resize_height), interpolation=cv2.INTER_AREA)
+    gray_frame = cv2.cvtColor(resized_frame, cv2.COLOR_BGR2GRAY)
+    return detector.compute(gray_frame)['x'] - RESIZE_WIDTH / 2
+
+
+def thumbnail_x_difference(gray, detector):
+    """サムネイルで重心を求め、RESIZE_WIDTH 基準のズレ量にして返す。"""
+    scale = RESIZE_WIDTH / gray.shape[1]
+    return to_resized_coordinate(detector.compute(gray)['x'], scale) - RESIZE_WIDTH / 2
+
+
+def main():
+    video_paths = sys.argv[1:]
+    if not video_paths:
+        print("使い方: python gravity_validate.py <動画ファイル> [<動画ファイル> ...]")
+        return
+
+    detector = GravityDetector() # 従来と同じ計算 (しきい値なし・重みなし)
+    names = ['REFERENCE'] + [f'THUMB {w}px' for w in THUMBNAIL_WIDTHS] + ['MJPEG 1/8']
+    values = {name: [] for name in names}
+    times = {name: [] for name in names}
+
+    for video_path in video_paths:
+        cap = cv2.VideoCapture(video_path)
+        if not cap.isOpened():
+            print(f"エラー: 動画ファイル '{video_path}' を開けません。")
+            continue
+        frame_index = 0
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            if frame_index % FRAME_STEP == 0:
+                start = time.perf_counter()
+                values['REFERENCE'].append(reference_x_difference(frame, detector))
+                times['REFERENCE'].append(time.perf_counter() - start)
+
+                for width in THUMBNAIL_WIDTHS:
+                    name = f'THUMB {width}px'
+                    start = time.perf_counter()
+                    values[name].append(thumbnail_x_difference(gravity_thumbnail(frame, width), detector))
+                    times[name].append(time.perf_counter() - start)
+
+                # JPEG への圧縮はカメラ側の処理なので時間に含めない
+                ok, jpeg_data = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+                if ok:
+                    start = time.perf_counter()
+                    values['MJPEG 1/8'].append(thumbnail_x_difference(decode_mjpeg_thumbnail(jpeg_data), detector))
+                    times['MJPEG 1/8'].append(time.perf_counter() - start)
+                else:
+                    values['MJPEG 1/8'].append(np.nan)
+                    times['MJPEG 1/8'].append(np.nan)
+            frame_index += 1
+        cap.release()
+
+    if not values['REFERENCE']:
+        print("エラー: 評価できるフレームがありません。")
+        return
+
+    reference = np.array(values['REFERENCE'])
+    print(f"評価フレーム数: {len(reference)}")
+    print("-" * 70)
+    print(f"{'方式':<12} {'平均誤差[px]':>12} {'p95誤差[px]':>12} {'最大誤差[px]':>12} {'時間[ms]':>10}")
+    print("-" * 70)
+    for name in names:
+        error = np.abs(np.array(values[name]) - reference)
+        print(f"{name:<12} {np.nanmean(error):>12.3f} {np.nanpercentile(error, 95):>12.3f} "
+              f"{np.nanmax(error):>12.3f} {np.nanmean(times[name]) * 1000:>10.3f}")
+    print("-" * 70)
+    print(f"(誤差は RESIZE_WIDTH={RESIZE_WIDTH}px 基準のズレ量の差)")
+
+
+if __name__ == '__main__':
+    main()
@@ -4,6 +4,7 @@ import math
 import os # フォルダ操作のために追加
 import serial
 import time
+from line_detectors import create_line_detector
 
 # --- パラメータ設定 ---
 # Cannyエッジ検出の低閾値
@@ -32,6 +33,16 @@ ENABLE_SERIAL_COMMUNICATION = True
 CAMERA_INDEX = 0
 # ロボットのズレを判定する閾値 (ピクセル単位)
 THRESHOLD = 20
+# 線分検出バックエンド ('HOUGH' / 'LSD' / 'FLD')
+LINE_BACKEND = 'HOUGH'
+
+line_detector = create_line_detector(LINE_BACKEND,
+                                     canny_threshold1=CANNY_THRESHOLD1,
+                                     canny_threshold2=CANNY_THRESHOLD2,
+                                     hough_threshold=HOUGH_THRESHOLD,
+                                     min_line_length=HOUGH_MIN_LINE_LENGTH,
+                                     max_line_gap=HOUGH_MAX_LINE_GAP,
+                                     min_noise_area=MIN_NOISE_AREA)
 
 
 def process_frame(frame):
@@ -60,33 +71,17 @@ def process_frame(frame):
     adjusted = clahe.apply(blurred)
     blurred_again = cv2.GaussianBlur(adjusted, (7, 7), 0)
 
-    # --- 3. Cannyエッジ検出 ---
-    edges = cv2.Canny(blurred_again, CANNY_THRESHOLD1, CANNY_THRESHOLD2)
-
-    # --- ▼▼▼【統合】ラベリングによるノイズ除去 ▼▼▼ ---
-    num_labels, labels, stats, centroids = cv2.connectedComponentsWithStats(edges, connectivity=8)
-    cleaned_edges = np.zeros_like(edges)
-    for i in range(1, num_labels):
-        area = stats[i, cv2.CC_STAT_AREA]
-        if area > MIN_NOISE_AREA:
-            cleaned_edges[labels == i] = 255
-    # --- ▲▲▲【統合】ここまで ▲▲▲ ---
-
-    # --- 4. 確率的ハフ変換 ---
-    # 【変更】ノイズ除去後の `cleaned_edges` を使用
-    lines = cv2.HoughLinesP(cleaned_edges, 1, np.pi/180,
-                            threshold=HOUGH_THRESHOLD,
-                            minLineLength=HOUGH_MIN_LINE_LENGTH,
-                            maxLineGap=HOUGH_MAX_LINE_GAP)
+    # --- 3〜4. 線分検出 ---
+    # (HOUGH の場合は Canny + ラベリングによるノイズ除去 + 確率的ハフ変換)
+    segments = line_detector.detect(blurred_again)
 
     # 描画用のカラー画像を作成
     line_image = np.copy(resized_frame)
     diagonal_lines = []
 
     # --- 5. 線の描画と消失点の計算 ---
-    if lines is not None:
-        for line in lines:
-            x1, y1, x2, y2 = line[0]
+    if len(segments) > 0:
+        for x1, y1, x2, y2 in segments.astype(int):
             angle_rad = math.atan2(y2 - y1, x2 - x1)
             angle_deg = math.degrees(angle_rad)
             abs_angle_deg = abs(angle_deg)
@@ -156,8 +151,9 @@ def process_frame(frame):
         command = "S \n" # ほぼ中央
 
     # --- 6. 表示用に画像を結合 ---
-    # 【変更】ノイズ除去後のエッジ画像を表示
-    edges_colored = cv2.cvtColor(cleaned_edges, cv2.COLOR_GRAY2BGR)
+    # 【変更】ノイズ除去後のエッジ画像を表示 (エッジ画像を作らないバックエンドは前処理画像)
+    edge_view = line_detector.edges if line_detector.edges is not None else blurred_again
+    edges_colored = cv2.cvtColor(edge_view, cv2.COLOR_GRAY2BGR)
 
     h1, w1 = line_image.shape[:2]
     h2, w2 = edges_colored.shape[:2]
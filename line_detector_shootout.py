@@ -0,0 +1,139 @@
+# ファイル名: line_detector_shootout.py
+# 線分検出バックエンド (HOUGH / LSD / FLD) の比較ベンチマーク
+#
+# 録画したパイプ内の動画を読み込み、操舵スレッドと同じ前処理をかけてから
+# 各バックエンドで線分検出 → 消失点計算を行い、
+#   - 1フレームあたりの処理時間 (平均 / 95パーセンタイル)
+#   - 消失点が求まったフレームの割合
+#   - 基準バックエンド (REFERENCE_BACKEND) の消失点とのズレ
+# を表示する。カメラごとに最も速くて精度の良いバックエンドを選ぶために使う。
+#
+# 使い方: python line_detector_shootout.py <動画ファイル> [<動画ファイル> ...]
+
+import sys
+import time
+import cv2
+import numpy as np
+from line_detectors import (available_backends, create_line_detector,
+                            filter_diagonal_lines, estimate_vanishing_point)
+
+# --- パラメータ (robot_vision_thread_headless.steering_thread_func と同じ値) ---
+RESIZE_WIDTH = 240
+MIN_NOISE_AREA = 80
+CANNY_THRESHOLD1 = 100
+CANNY_THRESHOLD2 = 150
+HOUGH_THRESHOLD = 35
+HOUGH_MIN_LINE_LENGTH = 35
+HOUGH_MAX_LINE_GAP = 10
+CLIP_LIMIT = 15.0
+TILE_GRID_SIZE = (4, 4)
+
+# 消失点の比較の基準にするバックエンド
+REFERENCE_BACKEND = 'HOUGH'
+# 基準と「一致」とみなす消失点 x のズレ (ピクセル)
+AGREEMENT_TOLERANCE_PX = 5
+# 何フレームごとに評価するか (1なら全フレーム)
+FRAME_STEP = 1
+# 評価する最大フレーム数 (0なら最後まで)
+MAX_FRAMES = 0
+
+
+def preprocess(frame, clahe):
+    """操舵スレッドと同じ前処理 (リサイズ → グレースケール → CLAHE → ぼかし)"""
+    orig_height, orig_width = frame.shape[:2]
+    resize_height = int(RESIZE_WIDTH * orig_height / orig_width)
+    resized_frame = cv2.resize(frame, (RESIZE_WIDTH, resize_height), interpolation=cv2.INTER_AREA)
+    gray = cv2.cvtColor(resized_frame, cv2.COLOR_BGR2GRAY)
+    adjusted = clahe.apply(gray)
+    return cv2.GaussianBlur(adjusted, (7, 7), 0)
+
+
+def load_frames(video_paths):
+    """動画から評価用のフレーム (前処理済み) を読み込む。"""
+    clahe = cv2.createCLAHE(clipLimit=CLIP_LIMIT, tileGridSize=TILE_GRID_SIZE)
+    frames = []
+    for video_path in video_paths:
+        cap = cv2.VideoCapture(video_path)
+        if not cap.isOpened():
+            print(f"エラー: 動画ファイル '{video_path}' を開けません。")
+            continue
+        frame_index = 0
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            if frame_index % FRAME_STEP == 0:
+                frames.append(preprocess(frame, clahe))
+            frame_index += 1
+            if MAX_FRAMES and len(frames) >= MAX_FRAMES:
+                break
+        cap.release()
+    return frames
+
+
+def run_backend(backend, frames):
+    """1つのバックエンドで全フレームを処理し、処理時間 (秒) と消失点のリストを返す。"""
+    detector = create_line_detector(backend,
+                                    canny_threshold1=CANNY_THRESHOLD1,
+                                    canny_threshold2=CANNY_THRESHOLD2,
+                                    hough_threshold=HOUGH_THRESHOLD,
+                                    min_line_length=HOUGH_MIN_LINE_LENGTH,
+                                    max_line_gap=HOUGH_MAX_LINE_GAP,
+                                    min_noise_area=MIN_NOISE_AREA)
+    latencies = []
+    vanishing_points = []
+    for image in frames:
+        height, width = image.shape[:2]
+        start = time.perf_counter()
+        segments = detector.detect(image)
+        slopes, intercepts, _ = filter_diagonal_lines(segments)
+        vanishing_point = estimate_vanishing_point(slopes, intercepts, width, height)
+        latencies.append(time.perf_counter() - start)
+        vanishing_points.append(vanishing_point)
+    return np.array(latencies), vanishing_points
+
+
+def compare_vanishing_points(vanishing_points, reference_points):
+    """両方で消失点が求まったフレームについて、x のズレの平均と一致率を返す。"""
+    diffs = [abs(vp[0] - ref[0]) for vp, ref in zip(vanishing_points, reference_points)
+             if vp is not None and ref is not None]
+    if not diffs:
+        return None, None
+    diffs = np.array(diffs)
+    return float(np.mean(diffs)), float(np.mean(diffs <= AGREEMENT_TOLERANCE_PX) * 100)
+
+
+def main():
+    video_paths = sys.argv[1:]
+    if not video_paths:
+        print("使い方: python line_detector_shootout.py <動画ファイル> [<動画ファイル> ...]")
+        return
+
+    frames = load_frames(video_paths)
+    if not frames:
+        print("エラー: 評価できるフレームがありません。")
+        return
+    print(f"評価フレーム数: {len(frames)} (幅 {RESIZE_WIDTH}px)")
+
+    backends = available_backends()
+    results = {backend: run_backend(backend, frames) for backend in backends}
+    reference_points = results[REFERENCE_BACKEND][1]
+
+    print("-" * 78)
+    print(f"{'backend':<8} {'平均[ms]':>9} {'p95[ms]':>9} {'消失点検出率':>12} "
+          f"{'基準との差[px]':>14} {'一致率(±' + str(AGREEMENT_TOLERANCE_PX) + 'px)':>14}")
+    print("-" * 78)
+    for backend in backends:
+        latencies, vanishing_points = results[backend]
+        found_rate = np.mean([vp is not None for vp in vanishing_points]) * 100
+        mean_diff, agreement = compare_vanishing_points(vanishing_points, reference_points)
+        mean_diff_text = f"{mean_diff:.2f}" if mean_diff is not None else "N/A"
+        agreement_text = f"{agreement:.1f}%" if agreement is not None else "N/A"
+        print(f"{backend:<8} {latencies.mean() * 1000:>9.2f} {np.percentile(latencies, 95) * 1000:>9.2f} "
+              f"{found_rate:>11.1f}% {mean_diff_text:>14} {agreement_text:>14}")
+    print("-" * 78)
+    print(f"(基準バックエンド: {REFERENCE_BACKEND})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,220 @@
+# ファイル名: line_detectors.py
+# (robot_vision_thread_headless.py と同じフォルダに保存してください)
+#
+# 線分検出器 (バックエンド) を差し替えられるようにするためのモジュール。
+# どのバックエンドも「前処理済みのグレースケール画像」を受け取り、
+# (N, 4) の float32 配列 [x1, y1, x2, y2] を返す。
+# detect() に FrameDeadline を渡すと、内部のステージの間でも締切を確認する。
+#   - 'HOUGH' : 従来の Canny + (ラベリングによるノイズ除去) + HoughLinesP
+#   - 'LSD'   : cv2.createLineSegmentDetector
+#   - 'FLD'   : cv2.ximgproc.createFastLineDetector (opencv-contrib がある場合のみ)
+
+import cv2
+import numpy as np
+
+# 線分が見つからなかったときに返す空配列
+EMPTY_SEGMENTS = np.zeros((0, 4), dtype=np.float32)
+
+
+def remove_small_components(edges, min_noise_area):
+    """
+    ラベリングで面積 min_noise_area 以下の連結成分を取り除いたエッジ画像を返す。
+    (ラベルごとのループをやめ、ルックアップテーブル1回で処理する)
+    """
+    num_labels, labels, stats, centroids = cv2.connectedComponentsWithStats(edges, connectivity=8)
+    keep = stats[:, cv2.CC_STAT_AREA] > min_noise_area
+    keep[0] = False # 背景
+    lut = np.where(keep, 255, 0).astype(np.uint8)
+    return lut[labels]
+
+
+def to_segments(lines):
+    """OpenCV の検出結果 (None / (N,1,4) / (N,4)) を (N, 4) の float32 配列にそろえる。"""
+    if lines is None or len(lines) == 0:
+        return EMPTY_SEGMENTS
+    return np.asarray(lines, dtype=np.float32).reshape(-1, 4)
+
+
+class HoughLineDetector:
+    """従来の Canny + HoughLinesP。min_noise_area > 0 ならラベリングでノイズを除去する。"""
+
+    name = 'HOUGH'
+
+    def __init__(self, canny_threshold1=100, canny_threshold2=150,
+                 hough_threshold=35, min_line_length=35, max_line_gap=10,
+                 min_noise_area=0):
+        self.canny_threshold1 = canny_threshold1
+        self.canny_threshold2 = canny_threshold2
+        self.hough_threshold = hough_threshold
+        self.min_line_length = min_line_length
+        self.max_line_gap = max_line_gap
+        self.min_noise_area = min_noise_area
+        self.edges = None # 直近のエッジ画像 (表示用)
+
+    def clean_edges(self, edges):
+        return remove_small_components(edges, self.min_noise_area)
+
+    def find_edges(self, image):
+        edges = cv2.Canny(image, self.canny_threshold1, self.canny_threshold2)
+        if self.min_noise_area > 0:
+            edges = self.clean_edges(edges)
+        return edges
+
+    def find_lines(self, edges):
+        lines = cv2.HoughLinesP(edges, 1, np.pi / 180,
+                                threshold=self.hough_threshold,
+                                minLineLength=self.min_line_length,
+                                maxLineGap=self.max_line_gap)
+        return to_segments(lines)
+
+    def detect(self, image, deadline=None):
+        self.edges = self.find_edges(image)
+        if deadline is not None:
+            deadline.check('edges', next_stage='lines')
+        return self.find_lines(self.edges)
+
+
+class LsdLineDetector:
+    """cv2.createLineSegmentDetector。エッジ画像を作らずに勾配から直接線分を求める。"""
+
+    name = 'LSD'
+
+    def __init__(self, min_line_length=35, **unused):
+        self.min_line_length = min_line_length
+        self.edges = None # LSD はエッジ画像を作らない
+        self._lsd = cv2.createLineSegmentDetector(cv2.LSD_REFINE_NONE)
+
+    def detect(self, image, deadline=None):
+        lines = self._lsd.detect(image)[0]
+        return filter_short_segments(to_segments(lines), self.min_line_length)
+
+
+class FastLineDetector:
+    """cv2.ximgproc.createFastLineDetector (opencv-contrib-python が必要)。"""
+
+    name = 'FLD'
+
+    def __init__(self, canny_threshold1=100, canny_threshold2=150,
+                 min_line_length=35, distance_threshold=1.414, do_merge=True, **unused):
+        self.min_line_length = min_line_length
+        self.edges = None
+        self._fld = cv2.ximgproc.createFastLineDetector(
+            int(min_line_length), distance_threshold,
+            canny_threshold1, canny_threshold2, 3, do_merge)
+
+    def detect(self, image, deadline=None):
+        lines = self._fld.detect(image)
+        return filter_short_segments(to_segments(lines), self.min_line_length)
+
+
+LINE_DETECTOR_BACKENDS = {
+    'HOUGH': HoughLineDetector,
+    'LSD': LsdLineDetector,
+    'FLD': FastLineDetector,
+}
+
+
+def available_backends():
+    """この環境で使えるバックエンド名のリストを返す。"""
+    backends = ['HOUGH']
+    if hasattr(cv2, 'createLineSegmentDetector'):
+        backends.append('LSD')
+    if hasattr(cv2, 'ximgproc') and hasattr(cv2.ximgproc, 'createFastLineDetector'):
+        backends.append('FLD')
+    return backends
+
+
+def create_line_detector(backend='HOUGH', **params):
+    """
+    バックエンド名から線分検出器を作る。
+    使えないバックエンドが指定された場合は 'HOUGH' にフォールバックする。
+    """
+    backend = backend.upper()
+    if backend not in available_backends():
+        print(f"[線分検出] 警告: バックエンド '{backend}' は使えません。HOUGH を使用します。")
+        backend = 'HOUGH'
+    return LINE_DETECTOR_BACKENDS[backend](**params)
+
+
+# ===================================================================
+# 線分の幾何計算 (全スレッド・スクリプト共通, NumPy でベクトル化)
+# ===================================================================
+def filter_short_segments(segments, min_line_length):
+    """長さが min_line_length 未満の線分を取り除く。"""
+    if len(segments) == 0:
+        return segments
+    dx = segments[:, 2] - segments[:, 0]
+    dy = segments[:, 3] - segments[:, 1]
+    return segments[np.hypot(dx, dy) >= min_line_length]
+
+
+def segment_angles_deg(segments):
+    """各線分の角度の絶対値 (0〜180度) を返す。"""
+    dx = segments[:, 2] - segments[:, 0]
+    dy = segments[:, 3] - segments[:, 1]
+    return np.abs(np.degrees(np.arctan2(dy, dx)))
+
+
+def filter_diagonal_lines(segments, vertical_range=(50, 130)):
+    """
+    水平・垂直に近い線分を除き、残った斜め線の (傾き m, 切片 c) を返す。
+    戻り値: (slopes, intercepts, kept_segments)
+    """
+    if len(segments) == 0:
+        empty = np.zeros(0, dtype=np.float64)
+        return empty, empty, segments
+    abs_angle_deg = segment_angles_deg(segments)
+    is_horizontal = (abs_angle_deg <= 10) | (abs_angle_deg >= 175)
+    is_vertical = (abs_angle_deg >= vertical_range[0]) & (abs_angle_deg <= vertical_range[1])
+    dx = (segments[:, 2] - segments[:, 0]).astype(np.float64)
+    keep = ~is_horizontal & ~is_vertical & (dx != 0)
+    kept = segments[keep]
+    x1, y1 = kept[:, 0].astype(np.float64), kept[:, 1].astype(np.float64)
+    slopes = (kept[:, 3] - y1) / dx[keep]
+    intercepts = y1 - slopes * x1
+    return slopes, intercepts, kept
+
+
+def intersect_line_pairs(slopes, intercepts, width, height, opposite_slopes_only=True):
+    """
+    すべての線の組の交点を求め、画像の周辺 (幅・高さの1倍以内) にあるものだけを返す。
+    opposite_slopes_only=True なら、傾きの符号が逆の組 (左右のパイプ縁) だけを使う。
+    戻り値: (N, 2) の配列
+    """
+    n = len(slopes)
+    if n < 2:
+        return np.zeros((0, 2), dtype=np.float64)
+    i, j = np.triu_indices(n, k=1)
+    m1, m2 = slopes[i], slopes[j]
+    c1, c2 = intercepts[i], intercepts[j]
+    valid = np.abs(m1 - m2) >= 1e-5
+    if opposite_slopes_only:
+        valid &= (m1 * m2) <= 0
+    m1, m2, c1, c2 = m1[valid], m2[valid], c1[valid], c2[valid]
+    x = (c2 - c1) / (m1 - m2)
+    y = m1 * x + c1
+    inside = (-width < x) & (x < width * 2) & (-height < y) & (y < height * 2)
+    return np.column_stack((x[inside], y[inside]))
+
+
+def estimate_vanishing_point(slopes, intercepts, width, height, opposite_slopes_only=True):
+    """交点の中央値を消失点 (vp_x, vp_y) として返す。求まらなければ None。"""
+    points = intersect_line_pairs(slopes, intercepts, width, height, opposite_slopes_only)
+    if len(points) == 0:
+        return None
+    return int(np.median(points[:, 0])), int(np.median(points[:, 1]))
+
+
+def select_vertical_segments(segments, vertical_range=(80, 100)):
+    """角度が vertical_range (度) に入るほぼ垂直な線分だけを返す。"""
+    if len(segments) == 0:
+        return segments
+    abs_angle_deg = segment_angles_deg(segments)
+    return segments[(abs_angle_deg >= vertical_range[0]) & (abs_angle_deg <= vertical_range[1])]
+
+
+def vanishing_point_inliers(slopes, intercepts, vanishing_point, max_distance=3.0):
+    """消失点からの距離が max_distance (ピクセル) 以内の線 (インライア) を表すブールマスクを返す。"""
+    vp_x, vp_y = vanishing_point
+    distance = np.abs(slopes * vp_x - vp_y + intercepts) / np.sqrt(slopes ** 2 + 1)
+    return distance <= max_distance
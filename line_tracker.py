@@ -0,0 +1,173 @@
+# ファイル名: line_tracker.py
+# (robot_vision_thread_headless.py と同じフォルダに保存してください)
+#
+# パイプの縁 (左右の斜め線) をフレーム間で追跡し、次のフレームでは
+# 「予測した線の周りの細い帯 (バンド)」だけでエッジ検出と線分検出を行うためのモジュール。
+#   - 左の縁 (傾き < 0) と右の縁 (傾き > 0) を、それぞれ上端・下端の x 座標で表す
+#   - 直近2回の位置から等速で次の位置を予測する
+#   - 一定フレームごと、または追跡を失ったときは全画面を探索する
+
+import cv2
+import numpy as np
+
+# バンドを分割する長さ (ピクセル)。斜めの線でも外接矩形が小さくなるようにする
+BAND_CHUNK_LENGTH = 24
+
+
+def segment_band_chunks(xa, ya, xb, yb, half_width, width, height, chunk_length=BAND_CHUNK_LENGTH):
+    """
+    線分 (xa, ya)-(xb, yb) の周り半幅 half_width の帯を、線分の長い方向に
+    chunk_length ごとに区切り、それぞれの外接矩形 (x0, y0, x1, y1) を返す。
+    """
+    length = max(abs(xb - xa), abs(yb - ya))
+    num_chunks = max(1, int(np.ceil(length / chunk_length)))
+    chunks = []
+    for k in range(num_chunks):
+        t0, t1 = k / num_chunks, (k + 1) / num_chunks
+        px0, px1 = xa + (xb - xa) * t0, xa + (xb - xa) * t1
+        py0, py1 = ya + (yb - ya) * t0, ya + (yb - ya) * t1
+        x0 = max(0, int(min(px0, px1)) - half_width)
+        x1 = min(width, int(max(px0, px1)) + half_width + 1)
+        y0 = max(0, int(min(py0, py1)) - half_width)
+        y1 = min(height, int(max(py0, py1)) + half_width + 1)
+        if x1 > x0 and y1 > y0:
+            chunks.append((x0, y0, x1, y1))
+    return chunks
+
+
+class EdgeTrack:
+    """片側のパイプ縁の位置 (y_top, y_bottom での x 座標) の履歴"""
+
+    def __init__(self):
+        self.history = [] # [(x_top, x_bottom, y_top, y_bottom), ...] 新しいものが最後
+
+    def add(self, x_top, x_bottom, y_top, y_bottom, max_history):
+        self.history.append((x_top, x_bottom, y_top, y_bottom))
+        del self.history[:-max_history]
+
+    def predict(self, velocity_gain):
+        """次のフレームでの位置を等速予測する。履歴がなければ None。"""
+        if not self.history:
+            return None
+        x_top, x_bottom, y_top, y_bottom = self.history[-1]
+        if len(self.history) >= 2:
+            prev_top, prev_bottom = self.history[-2][:2]
+            x_top += velocity_gain * (x_top - prev_top)
+            x_bottom += velocity_gain * (x_bottom - prev_bottom)
+        return x_top, x_bottom, y_top, y_bottom
+
+
+class LineBandTracker:
+    """
+    前フレームで採用した斜め線の周りのバンドだけを探索する追跡器。
+    detect() で線分を求め、消失点計算に使った斜め線を update() で渡す。
+    """
+
+    def __init__(self, band_half_width=8, full_search_interval=10,
+                 max_history=3, velocity_gain=0.5):
+        self.band_half_width = band_half_width
+        self.full_search_interval = full_search_interval
+        self.max_history = max_history
+        self.velocity_gain = velocity_gain
+        self.tracks = {'left': EdgeTrack(), 'right': EdgeTrack()}
+        self.frames_since_full_search = full_search_interval # 最初のフレームは全画面探索
+        self.lost = True
+        self.last_pixel_ratio = 1.0 # 直近フレームで処理した画素の割合 (全画面=1.0)
+
+    def reset(self):
+        self.tracks = {'left': EdgeTrack(), 'right': EdgeTrack()}
+        self.lost = True
+
+    def needs_full_search(self):
+        return self.lost or self.frames_since_full_search >= self.full_search_interval
+
+    def predicted_lines(self):
+        """予測した左右の縁を [(x_top, x_bottom, y_top, y_bottom), ...] で返す。"""
+        predictions = [track.predict(self.velocity_gain) for track in self.tracks.values()]
+        return [p for p in predictions if p is not None]
+
+    def band_chunks(self, predictions, width, height):
+        """各バンドを小さな外接矩形 (x0, y0, x1, y1) に区切ったリストを返す。"""
+        chunks = []
+        for x_top, x_bottom, y_top, y_bottom in predictions:
+            chunks.extend(segment_band_chunks(x_top, y_top, x_bottom, y_bottom,
+                                              self.band_half_width, width, height))
+        return chunks
+
+    def band_mask(self, predictions, shape):
+        """予測した線を太さ 2*band_half_width で描いたマスク画像を返す。"""
+        mask = np.zeros(shape, dtype=np.uint8)
+        for x_top, x_bottom, y_top, y_bottom in predictions:
+            cv2.line(mask, (int(x_top), int(y_top)), (int(x_bottom), int(y_bottom)),
+                     255, 2 * self.band_half_width + 1)
+        return mask
+
+    def detect(self, image, line_detector, deadline=None):
+        """
+        追跡中ならバンド内だけ、そうでなければ全画面で線分を検出する。
+        エッジ画像を作るバックエンド (HOUGH) はバンドの小矩形ごとに Canny をかけ、
+        それ以外のバックエンドはバンド全体の外接矩形を切り出して検出する。
+        """
+        height, width = image.shape[:2]
+        self.frames_since_full_search += 1
+        predictions = None if self.needs_full_search() else self.predicted_lines()
+        chunks = self.band_chunks(predictions, width, height) if predictions else []
+        if predictions and not chunks:
+            self.reset() # 予測したバンドが画面の外: 追跡を失ったとみなす
+        if not chunks:
+            self.frames_since_full_search = 0
+            self.last_pixel_ratio = 1.0
+            return line_detector.detect(image, deadline)
+
+        self.last_pixel_ratio = sum((x1 - x0) * (y1 - y0) for x0, y0, x1, y1 in chunks) / float(width * height)
+        mask = self.band_mask(predictions, (height, width))
+
+        if hasattr(line_detector, 'find_edges'):
+            edges = np.zeros((height, width), dtype=np.uint8)
+            for x0, y0, x1, y1 in chunks:
+                edges[y0:y1, x0:x1] = cv2.Canny(image[y0:y1, x0:x1],
+                                                 line_detector.canny_threshold1,
+                                                 line_detector.canny_threshold2)
+            cv2.bitwise_and(edges, mask, dst=edges)
+            bx0, by0 = min(c[0] for c in chunks), min(c[1] for c in chunks)
+            bx1, by1 = max(c[2] for c in chunks), max(c[3] for c in chunks)
+            if line_detector.min_noise_area > 0:
+                edges[by0:by1, bx0:bx1] = line_detector.clean_edges(edges[by0:by1, bx0:bx1])
+            line_detector.edges = edges
+            if deadline is not None:
+                deadline.check('edges', next_stage='lines')
+            return line_detector.find_lines(edges)
+
+        bx0, by0 = min(c[0] for c in chunks), min(c[1] for c in chunks)
+        bx1, by1 = max(c[2] for c in chunks), max(c[3] for c in chunks)
+        self.last_pixel_ratio = (bx1 - bx0) * (by1 - by0) / float(width * height)
+        segments = line_detector.detect(image[by0:by1, bx0:bx1], deadline)
+        if len(segments) == 0:
+            return segments
+        segments = segments + np.array([bx0, by0, bx0, by0], dtype=np.float32)
+        # バンドの外 (中点がマスク外) の線分は捨てる
+        mid_x = np.clip(((segments[:, 0] + segments[:, 2]) / 2).astype(int), 0, width - 1)
+        mid_y = np.clip(((segments[:, 1] + segments[:, 3]) / 2).astype(int), 0, height - 1)
+        return segments[mask[mid_y, mid_x] > 0]
+
+    def update(self, slopes, intercepts, diagonal_segments, found):
+        """
+        消失点計算に使った斜め線で追跡状態を更新する。
+        found=False (消失点が求まらなかった) か、片側でも線が無ければ追跡を失ったとみなす。
+        """
+        if not found or len(diagonal_segments) == 0:
+            self.reset()
+            return
+        for side, side_mask in (('left', slopes < 0), ('right', slopes > 0)):
+            if not np.any(side_mask):
+                self.reset()
+                return
+            side_segments = diagonal_segments[side_mask]
+            y_top = float(np.min(side_segments[:, [1, 3]]))
+            y_bottom = float(np.max(side_segments[:, [1, 3]]))
+            m = slopes[side_mask]
+            c = intercepts[side_mask]
+            x_top = float(np.median((y_top - c) / m))
+            x_bottom = float(np.median((y_bottom - c) / m))
+            self.tracks[side].add(x_top, x_bottom, y_top, y_bottom, self.max_history)
+        self.lost = False
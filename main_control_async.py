@@ -0,0 +1,228 @@
+# ファイル名: main_control_async.py
+# (main_control_thread_serial.py と同じフォルダに保存してください)
+#
+# カメラ・検出・シリアル・制御 (と GoPro) を asyncio の1つのイベントループにまとめた版。
+#   - カメラの読み込みと検出: main_control_thread_serial.py と同じく、検出器の登録簿 (detector_registry.py) が
+#     操舵モードに必要な検出器だけを起動する (VISION_RUNTIME に合わせてスレッドまたは別プロセス)
+#   - シリアル: pyserial-asyncio があれば非同期の transport で読み書きする。なければ専用の1スレッドの executor で読み書きする
+#     (どちらでも serial.write() でイベントループが止まらない)
+#   - 制御: 一定周期のタイマーで動くタスク。次の周期は絶対時刻で決めるので、処理時間の分だけ周期がずれない
+#     1周期の判断 (スナップショット → コマンド) と操舵モードの切り替えは drive_control.py をスレッド版と共有する
+#     (SIGUSR1・シリアルの "MODE <操舵モード>" で切り替えられる)
+#   - GoPro (USE_GOPRO): gopro_test.py と同じく有線で接続して録画し、終了時に止めるタスク
+#   - Ctrl+C・検出スレッドからの停止要求で、タスクをキャンセルしてから検出スレッドを止めて後片付けする
+# 設定 (操舵モード・カメラ番号・シリアルポートなど) は main_control_thread_serial.py のものを使う。
+
+import asyncio
+import signal
+from concurrent.futures import ThreadPoolExecutor
+
+import serial
+
+try:
+    import serial_asyncio # pyserial-asyncio
+except ImportError:
+    serial_asyncio = None
+
+try:
+    from open_gopro import WiredGoPro
+except ImportError:
+    WiredGoPro = None
+
+import main_control_thread_serial as settings
+from vision_state import VisionState
+from process_runtime import SharedVisionState
+from drive_control import parse_mode_commands
+
+# 制御タスクの周期 (秒)
+CONTROL_PERIOD_SEC = settings.MAIN_LOOP_WAIT_SEC
+
+# GoPro で録画しながら走る場合は True (open_gopro が必要)
+USE_GOPRO = False
+
+
+class AsyncSerialPort:
+    """シリアルポートへの非同期の読み書き。開けなければ書き込みを捨てる (デバッグモード)。"""
+
+    def __init__(self):
+        self.reader = None # pyserial-asyncio の StreamReader
+        self.writer = None # pyserial-asyncio の StreamWriter
+        self.read_task = None # reader から received に読み込むタスク
+        self.received = bytearray() # まだ read_available() で渡していない受信データ
+        self.ser = None # pyserial-asyncio が無いときの serial.Serial
+        self.executor = None
+
+    async def open(self, port, baudrate):
+        try:
+            if serial_asyncio is not None:
+                self.reader, self.writer = await serial_asyncio.open_serial_connection(url=port, baudrate=baudrate)
+                self.read_task = asyncio.create_task(self._read_loop())
+            else:
+                # 書き込みの順番を保つため、シリアル専用の1スレッドで開く・書く
+                self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='serial')
+                loop = asyncio.get_running_loop()
+                self.ser = await loop.run_in_executor(self.executor,
+                                                      lambda: serial.Serial(port, baudrate, timeout=1))
+            print(f"[メイン]: シリアルポート ({port}) を開きました。")
+        except serial.SerialException as e:
+            print(f"[メイン] エラー: シリアルポート ({port}) を開けません。{e}")
+            print("[メイン]: シリアル通信なしで続行します（デバッグモード）。")
+
+    async def _read_loop(self):
+        """受信したデータを received に貯める (pyserial-asyncio のとき)。"""
+        while True:
+            data = await self.reader.read(256)
+            if not data:
+                return
+            self.received += data
+
+    async def read_available(self):
+        """前回から受信したデータを返す (無ければ空)。"""
+        try:
+            if self.ser is not None:
+                loop = asyncio.get_running_loop()
+                self.received += await loop.run_in_executor(self.executor,
+                                                            lambda: self.ser.read(self.ser.in_waiting))
+        except serial.SerialException as e:
+            print(f"[メイン] エラー: シリアル読み込み失敗。{e}")
+            await self.close()
+        data = bytes(self.received)
+        self.received.clear()
+        return data
+
+    async def write(self, text):
+        data = text.encode('utf-8')
+        try:
+            if self.writer is not None:
+                self.writer.write(data)
+                await self.writer.drain()
+            elif self.ser is not None:
+                await asyncio.get_running_loop().run_in_executor(self.executor, self.ser.write, data)
+        except serial.SerialException as e:
+            print(f"[メイン] エラー: シリアル書き込み失敗。{e}")
+            await self.close() # エラーが続くのを防ぐ
+
+    async def close(self):
+        if self.read_task is not None:
+            self.read_task.cancel()
+            self.read_task = None
+        self.reader = None
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+            print("[メイン]: シリアルポートを閉じました。")
+        if self.ser is not None:
+            await asyncio.get_running_loop().run_in_executor(self.executor, self.ser.close)
+            self.ser = None
+            print("[メイン]: シリアルポートを閉じました。")
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+
+
+async def control_task(state, port, controller):
+    """一定周期で操舵モードの切り替えとコマンドの判断 (drive_control.py) をしてコマンドを送る。停止要求で終わる。"""
+    loop = asyncio.get_running_loop()
+    late_ticks = 0 # 周期に間に合わなかった回数
+    serial_buffer = b'' # 受信した行の途中まで
+
+    print(f"[メイン]: 制御タスクを開始します。操舵モード: {controller.mode}, "
+          f"周期: {CONTROL_PERIOD_SEC * 1000:.0f} ms (Ctrl+Cで終了)")
+    next_tick = loop.time()
+    try:
+        while True:
+            # --- 操舵モードの切り替え (シリアルの MODE コマンド・SIGUSR1・検出器の失敗) ---
+            requested_modes, serial_buffer = parse_mode_commands(serial_buffer + await port.read_available())
+            for requested_mode in requested_modes:
+                controller.request_mode(requested_mode)
+            switch = controller.next_switch()
+            if switch is not None:
+                await port.write("H\n") # 検出器を止める・起動する間は止まっておく
+                # 検出器を止めるのを待つ間もイベントループ (GoPro など) を止めない
+                await loop.run_in_executor(None, controller.switch_mode, *switch)
+
+            if state.should_stop():
+                break
+
+            decision = controller.decide()
+            await port.write(f"{decision.command}\n")
+            print(controller.status_text(decision))
+
+            # --- 次の周期まで待つ (絶対時刻) ---
+            next_tick += CONTROL_PERIOD_SEC
+            delay = next_tick - loop.time()
+            if delay < 0:
+                late_ticks += 1
+                next_tick = loop.time() # 遅れた分を詰めて連続で回さない
+                delay = 0
+            await asyncio.sleep(delay)
+        print("[メイン]: スレッドからの停止要求を検出。制御タスクを終了します。")
+    finally:
+        print(f"[メイン]: 周期に遅れた回数: {late_ticks} 回")
+
+
+async def gopro_task():
+    """GoPro に有線で接続して録画を開始し、キャンセルされたら録画を止めて切断する。"""
+    if WiredGoPro is None:
+        print("[GoPro]: open_gopro がインストールされていないため使いません。")
+        return
+    gopro = WiredGoPro()
+    await gopro.open()
+    print("[GoPro]: 接続しました。録画を開始します。")
+    try:
+        await gopro.http_command.set_shutter(shutter=True)
+        await asyncio.Event().wait() # キャンセルされるまで録画を続ける
+    finally:
+        print("[GoPro]: 録画を停止します...")
+        await gopro.http_command.set_shutter(shutter=False)
+        await gopro.close()
+
+
+async def main_async():
+    use_process = (settings.VISION_RUNTIME == 'PROCESS')
+    state = SharedVisionState() if use_process else VisionState()
+    loop = asyncio.get_running_loop()
+
+    # --- 1. 操舵モードに必要な検出器を起動 (スレッド版と同じ登録簿・判断を使う) ---
+    cpu_policy, controller = settings.create_drive_controller(state, use_process)
+    print(f"[メイン]: {controller.mode} モードの検出器を起動します ({settings.VISION_RUNTIME})...")
+    controller.start()
+    # イベントループ (制御) の割り当ては、検出器を起動した後に
+    cpu_policy.apply_thread('control')
+    if settings.MODE_SWITCH_SIGNAL and hasattr(signal, 'SIGUSR1'):
+        loop.add_signal_handler(signal.SIGUSR1, controller.request_mode)
+
+    # --- 2. シリアル・制御・GoPro のタスク ---
+    port = AsyncSerialPort()
+    await port.open(settings.SERIAL_PORT, settings.SERIAL_BAUDRATE)
+    control = asyncio.create_task(control_task(state, port, controller))
+    tasks = [control]
+    if USE_GOPRO:
+        tasks.append(asyncio.create_task(gopro_task()))
+
+    try:
+        await control # 停止要求 (またはキャンセル) まで
+    finally:
+        # --- 3. 終了処理: タスクをキャンセルし、検出器を止めてから片付ける ---
+        print("[メイン]: 終了処理中...")
+        state.request_stop()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await loop.run_in_executor(None, controller.shutdown)
+        if use_process:
+            state.close()
+        await port.write("H\n") # 念のため停止コマンドを送ってから閉じる
+        await port.close()
+
+
+def main():
+    try:
+        asyncio.run(main_async())
+    except KeyboardInterrupt:
+        print("\n[メイン]: Ctrl+Cを検出しました。")
+    print("[メイン]: プログラムを終了します。")
+
+
+if __name__ == '__main__':
+    main()
@@ -5,6 +5,7 @@
 import time
 import threading 
 import cv2
+from frame_channel import FrameChannel
 # robot_vision_thread.py からスレッド用の関数をインポート
 from robot_vision_thread_display import steering_thread_func, wall_thread_func ,gravity_thread_func
 
@@ -41,11 +42,12 @@ def main():
         'steering_value': 0.0,
         'wall_detected': 0,
         'stop': False, 
-        'steering_frame': None, 
-        'wall_frame_right': None, # ★★★ 変更 ★★★
-        'wall_frame_left': None,   # ★★★ 変更 ★★★
+        # 表示用フレームはトリプルバッファで受け渡す (ロック不要・コピーなし)
+        'steering_frame': FrameChannel(), 
+        'wall_frame_right': FrameChannel(), # ★★★ 変更 ★★★
+        'wall_frame_left': FrameChannel(),   # ★★★ 変更 ★★★
         'gravity_value': 0.0,
-        'gravity_frame': None
+        'gravity_frame': FrameChannel()
     }
     
     lock = threading.Lock()
@@ -75,12 +77,6 @@ def main():
     
     print("[メイン]: 制御ループを開始します。操舵モード: {STEERING_MODE}'q'キーで終了します。")
     
-    # フレーム取得用の変数をループ外で初期化
-    frame_steering = None
-    frame_wall_right = None # ★★★ 変更 ★★★
-    frame_wall_left = None  # ★★★ 変更 ★★★
-    frame_gravity = None
-
     try:
         while True:
             current_time = time.time()
@@ -94,16 +90,12 @@ def main():
                 current_steering_diff = shared_state['steering_value']
                 current_gravity_diff = shared_state['gravity_value']
                 is_wall_detected = (shared_state['wall_detected'] == 1)
-                
-
-                if shared_state['steering_frame'] is not None:
-                    frame_steering = shared_state['steering_frame'].copy()
-                if shared_state['wall_frame_right'] is not None:
-                    frame_wall_right = shared_state['wall_frame_right'].copy()
-                if shared_state['wall_frame_left'] is not None:
-                    frame_wall_left = shared_state['wall_frame_left'].copy()
-                if shared_state['gravity_frame'] is not None:
-                    frame_gravity = shared_state['gravity_frame'].copy()                
+            
+            # 表示用フレームはロックの外で受け取る (読み取り専用ビュー。次の latest() まで書き換わらない)
+            frame_steering = shared_state['steering_frame'].latest()
+            frame_wall_right = shared_state['wall_frame_right'].latest() # ★★★ 変更 ★★★
+            frame_wall_left = shared_state['wall_frame_left'].latest()  # ★★★ 変更 ★★★
+            frame_gravity = shared_state['gravity_frame'].latest()
             
             # --- 4-2. 操舵コマンドを生成 ---
             steering_command = "S" 
@@ -3,17 +3,21 @@
 
 import serial # ★★★ シリアル通信ライブラリをインポート ★★★
 import time
-import threading 
+import signal
 # import cv2 # ★★★ GUIを使わないので不要 ★★★
 
 # ↓↓↓ ファイル名変更を推奨 ↓↓↓
 # robot_vision_thread_headless.py からスレッド用の関数をインポート
-from robot_vision_thread_headless import steering_thread_func, wall_thread_func ,gravity_thread_func
+from robot_vision_thread_headless import steering_thread_func, wall_thread_func ,gravity_thread_func, gravity_default_fps
 # ↑↑↑ ファイル名変更を推奨 ↑↑↑
-
-### --- ステートマシンの状態定義 ---
-STATE_DRIVING = 0
-STATE_STOPPED = 1
+from vision_state import VisionState
+from process_runtime import SharedVisionState
+from detector_registry import DetectorRegistry
+from detector_rates import DetectorRateScheduler
+from cpu_policy import CpuPolicy
+from detector_watchdog import DetectorWatchdog
+# 1周期ごとの判断 (スナップショット → コマンド) は main_control_async.py と共通 (drive_control.py)
+from drive_control import DriveController, parse_mode_commands, STATE_STOPPED
 
 ### --- 設定 ---
 # 停止・クールダウン
@@ -23,19 +27,72 @@ STOP_COOLDOWN_SEC = 10.0
 # ロボット制御
 STEERING_THRESHOLD = 20 
 
-#操舵モード
+#操舵モード (起動時。実行中は MODE_SWITCH_SIGNAL やシリアルの MODE コマンドで切り替えられる)
 STEERING_MODE = 'LINE_DETECT' 
 #STEERING_MODE = 'GRAVITY' # 重心検出を使う場合はこちらを有効化
+#STEERING_MODE = 'FUSION' # 消失点と重心をカルマンフィルタで統合する場合はこちらを有効化 (steering_fusion.py)
+
+# 操舵モードごとに動かす検出器 (detector_registry.py)。使わない検出器は起動せず、カメラも開かない
+MODE_DETECTORS = {
+    'LINE_DETECT': ('steering', 'wall'),
+    'GRAVITY': ('gravity', 'wall'),
+    'FUSION': ('steering', 'gravity', 'wall'),
+}
+# 実行中の操舵モードの切り替え (プログラムを書き換えずに済む)
+#   - シグナル: kill -USR1 <pid> で MODE_DETECTORS の順に次のモードへ
+#   - シリアル: Pico から "MODE GRAVITY\n" のような行を受け取るとそのモードへ
+# 切り替えたモードの検出器が起動できなければ、元のモードに戻す
+MODE_SWITCH_SIGNAL = True
+
+# FUSION モードでの消失点の処理レート (FPS)。間は毎フレームの重心で埋める
+FUSION_STEERING_FPS = 1
+
+# OpenCV の内部スレッド数と CPU の割り当て (cpu_policy.py, cpu_policy_benchmark.py で比較して決める)
+# 'DEFAULT' (OpenCV の既定) / 'SINGLE' (1) / 'SPLIT' (コア数 / 検出器の数) / 整数
+CPU_OPENCV_THREADS = 'SINGLE'
+# {役割: CPU 番号の集合} または None (割り当てない)。4コアのラズパイの例:
+# CPU_AFFINITY = {'control': {0}, 'capture': {0}, 'steering': {1}, 'wall': {2}, 'gravity': {3}}
+CPU_AFFINITY = None
+
+# 検出器の処理レートをロボットの状態と負荷に合わせて変える (detector_rates.py)
+# 直進中は壁検出を上げ、停止中は操舵を下げ、CPU 負荷・温度が高いときは全体を下げる
+ADAPTIVE_RATES = True
+STEERING_FPS = 2 # 操舵の通常のレート (FUSION モードでは FUSION_STEERING_FPS)
+STEERING_STOPPED_FPS = 0.5 # 停止中の操舵のレート
+WALL_FPS = 5 # 壁検出の通常のレート
+WALL_STRAIGHT_FPS = 8 # 直進中の壁検出のレート
+
+# 検出器の結果が古くなったら安全側に倒す (detector_watchdog.py)
+# 新しいデータが、期待する周期 (処理レート) の DEGRADE_INTERVALS 倍 (最低 DEGRADE_MIN_SEC 秒) 来なければ徐行、
+# HALT_INTERVALS 倍 (最低 HALT_MIN_SEC 秒) 来なければ停止 ("H" だけを送る)
+STALE_WATCHDOG = True
+WATCHDOG_DEGRADE_INTERVALS = 3
+WATCHDOG_DEGRADE_MIN_SEC = 1.0
+WATCHDOG_HALT_INTERVALS = 6
+WATCHDOG_HALT_MIN_SEC = 3.0
+# 処理レートが指定されていない (各スレッドの TARGET_FPS で動く) ときに期待する処理レート
+WATCHDOG_DEFAULT_FPS = {'steering': 2, 'wall': 5, 'gravity': 5}
 
 # カメラ設定
 CAMERA_INDEX_STEERING = 0 # 操舵用カメラの番号
 CAMERA_INDEX_WALL = 1     # 壁検出用カメラの番号
-CAMERA_INDEX_GRAVITY = 0 # 重心検出用カメラの番号
+CAMERA_INDEX_GRAVITY = 0 # 重心検出用カメラの番号 (操舵用と同じなら1台を共有する)
+
+# 検出器の動かし方
+# 'THREAD' : 1つのプロセスの中のスレッドで動かす (従来どおり)
+# 'PROCESS': 検出器ごとに別プロセスで動かす (GIL に詰まらず複数のコアを使う, process_runtime.py)
+VISION_RUNTIME = 'THREAD'
 
 # メインループの周期 (ミリ秒)
 MAIN_LOOP_WAIT_MS = 50 # 50ms
 MAIN_LOOP_WAIT_SEC = MAIN_LOOP_WAIT_MS / 1000.0 # ★★★ time.sleep() 用 ★★★
 
+# メインループの起こし方
+# True : 検出スレッドが共有辞書に結果を書き込んだら、すぐに起きてコマンドを送る (イベント駆動)
+# False: 従来どおり MAIN_LOOP_WAIT_SEC ごとに共有辞書を見に行く (ポーリング)
+EVENT_DRIVEN_LOOP = True
+MAIN_LOOP_SAFETY_TIMEOUT_SEC = 0.1 # イベント駆動でも、結果が来なければこの時間で起きてコマンドを送り直す
+
 
 # ★★★ シリアルポート設定 ★★★
 # ラズパイ4のGPIO (GP14, GP15) でPicoのUART (GP0, GP1など) と接続する場合
@@ -48,23 +105,84 @@ SERIAL_PORT = '/dev/ttyS0'
 SERIAL_BAUDRATE = 115200
 
 
+def create_drive_controller(state, use_process):
+    """
+    設定から CPU の方針・検出器の登録簿・処理レート・ウォッチドッグを作り、DriveController にまとめる
+    (main_control_async.py と共通)。検出器は DriveController.start() で起動する。
+    戻り値: (CpuPolicy, DriveController)
+    """
+    cpu_policy = CpuPolicy(CPU_OPENCV_THREADS, affinity=CPU_AFFINITY,
+                           num_detectors=len(MODE_DETECTORS[STEERING_MODE]))
+    cpu_policy.apply_process()
+    print(f"[メイン]: {cpu_policy.describe()}")
+    rate_scheduler = None
+    if ADAPTIVE_RATES:
+        rate_scheduler = DetectorRateScheduler(
+            state,
+            steering_fps=STEERING_FPS,
+            wall_fps=WALL_FPS,
+            gravity_default_fps=gravity_default_fps(),
+            steering_stopped_fps=STEERING_STOPPED_FPS,
+            wall_straight_fps=WALL_STRAIGHT_FPS)
+
+    watchdog = None
+    if STALE_WATCHDOG:
+        watchdog = DetectorWatchdog(state, WATCHDOG_DEFAULT_FPS,
+                                    degrade_intervals=WATCHDOG_DEGRADE_INTERVALS,
+                                    halt_intervals=WATCHDOG_HALT_INTERVALS,
+                                    degrade_min_sec=WATCHDOG_DEGRADE_MIN_SEC,
+                                    halt_min_sec=WATCHDOG_HALT_MIN_SEC)
+
+    # 各スレッド・プロセスは cpu_policy.run() から始め、役割ごとの CPU 設定を適用してから検出を始める
+    # 同じカメラを使う検出器どうし (操舵と重心) は、読み込みスレッド1つから配る
+    registry = DetectorRegistry(state, use_process=use_process, cpu_policy=cpu_policy)
+    registry.register('steering', steering_thread_func, CAMERA_INDEX_STEERING)
+    registry.register('wall', wall_thread_func, CAMERA_INDEX_WALL)
+    registry.register('gravity', gravity_thread_func, CAMERA_INDEX_GRAVITY)
+
+    controller = DriveController(state, registry, STEERING_MODE, MODE_DETECTORS,
+                                 steering_threshold=STEERING_THRESHOLD,
+                                 stop_duration_sec=STOP_DURATION_SEC,
+                                 stop_cooldown_sec=STOP_COOLDOWN_SEC,
+                                 steering_fps=STEERING_FPS,
+                                 fusion_steering_fps=FUSION_STEERING_FPS,
+                                 rate_scheduler=rate_scheduler,
+                                 watchdog=watchdog)
+    return cpu_policy, controller
+
+
+def send_command(ser, command):
+    """
+    コマンドを1行送る (Pico側で受信しやすいよう、末尾に改行を付ける)。
+    戻り値: 書き込みに失敗したら None (ポートが切断された場合などにエラーが続くのを防ぐ)、そうでなければ ser
+    """
+    if ser:
+        try:
+            ser.write(f"{command}\n".encode('utf-8'))
+        except serial.SerialException as e:
+            print(f"[メイン] エラー: シリアル書き込み失敗。{e}")
+            ser.close()
+            return None
+    return ser
+
+
+def read_mode_commands(ser, buffer):
+    """
+    シリアルで受け取った "MODE <操舵モード>" の行を読む (届いている分だけ読み、待たない)。
+    戻り値: (要求された操舵モードのリスト, 行の途中までの受信データ)
+    """
+    return parse_mode_commands(buffer + ser.read(ser.in_waiting))
+
+
 def main():
     
-    # --- 1. スレッド間共有変数の初期化 ---
-    shared_state = {
-        'steering_value': 0.0,
-        'wall_detected': 0,
-        'stop': False, 
-        'gravity_value': 0.0,
-        
-        # --- GUI表示しないためフレームは削除 ---
-        # 'steering_frame': None, 
-        # 'wall_frame_right': None,
-        # 'wall_frame_left': None,  
-        # 'gravity_frame': None
-    }
+    # --- 1. スレッド間共有状態の初期化 ---
+    # 検出器ごとのスロット (版数つき) と停止用の Event を持つ。ロックは使わない (vision_state.py)
+    # PROCESS のときは同じ使い方のまま、結果を共有メモリに置く (process_runtime.py)
+    use_process = (VISION_RUNTIME == 'PROCESS')
+    state = SharedVisionState() if use_process else VisionState()
     
-    lock = threading.Lock()
+    # --- GUI表示しないためフレームは共有しない ---
 
     # --- 2. シリアルポートの準備 (★★★ 追加 ★★★) ---
     ser = None
@@ -79,28 +197,27 @@ def main():
         return # シリアル必須の場合はここで終了
             
     # --- 3. 画像処理スレッドを起動 ---
-    t_steering = threading.Thread(target=steering_thread_func, 
-                                 args=(CAMERA_INDEX_STEERING, shared_state, lock))
+    # 操舵モードに必要な検出器だけを起動する (detector_registry.py)
+    cpu_policy, controller = create_drive_controller(state, use_process)
+    print(f"[メイン]: {controller.mode} モードの検出器を起動します ({VISION_RUNTIME})...")
+    controller.start()
     
-    t_wall = threading.Thread(target=wall_thread_func, 
-                             args=(CAMERA_INDEX_WALL, shared_state, lock))
-    
-    t_gravity = threading.Thread(target=gravity_thread_func,
-                               args=(CAMERA_INDEX_GRAVITY, shared_state, lock))
-    
-    print("[メイン]: 操舵スレッドと壁検出スレッドを起動します...")
-    t_steering.start()
-    t_wall.start()
-    
-    # print("[メイン]: 重心検出スレッドを起動します...")
-    # t_gravity.start()
+    # メインループ (制御) の割り当ては、全スレッドを起動した後に (先にすると子スレッドに引き継がれる)
+    cpu_policy.apply_thread('control')
+
+    serial_buffer = b''
+    if MODE_SWITCH_SIGNAL and hasattr(signal, 'SIGUSR1'):
+        signal.signal(signal.SIGUSR1, lambda signum, frame: controller.request_mode())
+
+    # フレーム→コマンドの遅れの計測 (終了時に表示)
+    last_update_seq = 0
+    latency_frame_ids = {'操舵': 0, '重心': 0} # 遅れを計測した最後のレコードの frame_id
+    latency_samples = {'操舵': [], '重心': []}
+    loop_count = 0
+    loop_start_time = time.time()
     
     # --- 4. メイン制御ループ (ステートマシン) ---
-    current_state = STATE_DRIVING
-    stop_timer_end_time = 0.0
-    stop_cooldown_end_time = 0.0
-    
-    print(f"[メイン]: 制御ループを開始します。操舵モード: {STEERING_MODE} (Ctrl+Cで終了)")
+    print(f"[メイン]: 制御ループを開始します。操舵モード: {controller.mode} (Ctrl+Cで終了)")
     
     # --- GUI表示しないためフレーム変数は不要 ---
     # frame_steering = None
@@ -110,82 +227,49 @@ def main():
 
     try:
         while True:
-            current_time = time.time()
-            
-            # --- 4-1. 共有変数を安全に読み出す ---
-            with lock:
-                if shared_state['stop']:
-                    print("[メイン]: スレッドからの停止要求を検出。ループを終了します。")
-                    break
-                    
-                current_steering_diff = shared_state['steering_value']
-                is_wall_detected = (shared_state['wall_detected'] == 1)
+            # --- 4-1. 共有状態を読み出す ---
+            if EVENT_DRIVEN_LOOP:
+                # 新しい結果が書き込まれる (または停止要求・安全のためのタイムアウト) まで待つ
+                timeout = MAIN_LOOP_SAFETY_TIMEOUT_SEC
+                if controller.current_state == STATE_STOPPED:
+                    timeout = min(timeout, max(0.0, controller.stop_timer_end_time - time.time()))
+                last_update_seq = state.wait_for_update(last_update_seq, timeout)
                 
-                # --- フレーム取得処理は削除 ---
+            # --- 4-0. 操舵モードの切り替え ---
+            if ser:
+                try:
+                    requested_modes, serial_buffer = read_mode_commands(ser, serial_buffer)
+                    for requested_mode in requested_modes:
+                        controller.request_mode(requested_mode)
+                except serial.SerialException as e:
+                    print(f"[メイン] エラー: シリアル読み込み失敗。{e}")
+            switch = controller.next_switch()
+            if switch is not None:
+                # 検出器を止める・起動する間 (最大 PARK_TIMEOUT_SEC 秒) は止まっておく
+                ser = send_command(ser, "H")
+                controller.switch_mode(*switch)
                 
-                current_gravity_diff = shared_state['gravity_value']
-            
-            # --- 4-2. 操舵コマンドを生成 ---
-            steering_command = "S" 
-            active_steering_diff = 0.0
+            if state.should_stop():
+                print("[メイン]: スレッドからの停止要求を検出。ループを終了します。")
+                break
             
-            if STEERING_MODE == 'LINE_DETECT':
-                active_steering_diff = current_steering_diff
-                if abs(current_steering_diff) > STEERING_THRESHOLD:
-                    if current_steering_diff > 0:
-                        steering_command = f"R {current_steering_diff:.2f}" 
-                    else:
-                        steering_command = f"L {abs(current_steering_diff):.2f}" 
+            loop_count += 1
             
-            elif STEERING_MODE == 'GRAVITY':
-                active_steering_diff = current_gravity_diff
-                # THRESHOLD は共通
-                if abs(current_gravity_diff) > STEERING_THRESHOLD: 
-                    if current_gravity_diff > 0:
-                        steering_command = f"R {current_gravity_diff:.2f}" 
-                    else:
-                        steering_command = f"L {abs(current_gravity_diff):.2f}"
-                                    
-            # --- 4-3. ステートマシンによるコマンド決定 ---
-            final_command = steering_command 
-
-            if current_state == STATE_DRIVING:
-                if is_wall_detected and current_time > stop_cooldown_end_time:
-                    print(f"[メイン]: !!! 壁を検出！ {STOP_DURATION_SEC}秒間停止します。 !!!")
-                    current_state = STATE_STOPPED
-                    stop_timer_end_time = current_time + STOP_DURATION_SEC
-                    stop_cooldown_end_time = current_time + STOP_COOLDOWN_SEC
-                    final_command = "H" 
-                else:
-                    final_command = steering_command
-
-            elif current_state == STATE_STOPPED:
-                if current_time > stop_timer_end_time:
-                    print("[メイン]: --- 停止時間終了。運転を再開します。---")
-                    current_state = STATE_DRIVING
-                    final_command = steering_command
-                else:
-                    final_command = "H"
+            # --- 4-2〜4-3. 操舵コマンド・ステートマシン・処理レート・ウォッチドッグ (drive_control.py) ---
+            decision = controller.decide()
             
             # --- 4-4. シリアル通信 (★★★ 追加 ★★★) ---
-            if ser:
-                try:
-                    # Pico側で受信しやすいよう、コマンドの末尾に改行(\n)を追加
-                    command_to_send = f"{final_command}\n" 
-                    ser.write(command_to_send.encode('utf-8'))
-                except serial.SerialException as e:
-                    print(f"[メイン] エラー: シリアル書き込み失敗。{e}")
-                    # ポートが切断された場合などを考慮
-                    ser.close()
-                    ser = None # エラーが続くのを防ぐ
+            ser = send_command(ser, decision.command)
+            
+            # --- 4-4b. フレーム→コマンドの遅れを記録 (新しいレコードのみ) ---
+            command_time = time.time()
+            for source_name, result in (('操舵', decision.steering.result), ('重心', decision.gravity.result)):
+                if result is not None and result['frame_id'] != latency_frame_ids[source_name]:
+                    latency_frame_ids[source_name] = result['frame_id']
+                    latency_samples[source_name].append(command_time - float(result['timestamp']))
             
             # --- 4-5. 状態の表示 (標準出力) ---
-            state_text = "DRIVING" if current_state == STATE_DRIVING else "STOPPED"
-            mode_text = f"Mode: {STEERING_MODE}"
-            print(f"状態: {state_text}, {mode_text}, "
-                  f"壁: {is_wall_detected}, "
-                  f"ズレ: {active_steering_diff:6.2f}, "
-                  f"コマンド: {final_command}")
+            print(controller.status_text(decision))
             
             # --- 4-6. 画像の表示 (★★★ コメントアウト ★★★) ---
             # if STEERING_MODE == 'LINE_DETECT':
@@ -207,7 +291,8 @@ def main():
             #     cv2.imshow('Wall Left (Bottom)', frame_wall_left)
 
             # --- 4-7. メインループの待機 (★★★ time.sleep に変更 ★★★) ---
-            time.sleep(MAIN_LOOP_WAIT_SEC)
+            if not EVENT_DRIVEN_LOOP:
+                time.sleep(MAIN_LOOP_WAIT_SEC)
             
             # key = cv2.waitKey(MAIN_LOOP_WAIT_MS) & 0xFF
             # if key == ord('q'):
@@ -220,16 +305,22 @@ def main():
         # --- 5. 終了処理 ---
         print("[メイン]: 終了処理中...")
         
-        with lock:
-            shared_state['stop'] = True
-        
-        t_steering.join()
-        t_wall.join()
-        
-        #if t_gravity.is_alive():
-        #    t_gravity.join()
+        state.request_stop()
+        controller.shutdown()
+        if use_process:
+            state.close()
         
-        print("[メイン]: 全スレッドが終了しました。")
+        # --- フレーム→コマンドの遅れ (EVENT_DRIVEN_LOOP を切り替えて比較する) ---
+        loop_mode_text = "イベント駆動" if EVENT_DRIVEN_LOOP else "ポーリング"
+        elapsed = max(time.time() - loop_start_time, 1e-6)
+        print(f"[メイン]: ループ方式: {loop_mode_text}, ループ回数: {loop_count / elapsed:.1f} 回/秒")
+        for source_name, samples in latency_samples.items():
+            if samples:
+                samples = sorted(samples)
+                mean_ms = sum(samples) / len(samples) * 1000
+                p95_ms = samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000
+                print(f"[メイン]: {source_name}のフレーム→コマンドの遅れ: 平均 {mean_ms:.1f} ms, "
+                      f"p95 {p95_ms:.1f} ms ({len(samples)} 件)")
         
         if ser and ser.is_open:
             ser.close() # ★★★ シリアルポートを閉じる ★★★
@@ -0,0 +1,409 @@
+# ファイル名: process_runtime.py
+# (main_control_thread_serial.py と同じフォルダに保存してください)
+#
+# 検出器 (steering_thread_func / wall_thread_func / gravity_thread_func) をスレッドではなく
+# 別々のプロセスで動かすための部品。Python の処理 (角度の選別・交点の計算・ラベルのループなど) が
+# GIL で1コアに詰まらず、ラズパイの4コアを使える。
+#   - SharedMemoryCapture: SharedCapture のプロセス版。カメラを1回だけ開き、
+#     multiprocessing.shared_memory のリングバッファにフレームを書く。consumer() は別プロセスで read() できる
+#   - SharedVisionState: VisionState のプロセス版。各スロットの結果を共有メモリ上の固定長レコードに書く
+#     (版数 = seqlock はそのまま)。publish() / snapshot() / wait_for_update() は VisionState と同じ
+#   - detector_process(): *_thread_func をそのまま別プロセスで動かす Process を作る
+#
+#   state = SharedVisionState()
+#   camera = SharedMemoryCapture(0)
+#   p = detector_process(steering_thread_func, camera.consumer(), state)
+#   p.start() ... state.request_stop(); p.join(); camera.close(); state.close()
+#
+# プロセスの起動は 'spawn' (カメラの読み込みスレッドが動いている状態で fork しないため)。
+# 呼び出し側のスクリプトは if __name__ == '__main__': で main() を呼ぶこと。
+
+import multiprocessing
+import signal
+import threading
+import time
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+from vision_records import (STEERING_RESULT_DTYPE, GRAVITY_RESULT_DTYPE, WALL_EVENT_DTYPE,
+                            wall_event_to_record, wall_event_from_record)
+from vision_state import SteeringSlot, WallSlot, GravitySlot
+
+PROCESS_START_METHOD = 'spawn'
+
+
+def _context():
+    return multiprocessing.get_context(PROCESS_START_METHOD)
+
+
+# ===================================================================
+# フレームのリングバッファ
+# ===================================================================
+class SharedFrameRing:
+    """
+    共有メモリ上のフレームのリングバッファ (書き込むのは1つのスレッドだけ)。
+    先頭に [最新の通し番号, 書き込み終了フラグ, 各スロットの通し番号...] を置き、その後ろにフレームを並べる。
+    通し番号 seq のフレームはスロット seq % num_slots に入る。
+    """
+
+    def __init__(self, shape, dtype, num_slots=4, name=None, condition=None):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.num_slots = num_slots
+        self.owner = name is None
+        header_bytes = 8 * (2 + num_slots)
+        frame_bytes = int(np.prod(self.shape)) * self.dtype.itemsize
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=header_bytes + frame_bytes * num_slots)
+            self.condition = _context().Condition()
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.condition = condition
+        self.header = np.ndarray((2 + num_slots,), dtype=np.int64, buffer=self.shm.buf)
+        self.frames = np.ndarray((num_slots,) + self.shape, dtype=self.dtype,
+                                 buffer=self.shm.buf, offset=header_bytes)
+        if self.owner:
+            self.header[:] = 0
+
+    def __reduce__(self):
+        # 別プロセスでは同じ名前の共有メモリを開き直す
+        return (SharedFrameRing, (self.shape, self.dtype, self.num_slots, self.shm.name, self.condition))
+
+    @property
+    def latest_seq(self):
+        return int(self.header[0])
+
+    @property
+    def finished(self):
+        return bool(self.header[1])
+
+    def write(self, frame):
+        """フレームを次のスロットにコピーして公開する。"""
+        seq = self.latest_seq + 1
+        slot = seq % self.num_slots
+        self.header[2 + slot] = 0 # 書き込み中 (読む側はこのスロットを使わない)
+        np.copyto(self.frames[slot], frame)
+        self.header[2 + slot] = seq
+        self.header[0] = seq
+        with self.condition:
+            self.condition.notify_all()
+
+    def finish(self):
+        """これ以上フレームが来ないことを知らせる (カメラが外れた・動画の終わり)。"""
+        self.header[1] = 1
+        with self.condition:
+            self.condition.notify_all()
+
+    def read_after(self, last_seq, timeout):
+        """
+        last_seq より新しいフレームが来るまで最大 timeout 秒待ち、(通し番号, フレームのコピー) を返す。
+        来なければ (last_seq, None)。
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: self.latest_seq > last_seq or self.finished, timeout=timeout)
+        while True:
+            seq = self.latest_seq
+            if seq <= last_seq:
+                return last_seq, None
+            slot = seq % self.num_slots
+            if self.header[2 + slot] != seq:
+                continue # 書き込み側に追い越された: 最新の番号で読み直す
+            # 検出器はフレームを持ち続けることがあるので、共有メモリのビューではなくコピーを返す
+            frame = self.frames[slot].copy()
+            if self.header[2 + slot] == seq:
+                return seq, frame
+
+    def close(self):
+        self.frames = None
+        self.header = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+class SharedMemoryCapture:
+    """
+    カメラを1回だけ開き、読み込みスレッドでフレームを SharedFrameRing に書く (SharedCapture のプロセス版)。
+    loop: True なら動画ファイルの終わりで先頭に戻る (ベンチマーク用)
+    reader_init: 読み込みスレッドの最初に呼ぶ関数 (SharedCapture と同じ)
+    """
+
+    def __init__(self, source, num_slots=4, loop=False, reader_init=None):
+        self.source = source
+        self.loop = loop
+        self.reader_init = reader_init
+        self.cap = cv2.VideoCapture(source)
+        self.ring = None
+        self.thread = None
+        self.running = False
+        # 最初のフレームでリングバッファの大きさを決める
+        ret, frame = self.cap.read() if self.cap.isOpened() else (False, None)
+        if ret:
+            self.ring = SharedFrameRing(frame.shape, frame.dtype, num_slots)
+            self.ring.write(frame)
+            self.running = True
+            self.thread = threading.Thread(target=self._reader, daemon=True)
+            self.thread.start()
+        else:
+            self.cap.release()
+
+    def _reader(self):
+        if self.reader_init is not None:
+            self.reader_init()
+        while self.running:
+            ret, frame = self.cap.read()
+            if not ret:
+                if self.loop:
+                    self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                    continue
+                break
+            if frame.shape != self.ring.shape:
+                continue # 大きさが変わったフレームは捨てる
+            self.ring.write(frame)
+        self.ring.finish()
+        self.cap.release()
+
+    def consumer(self):
+        """検出プロセスに渡す読み口を作る。"""
+        return FrameRingReader(self.ring, self.source)
+
+    def close(self):
+        """読み込みスレッドを止め、共有メモリを解放する (全プロセスの終了後に呼ぶ)。"""
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+        if self.ring is not None:
+            self.ring.close()
+
+
+class FrameRingReader:
+    """
+    SharedFrameRing の読み口。cv2.VideoCapture と同じ isOpened() / read() / release() を持つ。
+    read() は前回読んだものより新しいフレームが来るまで待つ (CaptureConsumer と同じ)。
+    """
+
+    def __init__(self, ring, source=None, timeout=1.0):
+        self.ring = ring
+        self.source = source
+        self.timeout = timeout
+        self.last_seq = 0
+
+    def __repr__(self):
+        return f"共有メモリ:{self.source}"
+
+    def isOpened(self):
+        return self.ring is not None and (not self.ring.finished or self.ring.latest_seq > self.last_seq)
+
+    def read(self):
+        if self.ring is None:
+            return False, None
+        seq, frame = self.ring.read_after(self.last_seq, self.timeout)
+        if frame is None:
+            return False, None
+        self.last_seq = seq
+        return True, frame
+
+    def release(self):
+        # 共有メモリは作った側 (SharedMemoryCapture.close()) が解放する
+        pass
+
+
+# ===================================================================
+# 結果の共有状態
+# ===================================================================
+# スロットごとの (VisionState のスロットクラス, 共有メモリ上の型)
+# 構造化の型の項目は「無し (None)」を表すために '<名前>_valid' を一緒に持つ
+_SLOT_LAYOUTS = (
+    ('steering', SteeringSlot, (('value', 'f8'), ('carried_forward', '?'), ('result', STEERING_RESULT_DTYPE))),
+    ('wall', WallSlot, (('detected', 'i4'), ('carried_forward', '?'), ('event', WALL_EVENT_DTYPE))),
+    ('gravity', GravitySlot, (('value', 'f8'), ('result', GRAVITY_RESULT_DTYPE))),
+)
+
+# 辞書などレコード以外の値を載せる項目の (書き込み, 読み出し) の変換
+_FIELD_CODECS = {
+    'event': (wall_event_to_record, wall_event_from_record),
+}
+
+
+def _record_dtype(fields):
+    items = []
+    for name, dtype in fields:
+        dtype = np.dtype(dtype)
+        if dtype.names is not None:
+            items.append((name + '_valid', '?'))
+        items.append((name, dtype))
+    return np.dtype(items)
+
+
+class SharedSlot:
+    """共有メモリ上の1つの検出器の結果 (StateSlot と同じ publish() / snapshot() / version)。"""
+
+    def __init__(self, slot_class, fields, buffer, offset, owner):
+        self.slot_class = slot_class
+        self.fields = fields
+        self.dtype = _record_dtype(fields)
+        self._seq = np.ndarray((1,), dtype=np.int64, buffer=buffer, offset=offset) # 版数 (奇数なら書き込み中)
+        self._record = np.ndarray((), dtype=self.dtype, buffer=buffer, offset=offset + 8)
+        self._owner = owner
+
+    @staticmethod
+    def nbytes(fields):
+        """版数とレコードの大きさ (8バイト境界に揃える)。"""
+        return 8 + (_record_dtype(fields).itemsize + 7) // 8 * 8
+
+    @property
+    def version(self):
+        return int(self._seq[0]) // 2
+
+    def publish(self, **fields):
+        """項目をまとめて書き込む (書き込むプロセスは1つだけであること)。指定しない項目は前の値のまま。"""
+        self._seq[0] += 1
+        for name, value in fields.items():
+            if self.dtype[name].names is None:
+                self._record[name] = value
+            elif value is None:
+                self._record[name + '_valid'] = False
+            else:
+                encode = _FIELD_CODECS[name][0] if name in _FIELD_CODECS else None
+                self._record[name] = encode(value) if encode else value
+                self._record[name + '_valid'] = True
+        self._seq[0] += 1
+        self._owner.notify_update()
+
+    def abandon_write(self):
+        """書き込むプロセスを publish() の途中で終了させたとき、版数を偶数に戻して snapshot() が待ち続けないようにする。"""
+        if int(self._seq[0]) & 1:
+            self._seq[0] += 1
+
+    def snapshot(self):
+        """全項目が同じ publish() のものであるスナップショット (VisionState と同じ namedtuple) を返す。"""
+        while True:
+            seq = int(self._seq[0])
+            if seq & 1:
+                time.sleep(0)
+                continue
+            record = self._record.copy()
+            if int(self._seq[0]) == seq:
+                break
+        values = []
+        for name in self.slot_class.FIELDS:
+            if self.dtype[name].names is None:
+                values.append(record[name].item())
+            elif not record[name + '_valid']:
+                values.append(None)
+            else:
+                decode = _FIELD_CODECS[name][1] if name in _FIELD_CODECS else None
+                values.append(decode(record[name]) if decode else record[name].copy())
+        return self.slot_class.Snapshot(seq // 2, *values)
+
+
+class SharedVisionState:
+    """
+    プロセス間で共有する VisionState。メインプロセスで作り、Process の引数として検出プロセスに渡す。
+    結果は共有メモリ、停止要求は Event、更新の通知は Condition (いずれも multiprocessing のもの)。
+    """
+
+    def __init__(self, _shared=None):
+        if _shared is None:
+            context = _context()
+            size = sum(SharedSlot.nbytes(fields) for _, _, fields in _SLOT_LAYOUTS)
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+            self.shm.buf[:size] = bytes(size) # 初期値はすべて0 (= 各スロットの初期値)
+            self.stop_event = context.Event()
+            self._update_condition = context.Condition()
+            self._update_seq = context.RawValue('q', 0) # Condition のロックの中で読み書きする
+            self._target_fps = context.RawArray('d', 3) # 操舵・壁・重心の処理レート (0 なら未指定)
+            self.owner = True
+        else:
+            name, self.stop_event, self._update_condition, self._update_seq, self._target_fps = _shared
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.owner = False
+        offset = 0
+        for attribute, slot_class, fields in _SLOT_LAYOUTS:
+            setattr(self, attribute, SharedSlot(slot_class, fields, self.shm.buf, offset, self))
+            offset += SharedSlot.nbytes(fields)
+
+    def __reduce__(self):
+        return (SharedVisionState, ((self.shm.name, self.stop_event, self._update_condition,
+                                     self._update_seq, self._target_fps),))
+
+    # メイン側から指定する処理レート (FPS)。未指定なら None
+    @property
+    def steering_target_fps(self):
+        return self._target_fps[0] or None
+
+    @steering_target_fps.setter
+    def steering_target_fps(self, fps):
+        self._target_fps[0] = fps or 0.0
+
+    @property
+    def wall_target_fps(self):
+        return self._target_fps[1] or None
+
+    @wall_target_fps.setter
+    def wall_target_fps(self, fps):
+        self._target_fps[1] = fps or 0.0
+
+    @property
+    def gravity_target_fps(self):
+        return self._target_fps[2] or None
+
+    @gravity_target_fps.setter
+    def gravity_target_fps(self, fps):
+        self._target_fps[2] = fps or 0.0
+
+    def request_stop(self):
+        self.stop_event.set()
+        self.notify_update()
+
+    def should_stop(self):
+        return self.stop_event.is_set()
+
+    def notify_update(self):
+        with self._update_condition:
+            self._update_seq.value += 1
+            self._update_condition.notify_all()
+
+    def wait_for_update(self, last_seq, timeout):
+        with self._update_condition:
+            self._update_condition.wait_for(
+                lambda: self._update_seq.value != last_seq or self.stop_event.is_set(), timeout=timeout)
+            return self._update_seq.value
+
+    def snapshot(self):
+        return self.steering.snapshot(), self.wall.snapshot(), self.gravity.snapshot()
+
+    def close(self):
+        """共有メモリを閉じる (作ったメインプロセスでは解放もする)。"""
+        for attribute, _, _ in _SLOT_LAYOUTS:
+            setattr(self, attribute, None)
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+# ===================================================================
+# 検出プロセス
+# ===================================================================
+def _run_detector(thread_func, source, state):
+    # Ctrl+C はメインプロセスが受け取り、request_stop() で全プロセスを止める
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    try:
+        thread_func(source, state)
+    finally:
+        state.close()
+        if isinstance(source, FrameRingReader) and source.ring is not None:
+            source.ring.close()
+
+
+def detector_process(thread_func, source, state, name=None):
+    """
+    *_thread_func(source, state) を別プロセスで動かす Process を作る (start() は呼び出し側で)。
+    source: カメラ番号・動画ファイル (そのプロセスで開く) または SharedMemoryCapture.consumer()
+    state: SharedVisionState
+    threading.Thread と同じ start() / join() / is_alive() で扱える。
+    """
+    return _context().Process(target=_run_detector, args=(thread_func, source, state),
+                              name=name or thread_func.__name__)
@@ -0,0 +1,124 @@
+# ファイル名: rate_scheduler.py
+# (robot_vision_thread_headless.py と同じフォルダに保存してください)
+#
+# 検出スレッドの処理レートを守るためのスケジューラ。
+# 従来のループは「毎回フレームを読む → INTERVAL を過ぎたか確認 → time.sleep(0.001)」で、
+# 2〜5 FPS しか処理しなくても、フレームの読み込み (展開) と起床を何度も繰り返していた。
+# RateScheduler は次の処理の締切を絶対時刻で持ち、締切までは
+#   - ライブのカメラ (cv2.VideoCapture): grab() だけで古いフレームを捨てる (展開しない)。
+#     締切を過ぎて最初に来たフレームだけを retrieve() で展開する
+#   - 共有の読み口 (CaptureConsumer など, 常に最新のフレームを返す)・動画ファイル: 締切まで眠る
+# ようにする。停止要求 (stop_event) があればすぐに起きる。
+# 終了時に report() で起床回数・展開したフレーム数・スレッドの CPU 時間を表示して、効果を確認できる。
+#
+#   scheduler = RateScheduler(1.0 / TARGET_FPS)
+#   while not state.should_stop():
+#       ret, frame = scheduler.read(cap, state.stop_event)
+#       if scheduler.due():
+#           scheduler.mark_processed()
+#           ... 処理 ...
+
+import time
+import cv2
+
+# 従来の「毎回読む + 1ms スリープ」の待ち時間 (precise=False のとき)
+LEGACY_SLEEP_SEC = 0.001
+
+
+class RateScheduler:
+    """
+    interval: 処理の周期 (秒)。0 なら毎フレーム処理する
+    precise: False なら従来どおり毎回フレームを読み、1ms ずつ眠る (比較用)
+    """
+
+    def __init__(self, interval, precise=True):
+        self.interval = interval
+        self.precise = precise
+        self.next_deadline = time.monotonic() # 次に処理する時刻
+        self.last_processed = time.monotonic()
+        self._live_camera = None # ライブのカメラか (最初の read() で判定)
+        # 報告用の回数
+        self.start_time = time.monotonic()
+        self.start_cpu = time.thread_time()
+        self.wakeups = 0 # ループが起きた回数 (read() の呼び出し + 空読みの回数)
+        self.frames_decoded = 0 # 展開したフレーム数
+        self.frames_grabbed = 0 # 展開せずに捨てたフレーム数
+        self.processed = 0
+
+    def set_interval(self, interval):
+        """周期を変える (次の締切は、前回の処理から新しい周期で数え直す)。"""
+        if interval != self.interval:
+            self.interval = interval
+            self.next_deadline = self.last_processed + interval
+
+    def due(self):
+        """処理する時刻になっているか。"""
+        now = time.monotonic()
+        if self.precise:
+            return now >= self.next_deadline
+        return (now - self.last_processed) >= self.interval
+
+    def since_processed(self):
+        """前回の処理からの経過時間 (秒)。"""
+        return time.monotonic() - self.last_processed
+
+    def mark_processed(self):
+        """処理を始めたことを記録し、次の締切を決める。"""
+        now = time.monotonic()
+        self.processed += 1
+        self.last_processed = now
+        # 締切は前回の締切から周期ずつ進める (処理時間の分だけずれていかない)。
+        # 大きく遅れたときは、まとめて取り戻そうとせず今から数え直す
+        self.next_deadline += self.interval
+        if self.next_deadline < now:
+            self.next_deadline = now + self.interval
+
+    def read(self, cap, stop_event, every_frame=False):
+        """
+        次に処理するフレームを読む。
+        every_frame: True なら締切を待たずに次のフレームを読む (壁の見張りのように毎フレーム見る場合)
+        """
+        if not self.precise:
+            time.sleep(LEGACY_SLEEP_SEC)
+            return self._decode(cap)
+        if every_frame or self.interval <= 0:
+            return self._decode(cap)
+
+        if self._live_camera is None:
+            # 動画ファイルはフレーム数がわかる。ライブのカメラは 0 または -1
+            self._live_camera = (isinstance(cap, cv2.VideoCapture)
+                                 and cap.get(cv2.CAP_PROP_FRAME_COUNT) <= 0)
+        if self._live_camera:
+            # 締切を過ぎるまで、カメラのバッファを展開せずに捨てる (grab() はフレームが来るまで待つ)
+            while True:
+                self.wakeups += 1
+                if not cap.grab():
+                    return False, None
+                if time.monotonic() >= self.next_deadline or stop_event.is_set():
+                    self.frames_decoded += 1
+                    return cap.retrieve()
+                self.frames_grabbed += 1
+
+        # 最新のフレームを返す読み口・動画ファイル: 締切まで眠る
+        delay = self.next_deadline - time.monotonic()
+        if delay > 0:
+            stop_event.wait(delay)
+        return self._decode(cap)
+
+    def _decode(self, cap):
+        self.wakeups += 1
+        ret, frame = cap.read()
+        if ret:
+            self.frames_decoded += 1
+        return ret, frame
+
+    def report(self):
+        """起床回数・展開したフレーム数・処理回数 (1秒あたり) とスレッドの CPU 使用率の文字列。"""
+        elapsed = max(time.monotonic() - self.start_time, 1e-6)
+        cpu = time.thread_time() - self.start_cpu
+        mode = "締切まで待機" if self.precise else "1msスリープ"
+        return (f"{mode}: 起床 {self.wakeups / elapsed:.1f} 回/秒, "
+                f"展開 {self.frames_decoded / elapsed:.1f} 枚/秒, "
+                f"空読み {self.frames_grabbed / elapsed:.1f} 枚/秒, "
+                f"処理 {self.processed / elapsed:.1f} 回/秒, "
+                f"CPU {cpu / elapsed * 100:.1f} %")
@@ -1,10 +1,18 @@
 # ファイル名: robot_vision_thread.py
 # (main_control_thread_display.py と同じフォルダに保存してください)
+#
+# 表示用のフレームは共有辞書の FrameChannel (frame_channel.py) に直接描画して公開する。
+# (ロックの中でフレームをコピーしない)
 
 import cv2
 import numpy as np
 import math
 import time
+from line_detectors import create_line_detector
+
+# --- 線分検出バックエンド ('HOUGH' / 'LSD' / 'FLD') ---
+STEERING_LINE_BACKEND = 'HOUGH'
+WALL_LINE_BACKEND = 'HOUGH'
 
 # --- パラメータ (軽量化のため調整) ---
 RESIZE_WIDTH = 240
@@ -16,7 +24,8 @@ MIN_NOISE_AREA = 80
 def steering_thread_func(camera_index, shared_state, lock):
     """
     【スレッド版】
-    操舵（消失点）を検出し、ズレ量(float)と処理済みフレームを共有辞書に書き込む。
+    操舵（消失点）を検出し、ズレ量(float)を共有辞書に書き込み、処理済みフレームを
+    shared_state['steering_frame'] (FrameChannel) に公開する。
     """
     
     # --- 操舵用パラメータ ---
@@ -30,6 +39,16 @@ def steering_thread_func(camera_index, shared_state, lock):
     TARGET_FPS = 2  # 操舵計算は毎秒2回で十分と仮定
     INTERVAL = 1.0 / TARGET_FPS
 
+    line_detector = create_line_detector(STEERING_LINE_BACKEND,
+                                         canny_threshold1=CANNY_THRESHOLD1,
+                                         canny_threshold2=CANNY_THRESHOLD2,
+                                         hough_threshold=HOUGH_THRESHOLD,
+                                         min_line_length=HOUGH_MIN_LINE_LENGTH,
+                                         max_line_gap=HOUGH_MAX_LINE_GAP,
+                                         min_noise_area=MIN_NOISE_AREA)
+
+    steering_frames = shared_state['steering_frame'] # FrameChannel
+
     print(f"[操舵スレッド]: カメラ({camera_index})の起動を試みます...")
     cap = cv2.VideoCapture(camera_index)
     if not cap.isOpened():
@@ -64,7 +83,9 @@ def steering_thread_func(camera_index, shared_state, lock):
                 orig_height, orig_width = frame.shape[:2]
                 aspect_ratio = orig_height / orig_width
                 resize_height = int(RESIZE_WIDTH * aspect_ratio)
-                resized_frame = cv2.resize(frame, (RESIZE_WIDTH, resize_height), interpolation=cv2.INTER_AREA)
+                # 表示用チャンネルの書き込み用バッファへ直接リサイズする
+                back = steering_frames.back_buffer((resize_height, RESIZE_WIDTH, 3))
+                resized_frame = cv2.resize(frame, (RESIZE_WIDTH, resize_height), dst=back, interpolation=cv2.INTER_AREA)
                 height, width = resized_frame.shape[:2]
                 
                 """
@@ -79,27 +100,16 @@ def steering_thread_func(camera_index, shared_state, lock):
                 clahe = cv2.createCLAHE(clipLimit=CLIP_LIMIT, tileGridSize=TILE_GRID_SIZE)
                 adjusted = clahe.apply(gray)
                 blurred_again = cv2.GaussianBlur(adjusted, (7, 7), 0)
-                edges = cv2.Canny(blurred_again, CANNY_THRESHOLD1, CANNY_THRESHOLD2)
-                
-                # --- 3. ノイズ除去 ---
-                num_labels, labels, stats, centroids = cv2.connectedComponentsWithStats(edges, connectivity=8)
-                cleaned_edges = np.zeros_like(edges)
-                for i in range(1, num_labels):
-                    if stats[i, cv2.CC_STAT_AREA] > MIN_NOISE_AREA:
-                        cleaned_edges[labels == i] = 255
                 
-                # --- 4. ハフ変換 & 消失点計算 ---
-                lines = cv2.HoughLinesP(cleaned_edges, 1, np.pi/180,
-                                        threshold=HOUGH_THRESHOLD,
-                                        minLineLength=HOUGH_MIN_LINE_LENGTH,
-                                        maxLineGap=HOUGH_MAX_LINE_GAP)
+                # --- 3. 線分検出 (ノイズ除去・ハフ変換はバックエンド側で行う) ---
+                segments = line_detector.detect(blurred_again)
                 
                 diagonal_lines = []
                 vp_x = width // 2
+                vp_y = height // 2
                 
-                if lines is not None:
-                    for line in lines:
-                        x1, y1, x2, y2 = line[0]
+                if len(segments) > 0:
+                    for x1, y1, x2, y2 in segments.astype(int):
                         angle_rad = math.atan2(y2 - y1, x2 - x1)
                         angle_deg = math.degrees(angle_rad)
                         abs_angle_deg = abs(angle_deg)
@@ -143,20 +153,22 @@ def steering_thread_func(camera_index, shared_state, lock):
 
                 if intersection_points:
                     x_coords = [p[0] for p in intersection_points]
+                    y_coords = [p[1] for p in intersection_points]
                     vp_x = int(np.median(x_coords))
+                    vp_y = int(np.median(y_coords))
 
                 # --- 5. ズレ量を計算 ---
                 image_center_x = width / 2
                 x_difference = vp_x - image_center_x
                 
                 # --- 5b. デバッグ描画 ---
-                cv2.circle(resized_frame, (vp_x, height // 2), 10, (0, 0, 255), -1) 
+                cv2.circle(resized_frame, (vp_x, vp_y), 10, (0, 0, 255), -1) 
                 cv2.line(resized_frame, (width // 2, 0), (width // 2, height), (255, 0, 0), 1)
 
-                # --- 6. 共有辞書へ書き込み (ロックを使用) ---
+                # --- 6. 共有辞書へ書き込み (ロックは値だけ。フレームはバッファの入れ替えで公開) ---
                 with lock:
                     shared_state['steering_value'] = x_difference
-                    shared_state['steering_frame'] = resized_frame.copy() 
+                steering_frames.publish()
             except Exception as e:
                     print(f"[操舵スレッド] 処理中に予期せぬエラー: {e}")
                     # エラーが発生してもスレッドは停止せず、次のフレーム処理に移る
@@ -176,7 +188,7 @@ def wall_thread_func(camera_index, shared_state, lock):
     【スレッド版・360度カメラ対応】
     フレームを「右(上半分)」「左(下半分)」に分割し、
     *中心より左側*で垂直線を検出したらフラグを立て、
-    処理済みフレームを別々に共有辞書に書き込む。
+    処理済みフレームを別々の FrameChannel (shared_state['wall_frame_right'] / ['wall_frame_left']) に公開する。
     (テキスト描画なし)
     """
 
@@ -190,7 +202,16 @@ def wall_thread_func(camera_index, shared_state, lock):
     TILE_GRID_SIZE = (12, 12)
     TARGET_FPS = 5  # 操舵計算は毎秒5回で十分と仮定
     INTERVAL = 1.0 / TARGET_FPS
+
+    line_detector = create_line_detector(WALL_LINE_BACKEND,
+                                         canny_threshold1=CANNY_THRESHOLD1,
+                                         canny_threshold2=CANNY_THRESHOLD2,
+                                         hough_threshold=HOUGH_THRESHOLD,
+                                         min_line_length=HOUGH_MIN_LINE_LENGTH,
+                                         max_line_gap=HOUGH_MAX_LINE_GAP)
     
+    wall_frames = [shared_state['wall_frame_right'], shared_state['wall_frame_left']] # FrameChannel
+
     print(f"[壁検出スレッド]: カメラ({camera_index})の起動を試みます...")
     cap = cv2.VideoCapture(camera_index)
     if not cap.isOpened():
@@ -257,7 +278,8 @@ def wall_thread_func(camera_index, shared_state, lock):
                         
                     aspect_ratio = orig_h_frag / orig_w_frag
                     resize_height = int(RESIZE_WIDTH * aspect_ratio)
-                    resized_frame = cv2.resize(img_fragment, (RESIZE_WIDTH, resize_height), interpolation=cv2.INTER_AREA)
+                    back = wall_frames[i].back_buffer((resize_height, RESIZE_WIDTH, 3))
+                    resized_frame = cv2.resize(img_fragment, (RESIZE_WIDTH, resize_height), dst=back, interpolation=cv2.INTER_AREA)
                     height, width = resized_frame.shape[:2] # ★ 幅と高さを取得
 
                     # --- 2b. 前処理 ---
@@ -265,20 +287,15 @@ def wall_thread_func(camera_index, shared_state, lock):
                     clahe = cv2.createCLAHE(clipLimit=CLIP_LIMIT, tileGridSize=TILE_GRID_SIZE)
                     adjusted = clahe.apply(gray)
                     blurred_again = cv2.GaussianBlur(adjusted, (7, 7), 0)
-                    edges = cv2.Canny(blurred_again, CANNY_THRESHOLD1, CANNY_THRESHOLD2)
                     
-                    # --- 2d. ハフ変換 ---
-                    lines = cv2.HoughLinesP(edges, 1, np.pi / 180,
-                                            threshold=HOUGH_THRESHOLD,
-                                            minLineLength=HOUGH_MIN_LINE_LENGTH,
-                                            maxLineGap=HOUGH_MAX_LINE_GAP)
+                    # --- 2d. 線分検出 ---
+                    segments = line_detector.detect(blurred_again)
                     
                     # --- 2e. 検出ロジック ---
-                    if lines is not None:
+                    if len(segments) > 0:
                         image_center_x = width / 2 # イメージ中心
                         
-                        for line in lines:
-                            x1, y1, x2, y2 = line[0]
+                        for x1, y1, x2, y2 in segments.astype(int):
                             angle_deg = math.degrees(math.atan2(y2 - y1, x2 - x1))
                             abs_angle_deg = abs(angle_deg)
                             
@@ -322,7 +339,8 @@ def wall_thread_func(camera_index, shared_state, lock):
                     # width, heightが未定義の場合に備えてデフォルト値
                     if width == 0: width = RESIZE_WIDTH
                     if height == 0: height = int(RESIZE_WIDTH * (3/4))
-                    resized_frame = np.zeros((height, width, 3), dtype=np.uint8)
+                    resized_frame = wall_frames[i].back_buffer((height, width, 3))
+                    resized_frame.fill(0)
                     # ★★★ "ERROR" テキスト描画を削除 ★★★
                     # cv2.putText(resized_frame, "ERROR", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
 
@@ -342,8 +360,8 @@ def wall_thread_func(camera_index, shared_state, lock):
             try:
                 with lock:
                     shared_state['wall_detected'] = wall_line_detected
-                    shared_state['wall_frame_right'] = processed_frames[0].copy() 
-                    shared_state['wall_frame_left'] = processed_frames[1].copy()
+                for channel in wall_frames:
+                    channel.publish()
             
             except Exception as e:
                 print(f"[壁検出スレッド] 共有辞書への保存エラー: {e}")
@@ -362,7 +380,8 @@ def wall_thread_func(camera_index, shared_state, lock):
 def gravity_thread_func(camera_index, shared_state, lock):
     """
     【スレッド版・遅延対策済み】
-    最も暗い部分の重心を検出し、ズレ量(float)と処理済みフレームを共有辞書に書き込む。
+    最も暗い部分の重心を検出し、ズレ量(float)を共有辞書に書き込み、処理済みフレームを
+    shared_state['gravity_frame'] (FrameChannel) に公開する。
     (grav_p_test.py のロジックをスレッド化)
     """
     
@@ -372,6 +391,8 @@ def gravity_thread_func(camera_index, shared_state, lock):
     # grav_p_test.py から THRESHOLD を移動 (判定はメインスレッドで行うため不要)
     # THRESHOLD = 20 
 
+    gravity_frames = shared_state['gravity_frame'] # FrameChannel
+
     print(f"[重心スレッド]: カメラ({camera_index})の起動を試みます...")
     cap = cv2.VideoCapture(camera_index)
     if not cap.isOpened():
@@ -407,7 +428,8 @@ def gravity_thread_func(camera_index, shared_state, lock):
                 orig_height, orig_width = frame.shape[:2]
                 aspect_ratio = orig_height / orig_width
                 resize_height = int(RESIZE_WIDTH * aspect_ratio)
-                resized_frame = cv2.resize(frame, (RESIZE_WIDTH, resize_height), interpolation=cv2.INTER_AREA)
+                back = gravity_frames.back_buffer((resize_height, RESIZE_WIDTH, 3))
+                resized_frame = cv2.resize(frame, (RESIZE_WIDTH, resize_height), dst=back, interpolation=cv2.INTER_AREA)
                 height, width = resized_frame.shape[:2]
 
                 # --- 2. グレースケールに変換 ---
@@ -435,10 +457,10 @@ def gravity_thread_func(camera_index, shared_state, lock):
                 # 計算された重心の位置 (赤丸)
                 cv2.circle(resized_frame, (int(center_x), height // 2), 10, (0, 0, 255), -1)
 
-                # --- 6. 共有辞書へ書き込み (ロックを使用) ---
+                # --- 6. 共有辞書へ書き込み (ロックは値だけ。フレームはバッファの入れ替えで公開) ---
                 with lock:
                     shared_state['gravity_value'] = x_difference
-                    shared_state['gravity_frame'] = resized_frame.copy() 
+                gravity_frames.publish()
             
             except Exception as e:
                     print(f"[重心スレッド] 処理中に予期せぬエラー: {e}")
@@ -3,20 +3,121 @@
 
 import cv2
 import numpy as np
-import math
 import time
+from line_detectors import (create_line_detector, filter_diagonal_lines,
+                            estimate_vanishing_point, vanishing_point_inliers)
+from frame_deadline import FrameDeadline, DeadlineExceeded
+from line_tracker import LineBandTracker
+from coarse_to_fine import CoarseToFineRefiner
+from shared_capture import open_capture
+from rate_scheduler import RateScheduler
+from vision_records import new_steering_result, fill_steering_geometry, new_gravity_result
+from gravity_detection import (GravityDetector, gravity_thumbnail, decode_mjpeg_thumbnail,
+                               open_mjpeg_raw_capture, is_raw_jpeg, to_resized_coordinate)
+from wall_event_filter import WallEventFilter
+from depth_wall_fusion import DepthWallSource, DepthWallCheck, DEPTH_NEAR, DEPTH_AMBIGUOUS
+from wall_detection import (WallFragmentDetector, ColumnProjectionWallDetector,
+                            ParallelWallDetector, WallStripWatcher, split_wall_frame)
 
 # --- パラメータ (軽量化のため調整) ---
 RESIZE_WIDTH = 240
 MIN_NOISE_AREA = 80 
 
+# --- 線分検出バックエンド ('HOUGH' / 'LSD' / 'FLD') ---
+# line_detector_shootout.py の結果を見てカメラごとに選ぶ
+STEERING_LINE_BACKEND = 'HOUGH'
+WALL_LINE_BACKEND = 'HOUGH'
+
+# --- 壁の確認の方式 ---
+# 'LINES' : WALL_LINE_BACKEND の線分検出で内側の垂直線を探す
+# 'COLUMN': 線分検出を使わず、列ごとの縦エッジの投影と縦方向の連続長で探す (wall_benchmark.py で比較)
+WALL_DETECTOR_BACKEND = 'LINES'
+
+# --- 1フレームあたりの処理時間の予算 (秒) ---
+# 予算を超えそうなフレームは捨て、前回の推定値を「継続」として書き込む
+STEERING_FRAME_BUDGET_SEC = 0.25
+WALL_FRAME_BUDGET_SEC = 0.10
+
+# --- パイプ縁の追跡モード ---
+# True: 前フレームの斜め線の周りのバンドだけを探索する (一定間隔・追跡ロスト時は全画面)
+STEERING_TRACKING_MODE = True
+TRACKING_BAND_HALF_WIDTH = 8 # バンドの半幅 (ピクセル, RESIZE_WIDTH 基準)
+TRACKING_FULL_SEARCH_INTERVAL = 10 # 何フレームごとに全画面を探索し直すか
+
+# --- 粗→密 (coarse-to-fine) モード ---
+# True: RESIZE_WIDTH で見つけた線を FINE_WIDTH の細い帯の中だけで当てはめ直し、消失点を小数精度で求める
+STEERING_COARSE_TO_FINE = False
+FINE_WIDTH = 640
+FINE_STRIP_HALF_WIDTH = 4 # 帯の半幅 (FINE_WIDTH 基準のピクセル)
+
+# --- 壁検出のカスケード ---
+# True: 列プロファイル (Sobel-x の列合計) のピークが WALL_PRECHECK_THRESHOLD 以上の側だけ線分検出で確認する
+# (しきい値は wall_benchmark.py で録画データに対する再現率を見て決める)
+# 事前チェックで見逃すと壁で止まれないため、このしきい値での再現率を記録するまでは False にしておく
+WALL_CASCADE = False
+WALL_PRECHECK_THRESHOLD = 5.0
+# True: 右と左の画像を2本のワーカースレッドで同時に処理する (片側で壁が見つかればもう片側は打ち切る)
+WALL_PARALLEL_HALVES = True
+
+# --- 壁の見張りモード ---
+# True: 全体の検出 (TARGET_FPS) の合間に、左右の細い縦帯だけをカメラのフレームレートで見張り、
+#       縦エッジが現れた瞬間 (立ち上がり) に全体の検出を次の周期を待たずに実行する
+WALL_WATCH_MODE = True
+WALL_WATCH_STRIP_RANGE = (0.50, 0.62) # 右画像での帯の範囲 (幅に対する割合, 左画像は左右反転。録画で壁の線が最初に現れる位置に合わせる)
+WALL_WATCH_DOWNSCALE = 4 # 帯を間引く間隔 (ピクセル)
+WALL_WATCH_THRESHOLD = 5.0 # 帯の列プロファイルのピークのしきい値
+WALL_WATCH_MIN_INTERVAL = 0.05 # 全体の検出の直後、見張りを再開するまでの時間 (秒)
+
+# --- 壁イベントのフィルタ (wall_event_filter.WallEventFilter) ---
+# 直近 WALL_EVENT_WINDOW 回の検出のうち WALL_EVENT_REQUIRED 回 (重み付きなら重みの合計) 以上で
+# 壁ありのイベントを出す。共有状態 (vision_state.VisionState.wall.event) に信頼度・最初に見えた時刻と一緒に書き込む
+WALL_EVENT_REQUIRED = 2
+WALL_EVENT_WINDOW = 4
+WALL_EVENT_WEIGHTED = True # 線の長さと位置の一貫性で重みを付ける
+
+# --- 深度との統合 (depth_wall_fusion) ---
+# True: RealSense の深度で右/左の ROI までの距離を見て、近ければ壁あり・遠ければ壁なしと決め、
+#       あいまいな側だけ線分検出で確認する (pyrealsense2 が無い・起動できない場合は画像だけで検出)
+WALL_DEPTH_FUSION = False
+WALL_DEPTH_BAG_PATH = None # 録画した .bag ファイルで試す場合はパスを指定 (None ならライブのカメラ)
+WALL_DEPTH_NEAR_M = 0.30 # これより近ければ壁あり (メートル)
+WALL_DEPTH_FAR_M = 0.60 # これより遠ければ壁なし (メートル)
+WALL_DEPTH_ROIS = ((0.55, 0.3, 0.95, 0.7),  # 右の ROI (深度画像の幅・高さに対する割合)
+                   (0.05, 0.3, 0.45, 0.7))  # 左の ROI
+
+# --- 重心検出 (gravity_detection.GravityDetector) ---
+# 'NONE': 全画素の暗さで重み付け (従来どおり) / 'OTSU' / 'PERCENTILE': 暗い芯だけを使う
+GRAVITY_THRESHOLD_MODE = 'OTSU'
+GRAVITY_DARK_PERCENTILE = 20.0 # 'PERCENTILE' のとき、暗い方から何 % の画素を使うか
+# 行・列の重み: 'UNIFORM' / 行は 'PERSPECTIVE' (手前の床を軽く) / 列は 'CENTER'、または数値のリスト
+GRAVITY_ROW_PROFILE = 'PERSPECTIVE'
+GRAVITY_COLUMN_PROFILE = 'UNIFORM'
+GRAVITY_HORIZON = 0.5 # 'PERSPECTIVE' の地平線 (パイプの奥) の位置 (画像の高さに対する割合)
+GRAVITY_NEAR_WEIGHT = 0.2 # 'PERSPECTIVE' の一番下の行の重み
+# 重心を計算するサムネイルの幅 (None なら従来どおり RESIZE_WIDTH で計算)
+# 結果は RESIZE_WIDTH 基準の座標に直して書き込む (精度は gravity_validate.py で確認)
+GRAVITY_THUMBNAIL_WIDTH = 64 # 元の幅の整数分の1にすると INTER_AREA が速い (640px なら 32 / 64 など)
+GRAVITY_TARGET_FPS = 5 # 重心の処理レート (メイン側から指定されないとき)
+GRAVITY_FULL_RATE = True # True: サムネイルを使うときは GRAVITY_TARGET_FPS で間引かず毎フレーム処理する
+GRAVITY_MJPEG_RAW = False # True: カメラの MJPEG を展開せずに受け取り、1/8 のグレースケールで展開する (V4L2)
+
+# --- 処理レートの守り方 (rate_scheduler.py) ---
+# True : 次の処理の締切まで眠る (ライブのカメラは展開せずに空読みする)
+# False: 従来どおり毎回フレームを読み、1ms ずつ眠る (終了時の起床回数・CPU の比較用)
+PRECISE_RATE_SCHEDULING = True
+
+# --- 操舵結果レコード (vision_records.STEERING_RESULT_DTYPE) 用 ---
+STEERING_CAMERA_HFOV_DEG = 78.0 # 操舵カメラの水平画角 (使用カメラに合わせて設定)
+VP_INLIER_DISTANCE_PX = 3.0 # 消失点からこの距離以内の線をインライアとみなす
+
 # ===================================================================
 # スレッド1: 操舵用 (描画・フレーム共有を無効化)
 # ===================================================================
-def steering_thread_func(camera_index, shared_state, lock):
+def steering_thread_func(camera_index, state):
     """
     【スレッド版・ヘッドレス】
-    操舵（消失点）を検出し、ズレ量(float)のみを共有辞書に書き込む。
+    操舵（消失点）を検出し、ズレ量(float)と結果レコード(消失点・インライアの線・角度)を
+    共有状態 (vision_state.VisionState.steering) に書き込む。
     """
     
     # --- 操舵用パラメータ ---
@@ -30,24 +131,46 @@ def steering_thread_func(camera_index, shared_state, lock):
     TARGET_FPS = 2  
     INTERVAL = 1.0 / TARGET_FPS
 
+    line_detector = create_line_detector(STEERING_LINE_BACKEND,
+                                         canny_threshold1=CANNY_THRESHOLD1,
+                                         canny_threshold2=CANNY_THRESHOLD2,
+                                         hough_threshold=HOUGH_THRESHOLD,
+                                         min_line_length=HOUGH_MIN_LINE_LENGTH,
+                                         max_line_gap=HOUGH_MAX_LINE_GAP,
+                                         min_noise_area=MIN_NOISE_AREA)
+    deadline = FrameDeadline(STEERING_FRAME_BUDGET_SEC)
+    tracker = None
+    if STEERING_TRACKING_MODE:
+        tracker = LineBandTracker(band_half_width=TRACKING_BAND_HALF_WIDTH,
+                                  full_search_interval=TRACKING_FULL_SEARCH_INTERVAL)
+    refiner = None
+    if STEERING_COARSE_TO_FINE:
+        refiner = CoarseToFineRefiner(fine_width=FINE_WIDTH,
+                                      strip_half_width=FINE_STRIP_HALF_WIDTH,
+                                      canny_threshold1=CANNY_THRESHOLD1,
+                                      canny_threshold2=CANNY_THRESHOLD2)
+
     print(f"[操舵スレッド]: カメラ({camera_index})の起動を試みます...")
-    cap = cv2.VideoCapture(camera_index)
+    cap = open_capture(camera_index)
     if not cap.isOpened():
         print(f"[操舵スレッド] エラー: カメラ ({camera_index}) を開けません。")
-        with lock:
-            shared_state['stop'] = True 
+        state.request_stop()
         return
     print(f"[操舵スレッド]: カメラ({camera_index}) 起動完了。")
     
-    last_processed_time = time.time()
+    scheduler = RateScheduler(INTERVAL, precise=PRECISE_RATE_SCHEDULING)
+    frame_id = 0
+    last_result = None # 締切超過時に継続する前回の結果レコード
     
     # --- メインループ ---
     while True:
-        with lock:
-            if shared_state['stop']:
-                break
+        if state.should_stop():
+            break
+        # メイン側から処理レートを指定されていればそれに従う (FUSION モードでは消失点を間引く)
+        scheduler.set_interval(1.0 / (state.steering_target_fps or TARGET_FPS))
                 
-        ret, frame = cap.read()
+        # 次の処理の締切まで待ってから読む
+        ret, frame = scheduler.read(cap, state.stop_event)
         if not ret:
             print("[操舵スレッド] エラー: フレームを取得できません。")
             time.sleep(0.5)
@@ -55,12 +178,14 @@ def steering_thread_func(camera_index, shared_state, lock):
         
         current_time = time.time()
         
-        if(current_time - last_processed_time) >= INTERVAL:
+        if scheduler.due():
             
-            last_processed_time = current_time
+            scheduler.mark_processed()
         
             # --- 1. リサイズ ---
             try:
+                deadline.begin()
+                frame_id += 1
                 orig_height, orig_width = frame.shape[:2]
                 aspect_ratio = orig_height / orig_width
                 resize_height = int(RESIZE_WIDTH * aspect_ratio)
@@ -72,102 +197,89 @@ def steering_thread_func(camera_index, shared_state, lock):
                 clahe = cv2.createCLAHE(clipLimit=CLIP_LIMIT, tileGridSize=TILE_GRID_SIZE)
                 adjusted = clahe.apply(gray)
                 blurred_again = cv2.GaussianBlur(adjusted, (7, 7), 0)
-                edges = cv2.Canny(blurred_again, CANNY_THRESHOLD1, CANNY_THRESHOLD2)
+                deadline.check('preprocess')
                 
-                # --- 3. ノイズ除去 ---
-                num_labels, labels, stats, centroids = cv2.connectedComponentsWithStats(edges, connectivity=8)
-                cleaned_edges = np.zeros_like(edges)
-                for i in range(1, num_labels):
-                    if stats[i, cv2.CC_STAT_AREA] > MIN_NOISE_AREA:
-                        cleaned_edges[labels == i] = 255
+                # --- 3. 線分検出 (バックエンドは STEERING_LINE_BACKEND で選択) ---
+                # 追跡モードでは前フレームの縁の周りのバンドだけを探索する
+                if tracker is not None:
+                    segments = tracker.detect(blurred_again, line_detector, deadline)
+                else:
+                    segments = line_detector.detect(blurred_again, deadline)
+                deadline.check('lines', next_stage='vanishing_point')
                 
-                # --- 4. ハフ変換 & 消失点計算 ---
-                lines = cv2.HoughLinesP(cleaned_edges, 1, np.pi/180,
-                                        threshold=HOUGH_THRESHOLD,
-                                        minLineLength=HOUGH_MIN_LINE_LENGTH,
-                                        maxLineGap=HOUGH_MAX_LINE_GAP)
-                
-                diagonal_lines = []
+                # --- 4. 斜め線の抽出 & 消失点計算 ---
+                slopes, intercepts, diagonal_segments = filter_diagonal_lines(segments)
                 vp_x = width // 2
+                vp_y = height // 2
+                vanishing_point = estimate_vanishing_point(slopes, intercepts, width, height)
+                if vanishing_point is not None:
+                    vp_x, vp_y = vanishing_point
+                if tracker is not None:
+                    tracker.update(slopes, intercepts, diagonal_segments, vanishing_point is not None)
                 
-                if lines is not None:
-                    for line in lines:
-                        x1, y1, x2, y2 = line[0]
-                        angle_rad = math.atan2(y2 - y1, x2 - x1)
-                        angle_deg = math.degrees(angle_rad)
-                        abs_angle_deg = abs(angle_deg)
-
-                        is_horizontal = (abs_angle_deg <= 10) or (abs_angle_deg >= 175)
-                        is_vertical = (50 <= abs_angle_deg <= 130)
-                        if is_horizontal or is_vertical or x1 == x2:
-                            continue
-                        
-                        m = (y2 - y1) / (x2 - x1)
-                        c = y1 - m * x1
-                        diagonal_lines.append((m, c))
-
-                        # --- (描画処理 コメントアウト) ---
-                        # points = []
-                        # if m != 0:
-                        #     x_at_y0 = -c / m
-                        #     if 0 <= x_at_y0 <= width: points.append((int(x_at_y0), 0))
-                        #     x_at_y_height = (height - c) / m
-                        #     if 0 <= x_at_y_height <= width: points.append((int(x_at_y_height), height))
-                        # y_at_x0 = c
-                        # if 0 <= y_at_x0 <= height: points.append((0, int(y_at_x0)))
-                        # y_at_x_width = m * width + c
-                        # if 0 <= y_at_x_width <= height: points.append((width, int(y_at_x_width)))
-                    
-                        # if len(points) >= 2:
-                        #     cv2.line(resized_frame, points[0], points[1], (0, 255, 0), 2)
-                        # --- (描画処理 コメントアウトここまで) ---
-
-
-                intersection_points = []
-                if len(diagonal_lines) >= 2:
-                    for i in range(len(diagonal_lines)):
-                        for j in range(i + 1, len(diagonal_lines)):
-                            m1, c1 = diagonal_lines[i]
-                            m2, c2 = diagonal_lines[j]
-                            if abs(m1 - m2) < 1e-5 or m1*m2 >0 : continue
-                            x = (c2 - c1) / (m1 - m2)
-                            y = m1 * x + c1
-                            if -width < x < width * 2 and -height < y < height * 2:
-                                intersection_points.append((x, y))
-
-                if intersection_points:
-                    x_coords = [p[0] for p in intersection_points]
-                    vp_x = int(np.median(x_coords))
+                # --- 4b. 粗→密: 高解像度の帯の中で線を当てはめ直す ---
+                # (締切に間に合わないと予測される場合は粗い消失点のまま使う)
+                if refiner is not None and vanishing_point is not None:
+                    try:
+                        deadline.check('vanishing_point', next_stage='refine')
+                        refined_point = refiner.refine(frame, diagonal_segments, width)
+                        if refined_point is not None:
+                            vp_x, vp_y = refined_point
+                        deadline.check('refine')
+                    except DeadlineExceeded:
+                        pass
 
                 # --- 5. ズレ量を計算 ---
                 image_center_x = width / 2
                 x_difference = vp_x - image_center_x
                 
+                # --- 5a. 結果レコード (消失点・インライアの線・パイプ軸の角度) ---
+                result = new_steering_result()
+                result['timestamp'] = current_time
+                result['frame_id'] = frame_id
+                if vanishing_point is not None:
+                    inliers = vanishing_point_inliers(slopes, intercepts, (vp_x, vp_y), VP_INLIER_DISTANCE_PX)
+                else:
+                    inliers = np.zeros(len(slopes), dtype=bool)
+                fill_steering_geometry(result, vp_x, vp_y, vanishing_point is not None,
+                                       diagonal_segments[inliers], slopes[inliers],
+                                       width, height, STEERING_CAMERA_HFOV_DEG)
+                last_result = result
+                
                 # --- 5b. デバッグ描画 (コメントアウト) ---
-                # cv2.circle(resized_frame, (vp_x, height // 2), 10, (0, 0, 255), -1) 
+                # cv2.circle(resized_frame, (int(vp_x), int(vp_y)), 10, (0, 0, 255), -1) 
                 # cv2.line(resized_frame, (width // 2, 0), (width // 2, height), (255, 0, 0), 1)
 
-                # --- 6. 共有辞書へ書き込み (ロックを使用) ---
-                with lock:
-                    shared_state['steering_value'] = x_difference
-                    # shared_state['steering_frame'] = resized_frame.copy() # ★★★ GUI用にコメントアウト ★★★
+                # --- 6. 共有状態へ書き込み (ズレ量・レコード・継続フラグをまとめて) ---
+                state.steering.publish(value=x_difference, result=result, carried_forward=False)
+            except DeadlineExceeded as e:
+                # --- 締切超過: このフレームは捨て、前回の値を継続 ---
+                print(f"[操舵スレッド] {e}。前回の推定値を継続します。")
+                carried_result = None
+                if last_result is not None:
+                    carried_result = last_result.copy()
+                    carried_result['carried_forward'] = 1
+                if carried_result is not None:
+                    state.steering.publish(result=carried_result, carried_forward=True)
+                else:
+                    state.steering.publish(carried_forward=True)
             except Exception as e:
                     print(f"[操舵スレッド] 処理中に予期せぬエラー: {e}")
                     pass
-        
-        time.sleep(0.001) 
 
     cap.release()
+    print(f"[操舵スレッド]: {scheduler.report()}")
     print("[操舵スレッド]: カメラを解放しました。")
 
 
 # ===================================================================
 # スレッド2: 壁検出用 (描画・フレーム共有を無効化)
 # ===================================================================
-def wall_thread_func(camera_index, shared_state, lock):
+def wall_thread_func(camera_index, state):
     """
     【スレッド版・360度カメラ対応・ヘッドレス】
-    壁を検出し、フラグのみを共有辞書に書き込む。
+    壁を検出し、フラグのみを共有状態 (vision_state.VisionState.wall) に書き込む。
+    WALL_CASCADE が有効なら、列プロファイルの事前チェックを通った側だけ線分検出で確認する。
     """
 
     # --- 壁検出用パラメータ ---
@@ -180,188 +292,230 @@ def wall_thread_func(camera_index, shared_state, lock):
     TILE_GRID_SIZE = (12, 12)
     TARGET_FPS = 5  
     INTERVAL = 1.0 / TARGET_FPS
+
+    def make_fragment_detector():
+        if WALL_DETECTOR_BACKEND == 'COLUMN':
+            return ColumnProjectionWallDetector(resize_width=RESIZE_WIDTH,
+                                                clip_limit=CLIP_LIMIT,
+                                                tile_grid_size=TILE_GRID_SIZE,
+                                                precheck_threshold=WALL_PRECHECK_THRESHOLD if WALL_CASCADE else None,
+                                                edge_threshold=CANNY_THRESHOLD2,
+                                                min_line_length=HOUGH_MIN_LINE_LENGTH,
+                                                max_line_gap=HOUGH_MAX_LINE_GAP)
+        line_detector = create_line_detector(WALL_LINE_BACKEND,
+                                             canny_threshold1=CANNY_THRESHOLD1,
+                                             canny_threshold2=CANNY_THRESHOLD2,
+                                             hough_threshold=HOUGH_THRESHOLD,
+                                             min_line_length=HOUGH_MIN_LINE_LENGTH,
+                                             max_line_gap=HOUGH_MAX_LINE_GAP)
+        return WallFragmentDetector(line_detector,
+                                    resize_width=RESIZE_WIDTH,
+                                    clip_limit=CLIP_LIMIT,
+                                    tile_grid_size=TILE_GRID_SIZE,
+                                    precheck_threshold=WALL_PRECHECK_THRESHOLD if WALL_CASCADE else None)
+
+    if WALL_PARALLEL_HALVES:
+        parallel_detector = ParallelWallDetector(make_fragment_detector, WALL_FRAME_BUDGET_SEC)
+    else:
+        fragment_detector = make_fragment_detector()
+        deadline = FrameDeadline(WALL_FRAME_BUDGET_SEC)
+    
+    strip_watcher = WallStripWatcher(strip_range=WALL_WATCH_STRIP_RANGE,
+                                     downscale=WALL_WATCH_DOWNSCALE,
+                                     threshold=WALL_WATCH_THRESHOLD)
+    watch_active = False # 前回の見張りで縦エッジが出ていたか (立ち上がりだけで全体の検出を起こす)
+    wall_event_filter = WallEventFilter(required_count=WALL_EVENT_REQUIRED,
+                                        window_size=WALL_EVENT_WINDOW,
+                                        weighted=WALL_EVENT_WEIGHTED)
+
+    depth_source, depth_check = None, None
+    if WALL_DEPTH_FUSION:
+        try:
+            depth_source = DepthWallSource(bag_path=WALL_DEPTH_BAG_PATH)
+            depth_check = DepthWallCheck(rois=WALL_DEPTH_ROIS,
+                                         near_m=WALL_DEPTH_NEAR_M, far_m=WALL_DEPTH_FAR_M)
+            print("[壁検出スレッド]: 深度カメラを起動しました。")
+        except Exception as e:
+            print(f"[壁検出スレッド] 深度カメラを使えません。画像だけで検出します: {e}")
     
     print(f"[壁検出スレッド]: カメラ({camera_index})の起動を試みます...")
-    cap = cv2.VideoCapture(camera_index)
+    cap = open_capture(camera_index)
     if not cap.isOpened():
         print(f"[壁検出スレッド] エラー: カメラ ({camera_index}) を開けません。")
-        with lock:
-            shared_state['stop'] = True 
+        state.request_stop()
         return
     print(f"[壁検出スレッド]: カメラ({camera_index}) 起動完了。")
 
-    last_processed_time = time.time()
+    scheduler = RateScheduler(INTERVAL, precise=PRECISE_RATE_SCHEDULING)
     
     # --- メインループ ---
     while True:
-        with lock:
-            if shared_state['stop']:
-                break
+        if state.should_stop():
+            break
 
-        ret, frame = cap.read()
+        # メイン側から処理レートを指定されていればそれに従う (detector_rates.py)
+        scheduler.set_interval(1.0 / (state.wall_target_fps or TARGET_FPS))
+        # 見張りをする場合は毎フレーム、しない場合は次の処理の締切まで待ってから読む
+        ret, frame = scheduler.read(cap, state.stop_event, every_frame=WALL_WATCH_MODE)
         if not ret or frame is None:
             print("[壁検出スレッド] エラー: フレームを取得できません。")
             time.sleep(0.5)
             continue
         
         current_time = time.time()
+        run_full_check = scheduler.due()
+        
+        # --- 見張り: 周期の合間は細い縦帯だけを見る ---
+        if (not run_full_check and WALL_WATCH_MODE
+                and scheduler.since_processed() >= WALL_WATCH_MIN_INTERVAL):
+            try:
+                watch_fired = strip_watcher.check(split_wall_frame(frame))
+                run_full_check = watch_fired and not watch_active
+                watch_active = watch_fired
+            except Exception as e:
+                print(f"[壁検出スレッド] 見張りエラー: {e}")
         
-        if(current_time - last_processed_time) >= INTERVAL:
+        if run_full_check:
             
-            last_processed_time = current_time
+            # 見張りで起こした場合も周期はここから数え直す (平均の処理回数を増やさないため)
+            scheduler.mark_processed()
         
             wall_line_detected = 0
-            # processed_frames = [] # ★★★ GUI用にコメントアウト ★★★
+            frame_abandoned = None # 締切超過で打ち切った場合の例外
+            all_fragments_failed = False # 処理した側がすべて例外で終わった (壁なしの結果ではない)
+            wall_side, wall_evidence = None, None # 壁を確認した側とその線 (イベントの重み付け用)
             
             # --- 1. フレームを上下（右と左）に分割 ---
             try:
-                orig_height, orig_width = frame.shape[:2]
-                half_height = orig_height // 2
-                
-                frame_right = frame[0:half_height, :] #上半分=右
-                frame_left = frame[half_height:, :] #下半分=左
-                
-                fragments = [frame_right, frame_left]
-            
+                fragments = split_wall_frame(frame) # (上半分=右, 下半分=左)
             except Exception as e:
                 print(f"[壁検出スレッド] フレーム分割エラー: {e}")
                 continue
                 
-            # --- 2. 分割した画像を個別に処理 ---
-            for i, img_fragment in enumerate(fragments):
-                
-                is_right_image = (i == 0)
-                
-                # fragment_detected = 0 # ★★★ GUI用にコメントアウト ★★★
-                resized_frame = None 
-                width, height = 0, 0 # スコープのために初期化
-
+            # --- 1.5 深度で判定できる側は線分検出を省略する ---
+            if depth_check is not None:
                 try:
-                    # --- 2a. リサイズ ---
-                    orig_h_frag, orig_w_frag = img_fragment.shape[:2]
-                    if orig_h_frag == 0 or orig_w_frag == 0:
-                        raise ValueError("Fragment is empty")
-                        
-                    aspect_ratio = orig_h_frag / orig_w_frag
-                    resize_height = int(RESIZE_WIDTH * aspect_ratio)
-                    resized_frame = cv2.resize(img_fragment, (RESIZE_WIDTH, resize_height), interpolation=cv2.INTER_AREA)
-                    height, width = resized_frame.shape[:2] 
-
-                    # --- 2b. 前処理 ---
-                    gray = cv2.cvtColor(resized_frame, cv2.COLOR_BGR2GRAY)
-                    clahe = cv2.createCLAHE(clipLimit=CLIP_LIMIT, tileGridSize=TILE_GRID_SIZE)
-                    adjusted = clahe.apply(gray)
-                    blurred_again = cv2.GaussianBlur(adjusted, (7, 7), 0)
-                    edges = cv2.Canny(blurred_again, CANNY_THRESHOLD1, CANNY_THRESHOLD2)
-                    
-                    # --- 2d. ハフ変換 ---
-                    lines = cv2.HoughLinesP(edges, 1, np.pi / 180,
-                                            threshold=HOUGH_THRESHOLD,
-                                            minLineLength=HOUGH_MIN_LINE_LENGTH,
-                                            maxLineGap=HOUGH_MAX_LINE_GAP)
-                    
-                    # --- 2e. 検出ロジック ---
-                    if lines is not None:
-                        image_center_x = width / 2 # イメージ中心
-                        
-                        for line in lines:
-                            x1, y1, x2, y2 = line[0]
-                            angle_deg = math.degrees(math.atan2(y2 - y1, x2 - x1))
-                            abs_angle_deg = abs(angle_deg)
-                            
-                            is_vertical = (80 <= abs_angle_deg <= 100)
-                            
-                            if is_vertical:
-                                line_center_x = (x1 + x2) / 2
-                                
-                                detection_condition_met = False
-                                if is_right_image:
-                                    if line_center_x > image_center_x:
-                                        detection_condition_met = True
-                                else:
-                                    if line_center_x < image_center_x:
-                                        detection_condition_met = True
-                                
-                                if detection_condition_met:
-                                    # fragment_detected = 1 # ★★★ GUI用にコメントアウト ★★★
-                                    wall_line_detected = 1    
-                                    
-                                    # --- (描画処理 コメントアウト) ---
-                                    # start_point, end_point = None, None
-                                    # if x1 == x2:  
-                                    #     start_point = (x1, 0)
-                                    #     end_point = (x1, height)
-                                    # else:  
-                                    #     m = (y2 - y1) / (x2 - x1)
-                                    #     c = y1 - m * x1
-                                    #     start_point = (0, int(c))
-                                    #     end_point = (width, int(m * width + c))
-                                    # cv2.line(resized_frame, start_point, end_point, (0, 0, 255), 2)
-                                    # --- (描画処理 コメントアウトここまで) ---
-                                    break # 1本見つかればOK
-                
+                    depth_decisions = depth_check.classify(depth_source.read())
+                    if DEPTH_NEAR in depth_decisions:
+                        wall_line_detected = 1
+                        wall_side = depth_decisions.index(DEPTH_NEAR)
+                    else:
+                        fragments = [img_fragment if decision == DEPTH_AMBIGUOUS else None
+                                     for img_fragment, decision in zip(fragments, depth_decisions)]
                 except Exception as e:
-                    print(f"[壁検出スレッド] Fragment処理エラー: {e}")
-                    if width == 0: width = RESIZE_WIDTH
-                    if height == 0: height = int(RESIZE_WIDTH * (3/4))
-                    # resized_frame = np.zeros((height, width, 3), dtype=np.uint8) # ★★★ GUI用にコメントアウト ★★★
-
-
-                # --- 2f. 描画 (コメントアウト) ---
-                # if width > 0 and height > 0:
-                #     cv2.line(resized_frame, (width // 2, 0), (width // 2, height), (255, 0, 0), 1) 
+                    print(f"[壁検出スレッド] 深度の読み込みエラー: {e}")
                 
-                # processed_frames.append(resized_frame) # ★★★ GUI用にコメントアウト ★★★
+            # --- 2. 分割した画像を処理 (事前チェック → 線分検出で確認) ---
+            if wall_line_detected:
+                pass # 深度で壁ありと判定済み
+            elif WALL_PARALLEL_HALVES:
+                wall_line_detected, frame_abandoned = parallel_detector.detect(fragments)
+                wall_side, wall_evidence = parallel_detector.last_side, parallel_detector.last_evidence
+                all_fragments_failed = parallel_detector.last_all_failed
+            else:
+                deadline.begin()
+                processed_fragments = 0
+                failed_fragments = 0
+                for i, img_fragment in enumerate(fragments):
+                    if img_fragment is None:
+                        continue # 深度で判定済み
+                    is_right_image = (i == 0)
+                    processed_fragments += 1
+                    try:
+                        if fragment_detector.detect(img_fragment, is_right_image, deadline):
+                            wall_line_detected = 1
+                            wall_side, wall_evidence = i, fragment_detector.last_evidence
+                            break # 片側で見つかればOK
+                    except DeadlineExceeded as e:
+                        frame_abandoned = e
+                        break
+                    except Exception as e:
+                        failed_fragments += 1
+                        print(f"[壁検出スレッド] Fragment処理エラー: {e}")
+                all_fragments_failed = processed_fragments > 0 and failed_fragments == processed_fragments
 
-            # --- 3. 処理済みフレームを *別々に* 共有 ★ ---
+            # --- 3. 結果を共有 ---
             try:
-                with lock:
-                    shared_state['wall_detected'] = wall_line_detected
-                    # shared_state['wall_frame_right'] = processed_frames[0].copy() # ★★★ GUI用にコメントアウト ★★★
-                    # shared_state['wall_frame_left'] = processed_frames[1].copy() # ★★★ GUI用にコメントアウト ★★★
+                if all_fragments_failed:
+                    # --- 検出が例外で終わった: 壁なしとして書き込むと、ウォッチドッグが新しいデータと数えてしまう ---
+                    print("[壁検出スレッド] 壁の検出に失敗しました。前回の検出結果を継続します。")
+                    state.wall.publish(carried_forward=True)
+                elif frame_abandoned is not None and not wall_line_detected:
+                    # --- 締切超過: 壁が見つかっていなければ前回の値を継続 ---
+                    print(f"[壁検出スレッド] {frame_abandoned}。前回の検出結果を継続します。")
+                    state.wall.publish(carried_forward=True)
+                else:
+                    wall_event = wall_event_filter.update(current_time, wall_line_detected,
+                                                          wall_side, wall_evidence)
+                    state.wall.publish(detected=wall_line_detected, event=wall_event,
+                                       carried_forward=False)
             
             except Exception as e:
-                # processed_frames が空の場合に Index Error が発生する可能性があるが、
-                # GUIを無効化したため、このエラーは発生しなくなる
-                print(f"[壁検出スレッド] 共有辞書への保存エラー: {e}")
-            
-        time.sleep(0.001) 
+                print(f"[壁検出スレッド] 共有状態への保存エラー: {e}")
 
+    if WALL_PARALLEL_HALVES:
+        parallel_detector.shutdown()
+    if depth_source is not None:
+        depth_source.close()
     cap.release()
+    print(f"[壁検出スレッド]: 壁イベント {wall_event_filter.confirmed_event_count} 回 "
+          f"(フィルタなしなら {wall_event_filter.raw_event_count} 回)")
+    print(f"[壁検出スレッド]: {scheduler.report()}")
     print("[壁検出スレッド]: カメラを解放しました。")
     
 
 # ===================================================================
 # スレッド3: 重心検出用 (描画・フレーム共有を無効化)
 # ===================================================================
-def gravity_thread_func(camera_index, shared_state, lock):
+def gravity_default_fps():
+    """重心スレッドが処理レートを指定されないときの FPS (毎フレーム処理するなら None = カメラのフレームレート)。"""
+    if GRAVITY_THUMBNAIL_WIDTH is not None and GRAVITY_FULL_RATE:
+        return None
+    return GRAVITY_TARGET_FPS
+
+
+def gravity_thread_func(camera_index, state):
     """
     【スレッド版・ヘッドレス】
-    最も暗い部分の重心を検出し、ズレ量(float)のみを共有辞書に書き込む。
+    最も暗い部分の重心を検出し、ズレ量(float)と結果レコード(重心x/y・面積・広がり)を
+    共有状態 (vision_state.VisionState.gravity) に書き込む。
     """
     
     # --- 重心検出用パラメータ ---
-    TARGET_FPS = 5  
-    INTERVAL = 1.0 / TARGET_FPS
+    TARGET_FPS = gravity_default_fps()
+    INTERVAL = 1.0 / TARGET_FPS if TARGET_FPS else 0.0 # 0 ならカメラのフレームレートで処理する
+
+    gravity_detector = GravityDetector(threshold_mode=GRAVITY_THRESHOLD_MODE,
+                                       dark_percentile=GRAVITY_DARK_PERCENTILE,
+                                       row_profile=GRAVITY_ROW_PROFILE,
+                                       column_profile=GRAVITY_COLUMN_PROFILE,
+                                       horizon=GRAVITY_HORIZON,
+                                       near_weight=GRAVITY_NEAR_WEIGHT)
+    frame_id = 0
 
     print(f"[重心スレッド]: カメラ({camera_index})の起動を試みます...")
-    cap = cv2.VideoCapture(camera_index)
+    if GRAVITY_MJPEG_RAW and isinstance(camera_index, int):
+        cap = open_mjpeg_raw_capture(camera_index)
+    else:
+        cap = open_capture(camera_index)
     if not cap.isOpened():
         print(f"[重心スレッド] エラー: カメラ ({camera_index}) を開けません。")
-        with lock:
-            shared_state['stop'] = True 
+        state.request_stop()
         return
     print(f"[重心スレッド]: カメラ({camera_index}) 起動完了。")
     
-    last_processed_time = time.time()
+    scheduler = RateScheduler(INTERVAL, precise=PRECISE_RATE_SCHEDULING)
     
     # --- メインループ ---
     while True:
-        with lock:
-            if shared_state['stop']:
-                break
+        if state.should_stop():
+            break
                 
-        ret, frame = cap.read()
+        # メイン側から処理レートを指定されていればそれに従う (指定が無ければ INTERVAL)
+        gravity_target_fps = state.gravity_target_fps
+        scheduler.set_interval(1.0 / gravity_target_fps if gravity_target_fps else INTERVAL)
+        # 次の処理の締切まで待ってから読む (INTERVAL が 0 ならカメラのフレームごと)
+        ret, frame = scheduler.read(cap, state.stop_event)
         if not ret:
             print("[重心スレッド] エラー: フレームを取得できません。")
             time.sleep(0.5)
@@ -369,47 +523,68 @@ def gravity_thread_func(camera_index, shared_state, lock):
         
         current_time = time.time()
         
-        if(current_time - last_processed_time) >= INTERVAL:
+        if scheduler.due():
             
-            last_processed_time = current_time
+            scheduler.mark_processed()
         
             try:
-                # --- 1. リサイズ ---
-                orig_height, orig_width = frame.shape[:2]
-                aspect_ratio = orig_height / orig_width
-                resize_height = int(RESIZE_WIDTH * aspect_ratio)
-                resized_frame = cv2.resize(frame, (RESIZE_WIDTH, resize_height), interpolation=cv2.INTER_AREA)
-                height, width = resized_frame.shape[:2]
-
-                # --- 2. グレースケールに変換 ---
-                gray_frame = cv2.cvtColor(resized_frame, cv2.COLOR_BGR2GRAY)
+                # --- 1〜2. 重心を計算するグレースケール画像を作る ---
+                if is_raw_jpeg(frame):
+                    # MJPEG を展開せずに受け取った場合: 1/8 で展開 (DC 成分相当)
+                    gray_frame = decode_mjpeg_thumbnail(frame, GRAVITY_THUMBNAIL_WIDTH)
+                    if gray_frame is None:
+                        raise ValueError("JPEG を展開できません")
+                elif GRAVITY_THUMBNAIL_WIDTH is not None:
+                    gray_frame = gravity_thumbnail(frame, GRAVITY_THUMBNAIL_WIDTH)
+                else:
+                    orig_height, orig_width = frame.shape[:2]
+                    aspect_ratio = orig_height / orig_width
+                    resize_height = int(RESIZE_WIDTH * aspect_ratio)
+                    resized_frame = cv2.resize(frame, (RESIZE_WIDTH, resize_height), interpolation=cv2.INTER_AREA)
+                    gray_frame = cv2.cvtColor(resized_frame, cv2.COLOR_BGR2GRAY)
+                height, width = gray_frame.shape[:2]
+                scale = RESIZE_WIDTH / width # 結果は RESIZE_WIDTH 基準の座標で出す (操舵のしきい値と単位を合わせる)
 
-                # --- 3. 重心計算 ---
-                inverted_array = 255 - gray_frame
-                total_weight = np.sum(inverted_array)
-                center_x = width / 2 
-                if total_weight > 0:
-                    x_coords = np.arange(width)
-                    center_x = np.sum(x_coords * np.sum(inverted_array, axis=0)) / total_weight
+                # --- 3. 重心計算 (列・行の合計を1回ずつ) ---
+                gravity = gravity_detector.compute(gray_frame)
+                image_center_x = RESIZE_WIDTH / 2
+                if gravity['found']:
+                    center_x = to_resized_coordinate(gravity['x'], scale)
+                    center_y = to_resized_coordinate(gravity['y'], scale)
+                else:
+                    # 見つからなければ画像中心 (縮小画像の中心を変換するとピクセル中心の補正の分だけずれる)
+                    center_x = image_center_x
+                    center_y = height * scale / 2
 
                 # --- 4. ズレ量を計算 ---
-                image_center_x = width / 2
                 x_difference = center_x - image_center_x
                 
                 # --- 5. デバッグ描画 (コメントアウト) ---
                 # cv2.line(resized_frame, (width // 2, 0), (width // 2, height), (255, 255, 0), 2)
-                # cv2.circle(resized_frame, (int(center_x), height // 2), 10, (0, 0, 255), -1)
+                # cv2.circle(resized_frame, (int(center_x), int(center_y)), 10, (0, 0, 255), -1)
+
+                # --- 6. 結果レコードを作る ---
+                frame_id += 1
+                result = new_gravity_result()
+                result['timestamp'] = current_time
+                result['frame_id'] = frame_id
+                result['image_width'] = RESIZE_WIDTH
+                result['image_height'] = int(round(height * scale))
+                result['x_difference'] = x_difference
+                result['x'] = center_x
+                result['y'] = center_y
+                result['spread_x'] = gravity['spread_x'] * scale
+                result['spread_y'] = gravity['spread_y'] * scale
+                for key in ('found', 'area', 'threshold'):
+                    result[key] = gravity[key]
 
-                # --- 6. 共有辞書へ書き込み (ロックを使用) ---
-                with lock:
-                    shared_state['gravity_value'] = x_difference
-                    # shared_state['gravity_frame'] = resized_frame.copy() # ★★★ GUI用にコメントアウト ★★★
+                # --- 7. 共有状態へ書き込み ---
+                state.gravity.publish(value=x_difference, result=result)
             
             except Exception as e:
                     print(f"[重心スレッド] 処理中に予期せぬエラー: {e}")
                     pass
-        
-        time.sleep(0.001) 
 
     cap.release()
+    print(f"[重心スレッド]: {scheduler.report()}")
     print("[重心スレッド]: カメラを解放しました。")
\ No newline at end of file
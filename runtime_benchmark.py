@@ -0,0 +1,94 @@
+# ファイル名: runtime_benchmark.py
+# 検出器をスレッドで動かす場合と、プロセスで動かす場合 (process_runtime.py) の処理量の比較用スクリプト
+#
+# 録画した動画を繰り返し再生してカメラの代わりにし、操舵・壁・重心の3つの検出器を
+#   - THREAD : これまでどおり1つのプロセスの中のスレッドで (SharedCapture + VisionState)
+#   - PROCESS: 検出器ごとに別プロセスで (SharedMemoryCapture + SharedVisionState)
+# 同じ時間だけ動かし、それぞれの検出器が1秒あたりに書き込んだ結果の数と、その合計を表示する。
+# 操舵は TARGET_FPS で間引かず、できるだけ速く回す (steering_target_fps を大きくする)。
+# GIL で詰まっているぶんは、コア数が多いほど PROCESS の合計が大きくなる。
+#
+# 使い方: python runtime_benchmark.py <操舵・重心用の動画> [<壁検出用の動画>]
+
+import os
+import sys
+import threading
+import time
+
+from robot_vision_thread_headless import steering_thread_func, wall_thread_func, gravity_thread_func
+from shared_capture import SharedCapture
+from vision_state import VisionState
+from process_runtime import SharedMemoryCapture, SharedVisionState, detector_process
+
+# 計測の前に動かしておく時間 (プロセスの起動・カメラの準備) と計測する時間 (秒)
+WARMUP_SEC = 3.0
+MEASURE_SEC = 10.0
+# 操舵の処理レート (FPS)。大きくして間引きを無くす
+STEERING_BENCHMARK_FPS = 1000
+
+RUNTIMES = ['THREAD', 'PROCESS']
+DETECTORS = [('操舵', 'steering'), ('壁', 'wall'), ('重心', 'gravity')]
+
+
+def run(runtime, video_path, wall_video_path):
+    """1つの方式で3つの検出器を動かし、{スロット名: 1秒あたりの結果数} を返す。"""
+    if runtime == 'THREAD':
+        state = VisionState()
+        camera = SharedCapture(video_path, loop=True)
+        wall_camera = SharedCapture(wall_video_path, loop=True)
+        make_worker = lambda func, source: threading.Thread(target=func, args=(source, state))
+    else:
+        state = SharedVisionState()
+        camera = SharedMemoryCapture(video_path, loop=True)
+        wall_camera = SharedMemoryCapture(wall_video_path, loop=True)
+        make_worker = lambda func, source: detector_process(func, source, state)
+    state.steering_target_fps = STEERING_BENCHMARK_FPS
+
+    workers = [make_worker(steering_thread_func, camera.consumer()),
+               make_worker(wall_thread_func, wall_camera.consumer()),
+               make_worker(gravity_thread_func, camera.consumer())]
+    for worker in workers:
+        worker.start()
+
+    time.sleep(WARMUP_SEC)
+    start_versions = {name: getattr(state, name).version for _, name in DETECTORS}
+    start_time = time.time()
+    time.sleep(MEASURE_SEC)
+    end_versions = {name: getattr(state, name).version for _, name in DETECTORS}
+    elapsed = time.time() - start_time
+
+    state.request_stop()
+    for worker in workers:
+        worker.join()
+    camera.close()
+    wall_camera.close()
+    if runtime == 'PROCESS':
+        state.close()
+    return {name: (end_versions[name] - start_versions[name]) / elapsed for _, name in DETECTORS}
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("使い方: python runtime_benchmark.py <操舵・重心用の動画> [<壁検出用の動画>]")
+        return
+    video_path = sys.argv[1]
+    wall_video_path = sys.argv[2] if len(sys.argv) > 2 else video_path
+
+    results = {}
+    for runtime in RUNTIMES:
+        print(f"\n=== {runtime} で計測中 ({WARMUP_SEC:.0f} + {MEASURE_SEC:.0f} 秒) ===")
+        results[runtime] = run(runtime, video_path, wall_video_path)
+
+    print(f"\n=== 1秒あたりの結果数 (CPU コア数: {os.cpu_count()}) ===")
+    print(f"{'方式':<10}" + "".join(f"{label:>10}" for label, _ in DETECTORS) + f"{'合計':>10}")
+    for runtime in RUNTIMES:
+        rates = results[runtime]
+        print(f"{runtime:<10}" + "".join(f"{rates[name]:>10.1f}" for _, name in DETECTORS)
+              + f"{sum(rates.values()):>10.1f}")
+    thread_total = sum(results['THREAD'].values())
+    if thread_total > 0:
+        print(f"\nPROCESS / THREAD: {sum(results['PROCESS'].values()) / thread_total:.2f} 倍")
+
+
+if __name__ == '__main__':
+    main()
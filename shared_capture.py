@@ -0,0 +1,118 @@
+# ファイル名: shared_capture.py
+# (robot_vision_thread_headless.py と同じフォルダに保存してください)
+#
+# 1台のカメラを複数の検出スレッドで使うためのモジュール。
+# 同じカメラを cv2.VideoCapture で2回開くことは (V4L2 では) できないため、
+# 読み込み専用のスレッドが1つだけカメラを開き、最新のフレームを各スレッドに配る。
+#   shared = SharedCapture(0)
+#   threading.Thread(target=steering_thread_func, args=(shared.consumer(), shared_state, lock))
+#   threading.Thread(target=gravity_thread_func, args=(shared.consumer(), shared_state, lock))
+# 検出スレッドは open_capture() でカメラを開くので、カメラ番号の代わりに consumer() を渡せる。
+# (別プロセスで動かす場合は process_runtime.SharedMemoryCapture の consumer() を渡す)
+# 配るフレームは共有 (コピーしない) なので、受け取った側は書き換えないこと。
+
+import threading
+import cv2
+
+
+def open_capture(source):
+    """カメラ番号・動画ファイルなら cv2.VideoCapture を、読み口 (read() を持つもの) ならそのまま返す。"""
+    if isinstance(source, CaptureConsumer) or hasattr(source, 'read'):
+        return source
+    return cv2.VideoCapture(source)
+
+
+class SharedCapture:
+    """
+    カメラを1回だけ開き、読み込みスレッドで最新のフレームを保持する。
+    loop: True なら動画ファイルの終わりで先頭に戻る (ベンチマーク用)
+    reader_init: 読み込みスレッドの最初に呼ぶ関数 (cpu_policy.CpuPolicy.thread_initializer('capture') など)
+    """
+
+    def __init__(self, source, loop=False, reader_init=None):
+        self.source = source
+        self.loop = loop
+        self.reader_init = reader_init
+        self.cap = cv2.VideoCapture(source)
+        self.condition = threading.Condition()
+        self.frame = None
+        self.frame_id = 0 # 読み込んだフレームの通し番号
+        self.running = self.cap.isOpened()
+        self.num_consumers = 0
+        self.thread = None
+        if self.running:
+            self.thread = threading.Thread(target=self._reader, daemon=True)
+            self.thread.start()
+
+    def _reader(self):
+        if self.reader_init is not None:
+            self.reader_init()
+        while self.running:
+            ret, frame = self.cap.read()
+            if not ret and self.loop:
+                self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                continue
+            with self.condition:
+                if not ret:
+                    # カメラが外れた・動画の終わり: 待っている側を起こして終わる
+                    self.running = False
+                else:
+                    self.frame = frame
+                    self.frame_id += 1
+                self.condition.notify_all()
+        self.cap.release()
+
+    def consumer(self):
+        """検出スレッドに渡す読み口を作る。"""
+        with self.condition:
+            self.num_consumers += 1
+        return CaptureConsumer(self)
+
+    def close(self):
+        """読み込みスレッドを止めてカメラを解放する (全員の release() 後に呼ぶ)。"""
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join()
+
+    def _release_consumer(self):
+        with self.condition:
+            self.num_consumers -= 1
+            if self.num_consumers <= 0:
+                self.running = False
+                self.condition.notify_all()
+
+
+class CaptureConsumer:
+    """
+    SharedCapture の読み口。cv2.VideoCapture と同じ isOpened() / read() / release() を持つ。
+    read() は前回読んだものより新しいフレームが来るまで待つ (同じフレームを二度返さない)。
+    """
+
+    def __init__(self, shared, timeout=1.0):
+        self.shared = shared
+        self.timeout = timeout
+        self.last_frame_id = 0
+        self.released = False
+
+    def __repr__(self):
+        return f"共有:{self.shared.source}"
+
+    def isOpened(self):
+        return self.shared.running or self.shared.frame is not None
+
+    def read(self):
+        shared = self.shared
+        with shared.condition:
+            shared.condition.wait_for(lambda: shared.frame_id > self.last_frame_id or not shared.running,
+                                      timeout=self.timeout)
+            if shared.frame_id <= self.last_frame_id:
+                return False, None
+            self.last_frame_id = shared.frame_id
+            return True, shared.frame
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.shared._release_consumer()
@@ -0,0 +1,95 @@
+# ファイル名: steering_fusion.py
+# (main_control_thread_serial.py と同じフォルダに保存してください)
+#
+# 消失点 (steering_value) と暗部の重心 (gravity_value) を統合して、操舵のズレ量を推定するカルマンフィルタ。
+#   状態: [s, b]
+#     s: パイプの軸のズレ量 (RESIZE_WIDTH 基準のピクセル, 消失点の x_difference と同じ単位)
+#     b: 重心と消失点の差 (バイアス)。カメラの取り付けや照明で生じる、ゆっくり変わる差
+#   観測: 消失点 = s、重心 = s + b
+# 消失点は遅い (1〜2 FPS) が正確、重心は速い (カメラのフレームレート) がずれやすいので、
+# 消失点が来るたびに b を学習し、その間は重心で s を更新し続ける。
+# 各観測の分散は「基準の分散 / 信頼度」に、処理の遅れ (レイテンシ) の分だけ予測の不確かさを足して決める。
+
+import numpy as np
+
+
+class SteeringFusion:
+    """
+    vp_noise_px / gravity_noise_px: 信頼度1のときの観測の標準偏差 (ピクセル)
+    offset_drift_px: ズレ量 s が1秒あたりに変わりうる大きさ (標準偏差)
+    bias_drift_px: バイアス b が1秒あたりに変わりうる大きさ (標準偏差)
+    """
+
+    def __init__(self, vp_noise_px=4.0, gravity_noise_px=8.0,
+                 offset_drift_px=30.0, bias_drift_px=2.0, initial_std_px=60.0):
+        self.vp_variance = vp_noise_px ** 2
+        self.gravity_variance = gravity_noise_px ** 2
+        self.offset_drift = offset_drift_px ** 2
+        self.bias_drift = bias_drift_px ** 2
+        self.initial_variance = initial_std_px ** 2
+        self.reset()
+
+    def reset(self):
+        self.state = np.zeros(2)
+        self.covariance = np.diag([self.initial_variance, self.initial_variance])
+        self.time = None # 状態の時刻 (最後に観測を取り込んだ時刻)
+
+    def _process_noise(self, dt):
+        return np.diag([self.offset_drift * dt, self.bias_drift * dt])
+
+    def _predict(self, timestamp):
+        """状態を timestamp まで進める (ランダムウォークなので共分散だけ増える)。"""
+        if self.time is None:
+            self.time = timestamp
+            return
+        dt = timestamp - self.time
+        if dt > 0:
+            self.covariance = self.covariance + self._process_noise(dt)
+            self.time = timestamp
+
+    def _update(self, h, value, timestamp, variance):
+        if self.time is not None and timestamp < self.time:
+            # 遅れて届いた古い観測: 状態は戻さず、遅れの分だけ不確かさを大きくして取り込む
+            variance += self.offset_drift * (self.time - timestamp)
+        else:
+            self._predict(timestamp)
+        h = np.asarray(h, dtype=float)
+        innovation = value - h @ self.state
+        innovation_variance = h @ self.covariance @ h + variance
+        gain = self.covariance @ h / innovation_variance
+        self.state = self.state + gain * innovation
+        self.covariance = self.covariance - np.outer(gain, h @ self.covariance)
+
+    def update_vanishing_point(self, value, timestamp, confidence=1.0):
+        """消失点のズレ量を取り込む。confidence (0〜1] が低いほど観測を信用しない。"""
+        if confidence <= 0:
+            return
+        self._update((1.0, 0.0), value, timestamp, self.vp_variance / confidence)
+
+    def update_gravity(self, value, timestamp, confidence=1.0):
+        """重心のズレ量を取り込む。"""
+        if confidence <= 0:
+            return
+        self._update((1.0, 1.0), value, timestamp, self.gravity_variance / confidence)
+
+    def estimate(self, now=None):
+        """(ズレ量, その標準偏差) を返す。now を渡すと、そこまで進めたときの不確かさを返す。"""
+        variance = self.covariance[0, 0]
+        if now is not None and self.time is not None and now > self.time:
+            variance += self.offset_drift * (now - self.time)
+        return float(self.state[0]), float(np.sqrt(variance))
+
+
+def vanishing_point_confidence(result):
+    """操舵結果レコード (STEERING_RESULT_DTYPE) から消失点の信頼度 (0〜1) を求める。"""
+    if result is None or not result['vp_found'] or result['carried_forward']:
+        return 0.0
+    return min(1.0, float(result['num_lines']) / 4.0)
+
+
+def gravity_confidence(result):
+    """重心結果レコード (GRAVITY_RESULT_DTYPE) から信頼度を求める。暗い領域がまとまっているほど高い。"""
+    if result is None or not result['found']:
+        return 0.0
+    half_width = max(float(result['image_width']) / 2, 1.0)
+    return float(np.clip(1.0 - float(result['spread_x']) / half_width, 0.1, 1.0))
@@ -0,0 +1,126 @@
+# ファイル名: vision_records.py
+# (robot_vision_thread_headless.py と同じフォルダに保存してください)
+#
+# 検出スレッドが共有状態 (vision_state.VisionState) に書き込む結果レコードの定義。
+# Python オブジェクトの辞書ではなく、NumPy の構造化配列 (固定レイアウト) にしておくことで、
+# 他のスレッド・プロセスへそのまま (バイト列として) 渡せる。
+# レコードは毎フレーム新しく作り、書き込んだ後は変更しない (読む側はコピー不要)。
+
+import math
+import numpy as np
+
+# 操舵結果に載せる線分の最大本数
+MAX_RESULT_LINES = 16
+
+STEERING_RESULT_DTYPE = np.dtype([
+    ('timestamp', 'f8'),          # フレームを処理した時刻 (time.time())
+    ('frame_id', 'u4'),           # 操舵スレッドが処理したフレームの通し番号
+    ('image_width', 'u2'),        # 座標系の幅 (RESIZE_WIDTH)
+    ('image_height', 'u2'),
+    ('vp_found', 'u1'),           # 消失点が求まったか (0/1)
+    ('carried_forward', 'u1'),    # 締切超過で前回の値を継続しているか (0/1)
+    ('vp_x', 'f4'),               # 消失点の座標 (求まらなければ画像中心)
+    ('vp_y', 'f4'),
+    ('x_difference', 'f4'),       # vp_x - 画像中心 (= steering_value)
+    ('heading_deg', 'f4'),        # パイプ軸の左右方向のずれ角 (右が正)
+    ('pitch_deg', 'f4'),          # パイプ軸の上下方向のずれ角 (上が正)
+    ('left_angle_deg', 'f4'),     # 左の縁 (傾き < 0) の角度の中央値 (線が無ければ NaN)
+    ('right_angle_deg', 'f4'),    # 右の縁 (傾き > 0) の角度の中央値
+    ('num_lines', 'u2'),          # lines に入っている本数
+    ('lines', 'f4', (MAX_RESULT_LINES, 4)), # 消失点の計算に使ったインライアの線分 [x1, y1, x2, y2]
+])
+
+
+def new_steering_result():
+    """空の操舵結果レコード (0次元の構造化配列) を作る。"""
+    return np.zeros((), dtype=STEERING_RESULT_DTYPE)
+
+
+def fill_steering_geometry(record, vp_x, vp_y, vp_found, inlier_segments, inlier_slopes,
+                           width, height, hfov_deg):
+    """
+    消失点とインライアの線分から操舵結果レコードの幾何情報を埋める。
+    heading / pitch はカメラの水平画角 hfov_deg からピンホールモデルで求める。
+    """
+    record['image_width'] = width
+    record['image_height'] = height
+    record['vp_found'] = 1 if vp_found else 0
+    record['vp_x'] = vp_x
+    record['vp_y'] = vp_y
+    record['x_difference'] = vp_x - width / 2
+
+    focal_px = (width / 2) / math.tan(math.radians(hfov_deg) / 2)
+    record['heading_deg'] = math.degrees(math.atan2(vp_x - width / 2, focal_px))
+    record['pitch_deg'] = math.degrees(math.atan2(height / 2 - vp_y, focal_px))
+
+    angles = np.degrees(np.arctan(inlier_slopes)) if len(inlier_slopes) > 0 else np.zeros(0)
+    left = angles[inlier_slopes < 0]
+    right = angles[inlier_slopes > 0]
+    record['left_angle_deg'] = np.median(left) if len(left) > 0 else np.nan
+    record['right_angle_deg'] = np.median(right) if len(right) > 0 else np.nan
+
+    # 長い線分から MAX_RESULT_LINES 本まで載せる
+    if len(inlier_segments) > 0:
+        lengths = np.hypot(inlier_segments[:, 2] - inlier_segments[:, 0],
+                           inlier_segments[:, 3] - inlier_segments[:, 1])
+        kept = inlier_segments[np.argsort(-lengths)[:MAX_RESULT_LINES]]
+        record['lines'][:len(kept)] = kept
+        record['num_lines'] = len(kept)
+    return record
+
+
+GRAVITY_RESULT_DTYPE = np.dtype([
+    ('timestamp', 'f8'),          # フレームを処理した時刻 (time.time())
+    ('frame_id', 'u4'),           # 重心スレッドが処理したフレームの通し番号
+    ('image_width', 'u2'),        # 座標系の幅 (RESIZE_WIDTH。x・y・spread_* はこの幅の座標)
+    ('image_height', 'u2'),
+    ('found', 'u1'),              # 暗い領域が見つかったか (0/1)
+    ('x', 'f4'),                  # 暗い領域の重心 (見つからなければ画像中心)
+    ('y', 'f4'),
+    ('x_difference', 'f4'),       # x - 画像中心 (= gravity_value)
+    ('area', 'f4'),               # 暗い領域の面積 (画像全体に対する割合)
+    ('spread_x', 'f4'),           # 重心まわりの広がり (重み付き標準偏差, ピクセル)
+    ('spread_y', 'f4'),
+    ('threshold', 'f4'),          # 暗いとみなした輝度のしきい値 (しきい値なしなら 255)
+])
+
+
+def new_gravity_result():
+    """空の重心結果レコード (0次元の構造化配列) を作る。"""
+    return np.zeros((), dtype=GRAVITY_RESULT_DTYPE)
+
+
+# 壁イベント (wall_event_filter.WallEventFilter.state() の辞書) を固定レイアウトにしたもの
+# 時刻が無い (None) ときは NaN、側が無いときは -1 を入れる
+WALL_EVENT_DTYPE = np.dtype([
+    ('active', 'u1'),             # 「壁あり」か (0/1)
+    ('confidence', 'f4'),         # 窓の中で壁が見えていた割合 (重み付き)
+    ('first_seen', 'f8'),         # 壁が見え始めた時刻
+    ('confirmed_at', 'f8'),       # 「壁あり」になった時刻
+    ('side', 'i1'),               # 壁を確認した側 (0=右, 1=左, -1=なし)
+])
+
+
+def wall_event_to_record(event):
+    """壁イベントの辞書を WALL_EVENT_DTYPE のレコードにする。"""
+    record = np.zeros((), dtype=WALL_EVENT_DTYPE)
+    record['active'] = 1 if event['active'] else 0
+    record['confidence'] = event['confidence']
+    record['first_seen'] = np.nan if event['first_seen'] is None else event['first_seen']
+    record['confirmed_at'] = np.nan if event['confirmed_at'] is None else event['confirmed_at']
+    record['side'] = -1 if event['side'] is None else event['side']
+    return record
+
+
+def wall_event_from_record(record):
+    """WALL_EVENT_DTYPE のレコードを壁イベントの辞書 (WallEventFilter.state() と同じ形) に戻す。"""
+    first_seen = float(record['first_seen'])
+    confirmed_at = float(record['confirmed_at'])
+    side = int(record['side'])
+    return {
+        'active': bool(record['active']),
+        'confidence': float(record['confidence']),
+        'first_seen': None if math.isnan(first_seen) else first_seen,
+        'confirmed_at': None if math.isnan(confirmed_at) else confirmed_at,
+        'side': None if side < 0 else side,
+    }
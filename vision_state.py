@@ -0,0 +1,122 @@
+# ファイル名: vision_state.py
+# (main_control_thread_serial.py と同じフォルダに保存してください)
+#
+# 検出スレッドとメインループの間で共有する状態 (共有辞書 + 1つの Lock の置き換え)。
+#   - 検出器ごとに1つのスロット (__slots__ で項目を固定したクラス) を持つ
+#   - 各スロットは書き込むスレッドが1つだけなので、書き込みにロックは使わず、
+#     版数 (seqlock) で「書き込み途中の値を読まない」ことだけを保証する
+#         publish(): 版数を奇数にする → 項目を書く → 版数を偶数にする
+#         snapshot(): 版数が偶数で、読む前後で変わっていなければその値を使う (変わっていれば読み直す)
+#   - 停止要求は threading.Event (毎ループの確認にロックが要らない)
+#   - 新しい結果が書き込まれたことは Condition で知らせる (メインループのイベント駆動用)
+
+import threading
+import time
+from collections import namedtuple
+
+
+class StateSlot:
+    """1つの検出器の結果。サブクラスで FIELDS (項目名) と初期値を決める。"""
+
+    __slots__ = ('_seq', '_owner')
+    FIELDS = ()
+    DEFAULTS = ()
+
+    def __init__(self, owner=None):
+        self._seq = 0 # 版数 (奇数なら書き込み中)
+        self._owner = owner # 書き込みを知らせる VisionState
+        for name, value in zip(self.FIELDS, self.DEFAULTS):
+            setattr(self, name, value)
+
+    @property
+    def version(self):
+        """これまでに publish() された回数。"""
+        return self._seq // 2
+
+    def publish(self, **fields):
+        """項目をまとめて書き込む (書き込むスレッドは1つだけであること)。指定しない項目は前の値のまま。"""
+        self._seq += 1
+        for name, value in fields.items():
+            setattr(self, name, value)
+        self._seq += 1
+        if self._owner is not None:
+            self._owner.notify_update()
+
+    def snapshot(self):
+        """全項目が同じ publish() のものであるスナップショット (namedtuple) を返す。"""
+        while True:
+            seq = self._seq
+            if seq & 1:
+                time.sleep(0) # 書き込み中: 書き込むスレッドに譲る
+                continue
+            values = [getattr(self, name) for name in self.FIELDS]
+            if self._seq == seq:
+                return self.Snapshot(seq // 2, *values)
+
+
+def _make_slot(class_name, fields):
+    """項目名と初期値の組から StateSlot のサブクラスを作る。"""
+    names = tuple(name for name, _ in fields)
+    return type(class_name, (StateSlot,), {
+        '__slots__': names,
+        'FIELDS': names,
+        'DEFAULTS': tuple(default for _, default in fields),
+        'Snapshot': namedtuple(class_name + 'Snapshot', ('version',) + names),
+    })
+
+
+# 操舵 (消失点): value はズレ量、result は vision_records.STEERING_RESULT_DTYPE のレコード
+SteeringSlot = _make_slot('SteeringSlot', (('value', 0.0), ('result', None), ('carried_forward', False)))
+# 壁: detected は1回の検出結果 (0/1)、event は wall_event_filter.WallEventFilter.state()
+WallSlot = _make_slot('WallSlot', (('detected', 0), ('event', None), ('carried_forward', False)))
+# 重心: value はズレ量、result は vision_records.GRAVITY_RESULT_DTYPE のレコード
+GravitySlot = _make_slot('GravitySlot', (('value', 0.0), ('result', None)))
+
+
+class VisionState:
+    """検出スレッドとメインループで共有する状態。"""
+
+    __slots__ = ('steering', 'wall', 'gravity', 'stop_event',
+                 'steering_target_fps', 'wall_target_fps', 'gravity_target_fps',
+                 '_update_condition', '_update_seq')
+
+    def __init__(self):
+        self.steering = SteeringSlot(self)
+        self.wall = WallSlot(self)
+        self.gravity = GravitySlot(self)
+        self.stop_event = threading.Event()
+        # メイン側 (detector_rates.DetectorRateScheduler など) から処理レートを指定する場合 (FPS)
+        # None なら各スレッドの TARGET_FPS
+        self.steering_target_fps = None
+        self.wall_target_fps = None
+        self.gravity_target_fps = None
+        self._update_condition = threading.Condition()
+        self._update_seq = 0
+
+    def request_stop(self):
+        """全スレッドに停止を要求し、待っているメインループを起こす。"""
+        self.stop_event.set()
+        self.notify_update()
+
+    def should_stop(self):
+        return self.stop_event.is_set()
+
+    def notify_update(self):
+        """いずれかのスロットが書き込まれたことを知らせる。"""
+        with self._update_condition:
+            self._update_seq += 1
+            self._update_condition.notify_all()
+
+    def wait_for_update(self, last_seq, timeout):
+        """
+        last_seq 以降に書き込みがある (または停止要求がある) まで最大 timeout 秒待つ。
+        戻り値: 現在の更新番号 (次の呼び出しの last_seq に渡す)
+        """
+        with self._update_condition:
+            self._update_condition.wait_for(
+                lambda: self._update_seq != last_seq or self.stop_event.is_set(), timeout=timeout)
+            return self._update_seq
+
+    def snapshot(self):
+        """(操舵, 壁, 重心) のスナップショットをまとめて返す。各スロットの中の項目は互いに一貫している。"""
+        return self.steering.snapshot(), self.wall.snapshot(), self.gravity.snapshot()
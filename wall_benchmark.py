@@ -0,0 +1,141 @@
+# ファイル名: wall_benchmark.py
+# 壁検出の事前チェック (列プロファイル) の評価用スクリプト
+#
+# 録画した360度カメラの動画を読み込み、各フレームの左右それぞれについて
+#   - 従来の検出 (CLAHE → ぼかし → 線分検出) の結果 (= 正解とみなす)
+#   - 事前チェックのスコア (wall_detection.column_gradient_score)
+# を求め、しきい値ごとに
+#   - 再現率: 従来の検出で壁ありだった側のうち、事前チェックを通過した割合
+#   - スキップ率: 事前チェックで落とされ、線分検出を省略できた割合
+# と処理時間を表示する。robot_vision_thread_headless.WALL_PRECHECK_THRESHOLD を決めるのに使う。
+# あわせて、確認の段階を列投影 (ColumnProjectionWallDetector) にした場合の
+# 処理時間と従来の検出との一致率も表示する (WALL_DETECTOR_BACKEND を決めるのに使う)。
+#
+# 使い方: python wall_benchmark.py <動画ファイル> [<動画ファイル> ...]
+
+import sys
+import time
+import cv2
+import numpy as np
+from line_detectors import create_line_detector
+from wall_detection import (WallFragmentDetector, ColumnProjectionWallDetector,
+                            split_wall_frame, column_gradient_score)
+
+# --- パラメータ (robot_vision_thread_headless.wall_thread_func と同じ値) ---
+RESIZE_WIDTH = 240
+CANNY_THRESHOLD1 = 90
+CANNY_THRESHOLD2 = 150
+HOUGH_THRESHOLD = 30
+HOUGH_MIN_LINE_LENGTH = 30
+HOUGH_MAX_LINE_GAP = 10
+CLIP_LIMIT = 15.0
+TILE_GRID_SIZE = (12, 12)
+WALL_LINE_BACKEND = 'HOUGH'
+
+# 評価するしきい値
+THRESHOLDS_TO_TEST = [1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 8.0, 10.0, 15.0]
+# 何フレームごとに評価するか (1なら全フレーム)
+FRAME_STEP = 1
+
+
+def make_fragment_detector(backend='LINES'):
+    if backend == 'COLUMN':
+        return ColumnProjectionWallDetector(resize_width=RESIZE_WIDTH,
+                                            clip_limit=CLIP_LIMIT, tile_grid_size=TILE_GRID_SIZE,
+                                            edge_threshold=CANNY_THRESHOLD2,
+                                            min_line_length=HOUGH_MIN_LINE_LENGTH,
+                                            max_line_gap=HOUGH_MAX_LINE_GAP)
+    line_detector = create_line_detector(WALL_LINE_BACKEND,
+                                         canny_threshold1=CANNY_THRESHOLD1,
+                                         canny_threshold2=CANNY_THRESHOLD2,
+                                         hough_threshold=HOUGH_THRESHOLD,
+                                         min_line_length=HOUGH_MIN_LINE_LENGTH,
+                                         max_line_gap=HOUGH_MAX_LINE_GAP)
+    return WallFragmentDetector(line_detector, resize_width=RESIZE_WIDTH,
+                                clip_limit=CLIP_LIMIT, tile_grid_size=TILE_GRID_SIZE)
+
+
+def collect_samples(video_paths, fragment_detector, column_detector):
+    """
+    各フラグメントについて (従来の検出結果, 事前チェックのスコア, 事前チェック時間, 確認時間,
+    列投影の検出結果, 列投影の確認時間) を集める。
+    """
+    samples = []
+    for video_path in video_paths:
+        cap = cv2.VideoCapture(video_path)
+        if not cap.isOpened():
+            print(f"エラー: 動画ファイル '{video_path}' を開けません。")
+            continue
+        frame_index = 0
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            if frame_index % FRAME_STEP == 0:
+                for i, img_fragment in enumerate(split_wall_frame(frame)):
+                    is_right_image = (i == 0)
+                    gray = fragment_detector.preprocess(img_fragment)
+                    start = time.perf_counter()
+                    score = column_gradient_score(gray, is_right_image)
+                    precheck_time = time.perf_counter() - start
+                    start = time.perf_counter()
+                    detected = fragment_detector.confirm(gray, is_right_image)
+                    confirm_time = time.perf_counter() - start
+                    start = time.perf_counter()
+                    column_detected = column_detector.confirm(gray, is_right_image)
+                    column_time = time.perf_counter() - start
+                    samples.append((detected, score, precheck_time, confirm_time,
+                                    column_detected, column_time))
+            frame_index += 1
+        cap.release()
+    return samples
+
+
+def main():
+    video_paths = sys.argv[1:]
+    if not video_paths:
+        print("使い方: python wall_benchmark.py <動画ファイル> [<動画ファイル> ...]")
+        return
+
+    samples = collect_samples(video_paths, make_fragment_detector('LINES'), make_fragment_detector('COLUMN'))
+    if not samples:
+        print("エラー: 評価できるフレームがありません。")
+        return
+
+    detected = np.array([s[0] for s in samples])
+    scores = np.array([s[1] for s in samples])
+    precheck_ms = np.array([s[2] for s in samples]) * 1000
+    confirm_ms = np.array([s[3] for s in samples]) * 1000
+    column_detected = np.array([s[4] for s in samples])
+    column_ms = np.array([s[5] for s in samples]) * 1000
+
+    print(f"評価フラグメント数: {len(samples)} (壁あり: {np.count_nonzero(detected)})")
+    print(f"処理時間 (平均): 事前チェック {precheck_ms.mean():.3f} ms / 線分検出による確認 {confirm_ms.mean():.3f} ms")
+    print("-" * 70)
+    print(f"{'しきい値':>8} {'再現率':>10} {'スキップ率':>10} {'見逃し数':>8} {'推定平均時間[ms]':>16}")
+    print("-" * 70)
+    for threshold in THRESHOLDS_TO_TEST:
+        passed = scores >= threshold
+        recall = np.mean(passed[detected]) * 100 if np.any(detected) else float('nan')
+        skip_rate = np.mean(~passed) * 100
+        missed = np.count_nonzero(detected & ~passed)
+        cascade_ms = precheck_ms.mean() + np.mean(np.where(passed, confirm_ms, 0.0))
+        print(f"{threshold:>8.1f} {recall:>9.1f}% {skip_rate:>9.1f}% {missed:>8d} {cascade_ms:>16.3f}")
+    print("-" * 70)
+    print(f"(カスケードなしの平均時間: {confirm_ms.mean():.3f} ms)")
+
+    # --- 確認の段階: 線分検出 (WALL_LINE_BACKEND) と列投影の比較 ---
+    print()
+    print(f"{'確認の方式':<12} {'平均[ms]':>10} {'p95[ms]':>10} {'壁あり':>8} {'一致率':>8}")
+    print("-" * 70)
+    print(f"{WALL_LINE_BACKEND:<12} {confirm_ms.mean():>10.3f} {np.percentile(confirm_ms, 95):>10.3f} "
+          f"{np.count_nonzero(detected):>8d} {'(基準)':>8}")
+    agreement = np.mean(column_detected == detected) * 100
+    print(f"{'COLUMN':<12} {column_ms.mean():>10.3f} {np.percentile(column_ms, 95):>10.3f} "
+          f"{np.count_nonzero(column_detected):>8d} {agreement:>7.1f}%")
+    print(f"(COLUMN のみ壁あり: {np.count_nonzero(column_detected & ~detected)}, "
+          f"{WALL_LINE_BACKEND} のみ壁あり: {np.count_nonzero(detected & ~column_detected)})")
+
+
+if __name__ == '__main__':
+    main()
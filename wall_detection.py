@@ -0,0 +1,327 @@
+# ファイル名: wall_detection.py
+# (robot_vision_thread_headless.py と同じフォルダに保存してください)
+#
+# 360度カメラの片側 (右=上半分 / 左=下半分) の画像から壁 (内側のほぼ垂直な線) を検出する処理。
+# 2段階のカスケードになっている:
+#   1. 事前チェック: Sobel-x の絶対値を列ごとに合計した「列プロファイル」を内側半分だけで求め、
+#      ピークがしきい値を超えたときだけ候補とする (ベクトル化されていて非常に軽い)
+#   2. 確認: 従来どおり CLAHE → ぼかし → 線分検出 (HoughLinesP など) で内側の垂直線を探す
+# 事前チェックの再現率は wall_benchmark.py で録画データに対して確認する。
+#
+# ParallelWallDetector は右と左を常駐のワーカースレッド2本で同時に処理する
+# (OpenCV の処理中は GIL が解放されるため、1回の処理時間は2枚の合計ではなく遅い方に近くなる)。
+# 片側で壁が確認できた時点でもう片側は打ち切る。
+#
+# ColumnProjectionWallDetector は確認の段階で線分検出を使わない代わりの実装。
+# 縦エッジの画素 (|Sobel-x| が強く |Sobel-y| が弱い) を列ごとに数え、数が足りる列だけ
+# 縦方向の連続長 (ランレングス) を NumPy で求めて、十分長い縦線があるかを判定する。
+#
+# WallStripWatcher は全体の検出の合間にカメラのフレームレートで動く見張り役。
+# 左右それぞれ、壁の線が最初に現れる細い縦帯だけを間引いて列プロファイルを求め、
+# ピークが立ったら全体の検出を次の周期を待たずにすぐ実行させる。
+
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import cv2
+import numpy as np
+from line_detectors import select_vertical_segments
+from frame_deadline import FrameDeadline, DeadlineExceeded
+
+# 列プロファイルを平滑化する幅 (少し傾いた垂直線は数列にまたがるため)
+PROFILE_SMOOTHING_COLUMNS = 5
+
+
+def split_wall_frame(frame):
+    """360度カメラのフレームを (右=上半分, 左=下半分) に分割する。"""
+    half_height = frame.shape[0] // 2
+    return frame[0:half_height, :], frame[half_height:, :]
+
+
+def inner_column_range(width, is_right_image):
+    """壁を探す内側の列範囲 (右画像は中心より右、左画像は中心より左) を返す。"""
+    center = width // 2
+    return (center, width) if is_right_image else (0, center)
+
+
+def column_gradient_profile(gray, is_right_image):
+    """
+    内側半分について、列ごとの縦エッジの強さ (Sobel-x の絶対値の列平均) を返す。
+    戻り値: (profile, x_offset) profile[i] は列 x_offset + i の値
+    """
+    x0, x1 = inner_column_range(gray.shape[1], is_right_image)
+    return column_range_profile(gray, x0, x1), x0
+
+
+def column_range_profile(gray, x0, x1, smoothing_columns=PROFILE_SMOOTHING_COLUMNS):
+    """列 x0 〜 x1 について、列ごとの縦エッジの強さ (Sobel-x の絶対値の列平均) を返す。"""
+    # Sobel の境界の影響を避けるため1列だけ余分に取る
+    sx0, sx1 = max(0, x0 - 1), min(gray.shape[1], x1 + 1)
+    gradient = cv2.Sobel(gray[:, sx0:sx1], cv2.CV_16S, 1, 0, ksize=3)
+    gradient = cv2.convertScaleAbs(gradient, alpha=1.0 / 8) # 3x3 Sobel の係数分を正規化
+    column_sum = cv2.reduce(gradient, 0, cv2.REDUCE_SUM, dtype=cv2.CV_32S).ravel()
+    profile = column_sum[x0 - sx0:x0 - sx0 + (x1 - x0)].astype(np.float32) / gray.shape[0]
+    if smoothing_columns > 1 and len(profile) >= smoothing_columns:
+        kernel = np.ones(smoothing_columns, dtype=np.float32) / smoothing_columns
+        profile = np.convolve(profile, kernel, mode='same')
+    return profile
+
+
+def column_gradient_score(gray, is_right_image):
+    """列プロファイルのピークが背景 (中央値) からどれだけ突出しているかを返す。"""
+    profile, _ = column_gradient_profile(gray, is_right_image)
+    if len(profile) == 0:
+        return 0.0
+    return float(profile.max() - np.median(profile))
+
+
+class WallFragmentDetector:
+    """
+    片側の画像1枚について壁の有無を判定する。
+    precheck_threshold が None なら事前チェックを行わず、常に線分検出で確認する。
+    """
+
+    def __init__(self, line_detector, resize_width=240, clip_limit=15.0,
+                 tile_grid_size=(12, 12), precheck_threshold=None):
+        self.line_detector = line_detector
+        self.resize_width = resize_width
+        self.clahe = cv2.createCLAHE(clipLimit=clip_limit, tileGridSize=tile_grid_size)
+        self.precheck_threshold = precheck_threshold
+        self.last_score = 0.0 # 直近の事前チェックのスコア
+        self.last_evidence = None # 直近に壁と判定した線の (長さ/画像の高さ, 中心x/画像の幅)
+
+    def preprocess(self, img_fragment):
+        """リサイズしてグレースケールにする。"""
+        orig_h_frag, orig_w_frag = img_fragment.shape[:2]
+        if orig_h_frag == 0 or orig_w_frag == 0:
+            raise ValueError("Fragment is empty")
+        resize_height = int(self.resize_width * orig_h_frag / orig_w_frag)
+        resized_frame = cv2.resize(img_fragment, (self.resize_width, resize_height), interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(resized_frame, cv2.COLOR_BGR2GRAY)
+
+    def precheck(self, gray, is_right_image):
+        """事前チェック。候補なら True を返す (事前チェック無効なら常に True)。"""
+        if self.precheck_threshold is None:
+            return True
+        self.last_score = column_gradient_score(gray, is_right_image)
+        return self.last_score >= self.precheck_threshold
+
+    def confirm(self, gray, is_right_image, deadline=None, cancel_event=None):
+        """
+        CLAHE → ぼかし → 線分検出で、内側にほぼ垂直な線があるかを確認する。
+        cancel_event がセットされていれば (もう片側で壁が見つかった) 線分検出の前に打ち切って False を返す。
+        """
+        adjusted = self.clahe.apply(gray)
+        blurred_again = cv2.GaussianBlur(adjusted, (7, 7), 0)
+        if deadline is not None:
+            deadline.check('preprocess')
+        if cancel_event is not None and cancel_event.is_set():
+            return False
+        segments = self.line_detector.detect(blurred_again, deadline)
+        if deadline is not None:
+            deadline.check('lines')
+        vertical_segments = select_vertical_segments(segments)
+        if len(vertical_segments) == 0:
+            return False
+        image_center_x = gray.shape[1] / 2 # イメージ中心
+        line_center_x = (vertical_segments[:, 0] + vertical_segments[:, 2]) / 2
+        if is_right_image:
+            inner = line_center_x > image_center_x
+        else:
+            inner = line_center_x < image_center_x
+        if not np.any(inner):
+            return False
+        # 内側で最も長い線を根拠として残す (wall_event_filter で重み付けに使う)
+        inner_segments = vertical_segments[inner]
+        lengths = np.hypot(inner_segments[:, 2] - inner_segments[:, 0], inner_segments[:, 3] - inner_segments[:, 1])
+        longest = int(np.argmax(lengths))
+        self.last_evidence = (float(lengths[longest]) / gray.shape[0],
+                              float(line_center_x[inner][longest]) / gray.shape[1])
+        return True
+
+    def detect(self, img_fragment, is_right_image, deadline=None, cancel_event=None):
+        """片側の画像に壁があれば True を返す。"""
+        self.last_evidence = None
+        gray = self.preprocess(img_fragment)
+        if not self.precheck(gray, is_right_image):
+            return False
+        if cancel_event is not None and cancel_event.is_set():
+            return False
+        return self.confirm(gray, is_right_image, deadline, cancel_event)
+
+
+class ColumnProjectionWallDetector(WallFragmentDetector):
+    """
+    線分検出の代わりに、列ごとの縦エッジの投影と縦方向の連続長で垂直線を探す。
+    edge_threshold: 縦エッジとみなす |Sobel-x| のしきい値
+    min_line_length: 垂直線とみなす連続長 (ピクセル, HoughLinesP の minLineLength に相当)
+    max_line_gap: 連続とみなす途切れの長さ (ピクセル, maxLineGap に相当)
+    tilt_columns: 少し傾いた線を拾うため、横方向にまとめる列数 (80〜100度の線に対応)
+    """
+
+    def __init__(self, resize_width=240, clip_limit=15.0, tile_grid_size=(12, 12),
+                 precheck_threshold=None, edge_threshold=150, min_line_length=30,
+                 max_line_gap=10, tilt_columns=5):
+        super().__init__(None, resize_width=resize_width, clip_limit=clip_limit,
+                         tile_grid_size=tile_grid_size, precheck_threshold=precheck_threshold)
+        self.edge_threshold = edge_threshold
+        self.min_line_length = min_line_length
+        self.tilt_kernel = np.ones((1, tilt_columns), dtype=np.uint8)
+        self.gap_kernel = np.ones((max_line_gap + 1, 1), dtype=np.uint8)
+
+    def vertical_edge_mask(self, blurred, x0, x1):
+        """内側の列 x0 〜 x1 について、縦エッジの画素を 1 にしたマスクを返す。"""
+        sx0, sx1 = max(0, x0 - 1), min(blurred.shape[1], x1 + 1)
+        region = blurred[:, sx0:sx1]
+        gx = np.abs(cv2.Sobel(region, cv2.CV_16S, 1, 0, ksize=3)).astype(np.int32)
+        gy = np.abs(cv2.Sobel(region, cv2.CV_16S, 0, 1, ksize=3)).astype(np.int32)
+        mask = ((gx >= self.edge_threshold) & (2 * gy <= gx)).astype(np.uint8)
+        mask = cv2.dilate(mask, self.tilt_kernel) # 傾いた線を同じ列にまとめる
+        mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, self.gap_kernel) # 短い途切れをつなぐ
+        return mask[:, x0 - sx0:x0 - sx0 + (x1 - x0)]
+
+    def longest_vertical_run(self, mask):
+        """
+        各列の縦方向の最長連続長を求め、(最長の長さ, その列) を返す。
+        列ごとの画素数 (投影) が min_line_length 未満の列はランレングスを求めずに除く。
+        """
+        column_counts = mask.sum(axis=0)
+        candidates = np.flatnonzero(column_counts >= self.min_line_length)
+        if len(candidates) == 0:
+            return 0, None
+        columns = mask[:, candidates].T.astype(np.int8) # (候補の列, 高さ)
+        padded = np.zeros((columns.shape[0], columns.shape[1] + 2), dtype=np.int8)
+        padded[:, 1:-1] = columns
+        diff = np.diff(padded, axis=1)
+        start_rows, start_cols = np.nonzero(diff == 1)
+        _, end_cols = np.nonzero(diff == -1)
+        lengths = end_cols - start_cols # 行優先で並ぶので、始点と終点は順に対応する
+        longest = int(np.argmax(lengths))
+        return int(lengths[longest]), int(candidates[start_rows[longest]])
+
+    def confirm(self, gray, is_right_image, deadline=None, cancel_event=None):
+        """CLAHE → ぼかし → 列投影と連続長で、内側にほぼ垂直な線があるかを確認する。"""
+        adjusted = self.clahe.apply(gray)
+        blurred_again = cv2.GaussianBlur(adjusted, (7, 7), 0)
+        if deadline is not None:
+            deadline.check('preprocess')
+        if cancel_event is not None and cancel_event.is_set():
+            return False
+        x0, x1 = inner_column_range(gray.shape[1], is_right_image)
+        run_length, column = self.longest_vertical_run(self.vertical_edge_mask(blurred_again, x0, x1))
+        if deadline is not None:
+            deadline.check('lines')
+        if run_length < self.min_line_length:
+            return False
+        self.last_evidence = (run_length / float(gray.shape[0]), (x0 + column) / float(gray.shape[1]))
+        return True
+
+
+class ParallelWallDetector:
+    """
+    右と左の画像を常駐のワーカースレッドで同時に処理する。
+    WallFragmentDetector と FrameDeadline はスレッドセーフではないため、側ごとに1つずつ持つ。
+    make_fragment_detector: WallFragmentDetector を作る関数 (側ごとに呼ばれる)
+    """
+
+    def __init__(self, make_fragment_detector, budget_sec):
+        self.fragment_detectors = [make_fragment_detector() for _ in range(2)]
+        self.deadlines = [FrameDeadline(budget_sec) for _ in range(2)]
+        self.executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='wall_fragment')
+        self.cancel_event = threading.Event()
+        self.pending = [] # 打ち切り指示を出したまま、まだ終わっていない前回のワーカー
+        self.last_side = None # 直近に壁を確認した側 (0=右, 1=左)
+        self.last_evidence = None # その側の WallFragmentDetector.last_evidence
+        self.last_all_failed = False # 直近の detect() で、処理した側がすべて例外で終わったか
+
+    def _detect_fragment(self, i, img_fragment):
+        detected = self.fragment_detectors[i].detect(img_fragment, i == 0, self.deadlines[i], self.cancel_event)
+        if detected:
+            self.cancel_event.set() # もう片側は打ち切る
+        return detected
+
+    def detect(self, fragments):
+        """
+        (右, 左) の画像を同時に処理する。None の側は処理しない。
+        戻り値: (壁の有無 0/1, 締切超過の例外 or None)
+        どちらかで壁が確認できれば、もう片側の終了を待たずに返す。
+        処理した側がすべて例外で終わったときは last_all_failed を True にする (壁なしの結果として扱わないため)。
+        """
+        # 前回打ち切った側がまだ動いていれば、検出器を共有しないよう終わるのを待つ
+        if self.pending:
+            wait(self.pending)
+            self.pending = []
+        self.cancel_event.clear()
+
+        futures = {} # future -> 側 (0=右, 1=左)
+        for i, img_fragment in enumerate(fragments):
+            if img_fragment is None:
+                continue # 深度などですでに判定済みの側
+            self.deadlines[i].begin()
+            futures[self.executor.submit(self._detect_fragment, i, img_fragment)] = i
+
+        wall_line_detected = 0
+        frame_abandoned = None
+        failures = 0 # 締切超過以外の例外で終わった側の数
+        self.last_side = None
+        self.last_evidence = None
+        not_done = set(futures)
+        while not_done:
+            done, not_done = wait(not_done, return_when=FIRST_COMPLETED)
+            for future in done:
+                error = future.exception()
+                if isinstance(error, DeadlineExceeded):
+                    frame_abandoned = error
+                elif error is not None:
+                    failures += 1
+                    print(f"[壁検出スレッド] Fragment処理エラー: {error}")
+                elif future.result():
+                    wall_line_detected = 1
+                    self.last_side = futures[future]
+                    self.last_evidence = self.fragment_detectors[self.last_side].last_evidence
+            if wall_line_detected:
+                self.pending = list(not_done)
+                break
+        self.last_all_failed = bool(futures) and failures == len(futures)
+        return wall_line_detected, frame_abandoned
+
+    def shutdown(self):
+        self.cancel_event.set()
+        self.executor.shutdown(wait=True)
+
+
+class WallStripWatcher:
+    """
+    左右の細い縦帯だけを見て、壁の線が現れたかを安く判定する。
+    strip_range: 右画像での帯の範囲 (幅に対する割合)。左画像は中心に対して左右反転した範囲を見る。
+    downscale: 帯を間引く間隔 (ピクセル)。リサイズせずにスライスで間引く。
+    """
+
+    def __init__(self, strip_range=(0.50, 0.62), downscale=4, threshold=5.0):
+        self.strip_range = strip_range
+        self.downscale = downscale
+        self.threshold = threshold
+        self.last_scores = (0.0, 0.0) # 直近の (右, 左) のスコア
+
+    def strip_columns(self, width, is_right_image):
+        """帯の列範囲 (x0, x1) を返す。"""
+        start, end = self.strip_range
+        if not is_right_image:
+            start, end = 1.0 - end, 1.0 - start
+        x0 = int(width * start)
+        return x0, max(x0 + 1, int(width * end))
+
+    def strip_score(self, img_fragment, is_right_image):
+        x0, x1 = self.strip_columns(img_fragment.shape[1], is_right_image)
+        strip = np.ascontiguousarray(img_fragment[::self.downscale, x0:x1:self.downscale])
+        if strip.ndim == 3:
+            strip = cv2.cvtColor(strip, cv2.COLOR_BGR2GRAY)
+        profile = column_range_profile(strip, 0, strip.shape[1], smoothing_columns=1)
+        if len(profile) == 0:
+            return 0.0
+        return float(profile.max() - np.median(profile))
+
+    def check(self, fragments):
+        """(右, 左) の画像のどちらかの帯にしきい値を超える縦エッジがあれば True を返す。"""
+        self.last_scores = tuple(self.strip_score(img_fragment, i == 0)
+                                 for i, img_fragment in enumerate(fragments))
+        return max(self.last_scores) >= self.threshold
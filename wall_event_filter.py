@@ -0,0 +1,98 @@
+# ファイル名: wall_event_filter.py
+# (robot_vision_thread_headless.py と同じフォルダに保存してください)
+#
+# 壁検出の結果を時間方向にまとめ、1フレームだけの誤検出で停止しないようにするフィルタ。
+#   - 直近 M フレームのうち N フレーム (重み付きなら重みの合計が N) 以上で壁があれば「壁あり」にする
+#   - 重み付きモードでは、線が短いほど、また前のフレームと線の位置がずれているほど重みを下げる
+#   - いったん「壁あり」になったら、重みの合計が release_score 以下に下がるまで維持する (ヒステリシス)
+# 「壁あり」になった時点で、信頼度と最初に見えた時刻を持つイベント (辞書) を返す。
+
+from collections import deque
+
+
+class WallEventFilter:
+    """
+    壁検出の N-of-M フィルタ。
+    required_count: 「壁あり」にするのに必要なフレーム数 (重みの合計) N
+    window_size: 見るフレーム数 M
+    release_score: 「壁あり」を解除する重みの合計 (これ以下で解除)
+    weighted: True なら線の長さと位置の一貫性で重みを付ける
+    reference_length: 重み1になる線の長さ (画像の高さに対する割合)
+    position_tolerance: 前のフレームと同じ線とみなす中心xのずれ (画像の幅に対する割合)
+    """
+
+    def __init__(self, required_count=3, window_size=5, release_score=0.0, weighted=True,
+                 reference_length=0.3, position_tolerance=0.05):
+        self.required_count = required_count
+        self.window_size = window_size
+        self.release_score = release_score
+        self.weighted = weighted
+        self.reference_length = reference_length
+        self.position_tolerance = position_tolerance
+        self.history = deque(maxlen=window_size) # [(時刻, 重み, 側, 中心x), ...]
+        self.active = False
+        self.first_seen = None # 壁が見え始めた時刻 (窓の中で連続して見えている最初のフレーム)
+        self.confirmed_at = None
+        # 効果の確認用の回数
+        self.raw_event_count = 0 # フィルタなしで停止していた回数 (生の検出の立ち上がり)
+        self.confirmed_event_count = 0 # フィルタ後の停止回数
+        self._last_raw = False
+
+    def weight(self, side, evidence):
+        """1フレーム分の検出の重み (0〜1) を返す。"""
+        if not self.weighted or evidence is None:
+            return 1.0
+        length_ratio, center_x = evidence
+        weight = min(1.0, length_ratio / self.reference_length)
+        # 同じ側の直前の検出と位置がずれていれば半分にする
+        for _, previous_weight, previous_side, previous_x in reversed(self.history):
+            if previous_weight > 0 and previous_side == side:
+                if abs(center_x - previous_x) > self.position_tolerance:
+                    weight *= 0.5
+                break
+        return weight
+
+    def update(self, timestamp, detected, side=None, evidence=None):
+        """
+        1フレーム分の検出結果を追加する。
+        side: 壁を確認した側 (0=右, 1=左)
+        evidence: WallFragmentDetector.last_evidence (線の長さ/高さ, 中心x/幅)
+        戻り値: 現在のイベントの辞書 (state() と同じ)
+        """
+        if detected:
+            weight = self.weight(side, evidence)
+            center_x = evidence[1] if evidence is not None else None
+        else:
+            weight, center_x = 0.0, None
+        if detected and not self._last_raw:
+            self.raw_event_count += 1
+        self._last_raw = bool(detected)
+
+        if weight > 0 and (not self.history or all(w == 0 for _, w, _, _ in self.history)):
+            self.first_seen = timestamp
+        self.history.append((timestamp, weight, side, center_x))
+
+        score = self.score()
+        if not self.active and score >= self.required_count:
+            self.active = True
+            self.confirmed_at = timestamp
+            self.confirmed_event_count += 1
+        elif self.active and score <= self.release_score:
+            self.active = False
+        if score == 0:
+            self.first_seen = None
+        return self.state()
+
+    def score(self):
+        return sum(w for _, w, _, _ in self.history)
+
+    def state(self):
+        """共有状態に書き込むイベント。毎回新しい辞書を作るので、読む側はコピー不要。"""
+        last_side = next((s for _, w, s, _ in reversed(self.history) if w > 0), None)
+        return {
+            'active': self.active,
+            'confidence': self.score() / self.window_size, # 窓の中で壁が見えていた割合 (重み付き)
+            'first_seen': self.first_seen,
+            'confirmed_at': self.confirmed_at if self.active else None,
+            'side': last_side,
+        }
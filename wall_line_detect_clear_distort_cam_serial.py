@@ -6,6 +6,7 @@ import sys
 from clear_distortion import ImageUndistortion
 import serial
 import time
+from line_detectors import create_line_detector
 
 # --- パラメータ設定 ---
 # Cannyエッジ検出の低閾値　数字を小さくするとエッジを多く拾える
@@ -29,6 +30,17 @@ ENABLE_SERIAL_COMMUNICATION = True
 CAMERA_INDEX = 0
 
 
+# 線分検出バックエンド ('HOUGH' / 'LSD' / 'FLD')
+LINE_BACKEND = 'HOUGH'
+
+line_detector = create_line_detector(LINE_BACKEND,
+                                     canny_threshold1=CANNY_THRESHOLD1,
+                                     canny_threshold2=CANNY_THRESHOLD2,
+                                     hough_threshold=HOUGH_THRESHOLD,
+                                     min_line_length=HOUGH_MIN_LINE_LENGTH,
+                                     max_line_gap=HOUGH_MAX_LINE_GAP)
+
+
 # --- 動画ファイルがあるフォルダのパスを指定 ---
 VIDEO_FOLDER_PATH = "/Users/shigemitsuhiroki/vscode/sewage_movie/left_side_movie"
 
@@ -53,14 +65,8 @@ def process_frame(frame,undistorter):
     adjusted = clahe.apply(blurred)
     blurred_again = cv2.GaussianBlur(adjusted, (7, 7), 0)
 
-    # --- 3. Cannyエッジ検出 ---
-    edges = cv2.Canny(blurred_again, CANNY_THRESHOLD1, CANNY_THRESHOLD2)
-
-    # --- 4. 確率的ハフ変換 ---
-    lines = cv2.HoughLinesP(edges, 1, np.pi / 180,
-                            threshold=HOUGH_THRESHOLD,
-                            minLineLength=HOUGH_MIN_LINE_LENGTH,
-                            maxLineGap=HOUGH_MAX_LINE_GAP)
+    # --- 3〜4. 線分検出 (HOUGH の場合は Canny + 確率的ハフ変換) ---
+    segments = line_detector.detect(blurred_again)
 
     # --- ▼▼▼【修正点】描画処理のロジックを修正 ▼▼▼ ---
     # 描画用のカラー画像とカウンターを初期化
@@ -68,10 +74,9 @@ def process_frame(frame,undistorter):
     drawn_lines_count = 0
 
     # --- 5. 線の描画 ---
-    if lines is not None:
+    if len(segments) > 0:
         # 検出した全ての線に対してループ処理を行う
-        for line in lines:
-            x1, y1, x2, y2 = line[0]
+        for x1, y1, x2, y2 in segments.astype(int):
 
             angle_deg = math.degrees(math.atan2(y2 - y1, x2 - x1))
             abs_angle_deg = abs(angle_deg)
@@ -103,7 +108,9 @@ def process_frame(frame,undistorter):
     # --- ▲▲▲【修正点】ここまで ▲▲▲ ---
 
     # --- 6. 表示用に画像を結合 ---
-    edges_colored = cv2.cvtColor(edges, cv2.COLOR_GRAY2BGR)
+    # (エッジ画像を作らないバックエンドは前処理画像を表示)
+    edge_view = line_detector.edges if line_detector.edges is not None else blurred_again
+    edges_colored = cv2.cvtColor(edge_view, cv2.COLOR_GRAY2BGR)
     
     # 高さが違う場合のみパディング（念のため）
     h1, w1 = line_image.shape[:2]